@@ -7,11 +7,78 @@ APP_ICON = "😴"
 # Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH  = os.path.join(BASE_DIR, 'models/random_forest_model.joblib')
-DATA_PATH   = os.path.join(BASE_DIR, 'data/sleep_features_labels_core.csv')
-UPLOADS_DIR = os.path.join(BASE_DIR, 'uploads')
-DB_PATH     = os.path.join(BASE_DIR, 'users.db')
+STAGING_MODEL_PATH = os.path.join(BASE_DIR, 'models/sleep_staging_model.joblib')
+DATA_PATH   = os.environ.get('INSOMNIAID_DATA_PATH', os.path.join(BASE_DIR, 'data/sleep_features_labels_core.csv'))
+UPLOADS_DIR = os.environ.get('INSOMNIAID_UPLOADS_DIR', os.path.join(BASE_DIR, 'uploads'))
+DB_PATH     = os.environ.get('INSOMNIAID_DB_PATH', os.path.join(BASE_DIR, 'users.db'))
+
+SPOOL_DIR   = os.path.join(UPLOADS_DIR, 'spool')
+STORAGE_INDEX_PATH = os.path.join(UPLOADS_DIR, 'storage_index.db')
+# Per-analysis epoch matrices kept for re-scoring (outside UPLOADS_DIR, with their own limits below)
+EPOCH_CACHE_DIR = os.environ.get('INSOMNIAID_EPOCH_CACHE_DIR', os.path.join(BASE_DIR, 'epoch_cache'))
 
 os.makedirs(UPLOADS_DIR, exist_ok=True)
+os.makedirs(SPOOL_DIR, exist_ok=True)
+os.makedirs(EPOCH_CACHE_DIR, exist_ok=True)
+
+# Uploads (the in-memory upload itself is capped by server.maxUploadSize in
+# .streamlit/config.toml; MAX_UPLOAD_BYTES caps the decompressed file on disk)
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get('INSOMNIAID_MAX_UPLOAD_BYTES', 4 * 1024 ** 3))
+
+# Artifact storage in UPLOADS_DIR (live spools count towards the quota)
+STORAGE_QUOTA_BYTES = int(os.environ.get('INSOMNIAID_STORAGE_QUOTA_BYTES', 5 * 1024 ** 3))
+STORAGE_TTL_SEC = int(os.environ.get('INSOMNIAID_STORAGE_TTL_SEC', 7 * 24 * 3600))
+STORAGE_CLEANUP_INTERVAL_SEC = 300
+# Epoch cache: entries older than the TTL are dropped, then the oldest ones down to the quota
+EPOCH_CACHE_QUOTA_BYTES = int(os.environ.get('INSOMNIAID_EPOCH_CACHE_QUOTA_BYTES', 2 * 1024 ** 3))
+EPOCH_CACHE_TTL_SEC = int(os.environ.get('INSOMNIAID_EPOCH_CACHE_TTL_SEC', 180 * 24 * 3600))
+
+# Session state budget
+CHAT_HISTORY_MAX = 50
+SHARED_PAYLOAD_BUDGET_BYTES = int(os.environ.get('INSOMNIAID_SHARED_PAYLOAD_BYTES', 256 * 1024 ** 2))
+SESSION_IDLE_SEC = 3600
+
+# Global memory budget shared by concurrent analyses
+ANALYSIS_MEMORY_BUDGET_BYTES = int(os.environ.get('INSOMNIAID_ANALYSIS_MEMORY_BYTES', 4 * 1024 ** 3))
+
+# Usernames allowed to open the admin page (none by default). Register the
+# account first, then list it here; listed names cannot be registered.
+ADMIN_USERS = {u.strip() for u in os.environ.get('INSOMNIAID_ADMIN_USERS', '').split(',') if u.strip()}
+
+# Profiling (admins can also enable it per session with the ?profile=1 query parameter)
+PROFILE_ENABLED = os.environ.get('INSOMNIAID_PROFILE', '0') == '1'
+PROFILE_DIR = os.environ.get('INSOMNIAID_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILE_INTERVAL_SEC = float(os.environ.get('INSOMNIAID_PROFILE_INTERVAL_SEC', 0.005))
+
+# Signal processing
+SIGNAL_WORKERS = int(os.environ.get('INSOMNIAID_SIGNAL_WORKERS', os.cpu_count() or 4))
+READ_CHUNK_SEC = 300
+# 'float' decodes EDF samples to float64 through mne; 'compact' memory-maps the
+# EDF and keeps channels as int16 plus a gain/offset, converted to float32 per kernel
+SIGNAL_PIPELINE_MODE = os.environ.get('INSOMNIAID_SIGNAL_PIPELINE_MODE', 'float')
+
+# Target sampling rate per channel kind before feature computation (Hz)
+FEATURE_TARGET_SFREQ = {
+    'eeg':  100,
+    'eog':  50,
+    'emg':  100,
+    'ecg':  128,
+    'resp': 16,
+    'spo2': 4,
+}
+
+# Similar past nights on the results page
+SIMILAR_NIGHTS_K = 5
+# New analyses searched by brute force before the KD-tree is rebuilt in the background
+SIMILARITY_DELTA_MAX = 5000
+SIMILARITY_REBUILD_SEC = 3600
+# How often new analyses are pulled from the database into the delta buffer
+SIMILARITY_REFRESH_SEC = 2
+
+# Signal viewer: points sent to the browser per channel and pyramid reduction factor
+VIEWER_MAX_POINTS = 2000
+PYRAMID_FACTOR = 4
 
 # ─── Modern Elegant Theme ────────────────────────────────────
 COLORS = {
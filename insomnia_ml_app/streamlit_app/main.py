@@ -1,15 +1,38 @@
 import streamlit as st
+import altair as alt
+import numpy as np
+import pandas as pd
 import os
 import tempfile
 import time
 from config import (
     APP_NAME, APP_ICON, COLORS, SEVERITY_COLORS, SEVERITY_BG,
-    UPLOADS_DIR, CHATBOT_KNOWLEDGE
+    UPLOADS_DIR, SPOOL_DIR, CHATBOT_KNOWLEDGE, ADMIN_USERS, SIMILAR_NIGHTS_K
+)
+from utils.ml_pipeline import (
+    extract_features_from_edf, normalize_features, predict_severity, validate_auto_staging, preflight_edf_pair,
+    read_edf_header, extract_features_from_hypnogram, predict_night_severities
+)
+from utils.database import (
+    register_user, login_user, validate_email, user_exists, username_exists, init_db,
+    save_analysis, severity_distribution, daily_analysis_volume, average_metrics
 )
-from utils.ml_pipeline import extract_features_from_edf, normalize_features, predict_severity
-from utils.database import register_user, login_user, validate_email, user_exists, username_exists, init_db
 from utils.recommendations import get_recommendations
 from utils.pdf_generator import generate_pdf_report
+from utils.explain import explain_prediction, FEATURE_LABELS
+from utils.admission import estimate_analysis_memory, fits_budget, admitted, admission_status
+from utils.uploads import spool_upload, UPLOAD_TYPES, HYPNOGRAM_TYPES
+from utils.storage import atomic_write, touch_artifact, start_cleanup_thread, storage_usage, SpoolReservation
+from utils.session_store import (
+    new_chat_history, compact_analysis, analysis_payload, record_session_size, session_memory_report
+)
+from utils.signal_pyramid import pyramid_available, query_pyramid, query_stages
+from utils.sleep_architecture import STAGE_ORDER, SLEEP_ONSET_WINDOW_EPOCHS
+from utils.sleep_staging import staging_model_available
+from utils.profiling import profiling_enabled, start_profiler, finish_profiler, profiled
+from utils.progress import CancellationToken, progress_range
+from utils.similarity import start_similarity_index, find_similar_analyses
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # ─── Page Config ─────────────────────────────────────────────
 st.set_page_config(
@@ -19,7 +42,14 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# ─── Profiling (opt-in) ──────────────────────────────────────
+_query_params = st.query_params.to_dict() if hasattr(st, 'query_params') else st.experimental_get_query_params()
+PROFILING = profiling_enabled(_query_params, st.session_state.get('username'))
+_rerun_profiler = start_profiler(PROFILING)
+
 init_db()
+start_cleanup_thread()
+start_similarity_index()
 
 # ─── Session State ───────────────────────────────────────────
 defaults = {
@@ -28,7 +58,7 @@ defaults = {
     'page':           "home",
     'show_solutions': False,
     'analysis_data':  None,
-    'chat_history':   [],
+    'chat_history':   new_chat_history(),
 }
 for k, v in defaults.items():
     if k not in st.session_state:
@@ -436,7 +466,8 @@ def render_top_nav():
     </div>
     """, unsafe_allow_html=True)
 
-    cols = st.columns([1, 1, 1, 0.7])
+    is_admin = st.session_state.username in ADMIN_USERS
+    cols = st.columns([1, 1, 1, 1, 0.7] if is_admin else [1, 1, 1, 0.7])
     with cols[0]:
         if st.button("🏠 Home", key="nav_home", use_container_width=True):
             st.session_state.page = "home"; st.rerun()
@@ -446,12 +477,16 @@ def render_top_nav():
     with cols[2]:
         if st.button("📊 Results", key="nav_results", use_container_width=True):
             st.session_state.page = "results"; st.rerun()
-    with cols[3]:
+    if is_admin:
+        with cols[3]:
+            if st.button("🛠️ Admin", key="nav_admin", use_container_width=True):
+                st.session_state.page = "admin"; st.rerun()
+    with cols[-1]:
         if st.button("🚪 Logout", key="nav_logout", use_container_width=True):
             st.session_state.logged_in = False
             st.session_state.username  = ""
             st.session_state.page      = "login"
-            st.session_state.chat_history = []
+            st.session_state.chat_history = new_chat_history()
             st.rerun()
 
 
@@ -501,9 +536,9 @@ def show_auth_page():
                         st.session_state.logged_in = True
                         st.session_state.username  = result
                         st.session_state.page      = "home"
-                        st.session_state.chat_history = [
+                        st.session_state.chat_history = new_chat_history([
                             {"role": "bot", "text": f"👋 Hi {result}! I'm your InsomniAid Assistant. Ask me anything about sleep!"}
-                        ]
+                        ])
                         st.rerun()
                     else:
                         st.error(result)
@@ -682,7 +717,7 @@ def show_home_page():
             st.markdown("<br>", unsafe_allow_html=True)
             st.markdown('<div class="btn-outline">', unsafe_allow_html=True)
             if st.button("🗑️ Clear Chat", use_container_width=True, key="clear_chat"):
-                st.session_state.chat_history = []
+                st.session_state.chat_history = new_chat_history()
                 st.rerun()
             st.markdown('</div>', unsafe_allow_html=True)
 
@@ -706,9 +741,9 @@ def show_upload_page():
             margin-bottom:12px;
         ">
             <div style="color:{C['primary']}; font-weight:600; font-size:1rem; font-family: 'Poppins', sans-serif; margin-bottom:8px;">🧠 PSG Data File</div>
-            <div style="color:{C['text_muted']}; font-size:0.85rem; margin-bottom:12px;">Polysomnography recording</div>
+            <div style="color:{C['text_muted']}; font-size:0.85rem; margin-bottom:12px;">Polysomnography recording (.edf, or compressed as .gz / .bz2 / .zip)</div>
         """, unsafe_allow_html=True)
-        psg_file = st.file_uploader("PSG", type=['edf'], label_visibility="collapsed", key="psg_upload")
+        psg_file = st.file_uploader("PSG", type=UPLOAD_TYPES, label_visibility="collapsed", key="psg_upload")
         st.markdown("</div>", unsafe_allow_html=True)
 
     with col2:
@@ -721,60 +756,198 @@ def show_upload_page():
             margin-bottom:12px;
         ">
             <div style="color:{C['primary']}; font-weight:600; font-size:1rem; font-family: 'Poppins', sans-serif; margin-bottom:8px;">📈 Hypnogram File</div>
-            <div style="color:{C['text_muted']}; font-size:0.85rem; margin-bottom:12px;">Sleep stage annotations</div>
+            <div style="color:{C['text_muted']}; font-size:0.85rem; margin-bottom:12px;">EDF+, CSV/TSV or XML stages (optional with a PSG – staged automatically if omitted)</div>
         """, unsafe_allow_html=True)
-        hypno_file = st.file_uploader("Hypnogram", type=['edf'], label_visibility="collapsed", key="hypno_upload")
+        hypno_file = st.file_uploader("Hypnogram", type=HYPNOGRAM_TYPES, label_visibility="collapsed", key="hypno_upload")
         st.markdown("</div>", unsafe_allow_html=True)
+        validate_staging = st.checkbox(
+            "Compare automatic staging with this hypnogram", key="validate_staging",
+            disabled=hypno_file is None or psg_file is None
+        )
 
     st.markdown("<br><br>", unsafe_allow_html=True)
 
+    if st.session_state.pop("analysis_cancelled", False):
+        st.info("Analysis cancelled.")
+
     if st.button("🔍  Analyze Sleep Data", use_container_width=True, key="analyze_btn"):
-        if not psg_file or not hypno_file:
-            st.warning("Please upload both PSG and Hypnogram files.")
+        if not psg_file and not hypno_file:
+            st.warning("Please upload a PSG file or a hypnogram.")
         else:
-            with st.spinner("Analyzing your sleep data …"):
-                progress = st.progress(0, text="Saving files…")
-                with tempfile.TemporaryDirectory() as tmpdir:
-                    psg_path   = os.path.join(tmpdir, "psg.edf")
-                    hypno_path = os.path.join(tmpdir, "hypno.edf")
-                    with open(psg_path,   'wb') as f: f.write(psg_file.getbuffer())
-                    with open(hypno_path, 'wb') as f: f.write(hypno_file.getbuffer())
-
-                    progress.progress(20, text="Extracting features…")
-                    features = extract_features_from_edf(psg_path, hypno_path)
+            cancel = CancellationToken()
+            try:
+                run_analysis(psg_file, hypno_file, validate_staging, cancel)
+            finally:
+                # An interrupted run (cancel click, page change, closed tab) stops its pool work too
+                cancel.cancel()
+
+
+def _mark_analysis_cancelled():
+    st.session_state.analysis_cancelled = True
+
+
+def run_analysis(psg_file, hypno_file, validate_staging, cancel):
+    with st.spinner("Analyzing your sleep data …"):
+        progress = st.progress(0, text="Saving files…")
+        # Clicking reruns the script, which stops this run at its next progress update
+        st.button("✖  Cancel", key="cancel_analysis_btn", on_click=_mark_analysis_cancelled)
+
+        def show_progress(fraction, text):
+            progress.progress(min(int(fraction * 100), 100), text=text)
+
+        # Spooled bytes are charged to the storage quota as they are written and
+        # stay charged until the spool directory has been removed
+        with SpoolReservation() as reservation, tempfile.TemporaryDirectory(dir=SPOOL_DIR) as tmpdir:
+            hypno_path = None
+            if hypno_file:
+                ok, hypno_upload = spool_upload(
+                    hypno_file, os.path.join(tmpdir, "hypno.edf"),
+                    progress=progress_range(show_progress, 0, 0.05 if psg_file else 0.1), reservation=reservation
+                )
+                if not ok:
+                    st.error(hypno_upload)
+                    return
+                hypno_path = hypno_upload['path']
+
+            staging_validation = None
+            if not psg_file:
+                # Hypnogram-only analysis: stage features only, no signal processing
+                show_progress(0.2, "Reading hypnogram…")
+                upload_hash = hypno_upload['sha256']
+                with profiled("pipeline_hypnogram", PROFILING):
+                    features = extract_features_from_hypnogram(hypno_path, epoch_cache_key=upload_hash)
+                if features is None:
+                    st.error("Failed to read the hypnogram.")
+                    return
+            else:
+                ok, psg_upload = spool_upload(
+                    psg_file, os.path.join(tmpdir, "psg.edf"), progress=progress_range(show_progress, 0.05, 0.15),
+                    reservation=reservation
+                )
+                if not ok:
+                    st.error(psg_upload)
+                    return
+                psg_path = psg_upload['path']
+                upload_hash = psg_upload['sha256']
+
+                show_progress(0.15, "Checking files…")
+                ok, message = preflight_edf_pair(psg_path, hypno_path)
+                if not ok:
+                    st.error(message)
+                    return
+
+                estimate = estimate_analysis_memory(read_edf_header(psg_path))
+                if not fits_budget(estimate):
+                    st.error(f"This recording needs about {estimate / 1024 ** 3:.1f} GB to analyze, more than this server allows.")
+                    return
+
+                def show_queue_position(position):
+                    show_progress(0.17, f"⏳ Server busy – you are number {position} in the queue…")
+
+                with admitted(estimate, on_wait=show_queue_position):
+                    extract_end = 0.8 if hypno_file and validate_staging else 0.9
+                    with profiled("pipeline_extract_features", PROFILING):
+                        features = extract_features_from_edf(
+                            psg_path, hypno_path,
+                            pyramid_path=os.path.join(UPLOADS_DIR, f"signals_{upload_hash}.npy"),
+                            progress=progress_range(show_progress, 0.2, extract_end), cancel=cancel,
+                            epoch_cache_key=upload_hash
+                        )
                     if features is None:
                         st.error("Failed to extract features.")
                         return
 
-                    progress.progress(45, text="Normalizing data…")
-                    normalized = normalize_features(features)
-                    if normalized is None:
-                        st.error("Normalization failed.")
-                        return
-
-                    progress.progress(70, text="Running AI prediction…")
-                    severity, probabilities = predict_severity(normalized)
-                    if severity is None:
-                        st.error("Prediction failed.")
-                        return
-
-                    progress.progress(100, text="✅ Done!")
-                    time.sleep(0.5)
-
-                    st.session_state.analysis_data = {
-                        'severity':     severity,
-                        'features':     features,
-                        'probabilities': probabilities
-                    }
-                    st.session_state.show_solutions = False
-                    st.session_state.page = "results"
-                    st.rerun()
+                    if hypno_file and validate_staging:
+                        with profiled("pipeline_validate_staging", PROFILING):
+                            staging_validation = validate_auto_staging(
+                                psg_path, hypno_path, progress=progress_range(show_progress, 0.8, 0.9), cancel=cancel
+                            )
+
+            show_progress(0.92, "Normalizing data…")
+            with profiled("pipeline_normalize", PROFILING):
+                normalized = normalize_features(features)
+            if normalized is None:
+                st.error("Normalization failed.")
+                return
+
+            show_progress(0.95, "Running AI prediction…")
+            with profiled("pipeline_predict", PROFILING):
+                severity, probabilities = predict_severity(normalized)
+            if severity is None:
+                st.error("Prediction failed.")
+                return
+            if features.get('nights'):
+                for night, night_severity in zip(features['nights'], predict_night_severities(features['nights']) or []):
+                    night['severity'] = night_severity
+
+            with profiled("pipeline_explain", PROFILING):
+                attributions = explain_prediction(normalized, severity, features)
+
+            show_progress(1, "✅ Done!")
+            time.sleep(0.5)
+
+            st.session_state.analysis_data = compact_analysis(
+                severity, features, probabilities,
+                auto_staged=hypno_file is None,
+                low_confidence_staging=hypno_file is None and not staging_model_available(),
+                upload_hash=upload_hash,
+                staging_validation=staging_validation,
+                attributions=attributions
+            )
+            save_analysis(st.session_state.username, severity, features, upload_hash)
+            st.session_state.show_solutions = False
+            st.session_state.page = "results"
+            st.rerun()
 
 
 # ═══════════════════════════════════════════════════════════════
 # RESULTS PAGE
 # ═══════════════════════════════════════════════════════════════
 
+def show_signal_viewer(pyramid):
+    st.markdown(f"""
+    <div style="font-weight:600; font-size:0.95rem; color:{C['text_main']}; margin:24px 0 6px; font-family: 'Poppins', sans-serif;">〰️ Signal Viewer</div>
+    """, unsafe_allow_html=True)
+    if not pyramid_available(pyramid):
+        st.info("The signal data for this analysis has expired. Upload the recording again to view it.")
+        return
+
+    names = [ch['name'] for ch in pyramid['channels']]
+    selected = st.multiselect("Channels", names, default=names[:3], key="viewer_channels")
+    # Half-minute steps let the window shrink to a single 30 s epoch
+    total_min = float(np.ceil(pyramid['duration_sec'] / 30) / 2)
+    start_min, end_min = st.slider(
+        "Window (minutes)", 0.0, total_min, (0.0, total_min), step=0.5, key="viewer_window"
+    )
+    start_sec, end_sec = start_min * 60, max(end_min * 60, start_min * 60 + 30)
+    x_scale = alt.Scale(domain=[start_sec / 60, end_sec / 60])
+
+    charts = []
+    for name in selected:
+        window = query_pyramid(pyramid, names.index(name), start_sec, end_sec)
+        frame = pd.DataFrame({'minute': window['time_sec'] / 60, 'lo': window['lo'], 'hi': window['hi']})
+        base = alt.Chart(frame).encode(x=alt.X('minute:Q', title=None, scale=x_scale))
+        mark = base.mark_line(color=C['primary'], strokeWidth=1) if window['exact'] \
+            else base.mark_area(color=C['primary'], opacity=0.7)
+        y = alt.Y('lo:Q', title=name, scale=alt.Scale(zero=False))
+        charts.append((mark.encode(y=y) if window['exact'] else mark.encode(y=y, y2='hi:Q')).properties(height=110))
+
+    epoch_sec, codes = query_stages(pyramid, start_sec, end_sec)
+    if len(codes):
+        # Repeat the last epoch at its end so the final step is drawn
+        stages = pd.DataFrame({
+            'minute': np.append(epoch_sec, epoch_sec[-1] + pyramid['epoch_sec']) / 60,
+            'stage': [STAGE_ORDER[c] for c in np.append(codes, codes[-1])],
+        })
+        charts.append(alt.Chart(stages).mark_line(interpolate='step-after', color=C['text_main']).encode(
+            x=alt.X('minute:Q', title="Minutes since recording start", scale=x_scale),
+            y=alt.Y('stage:N', title="Stage", sort=['W', 'REM', 'N1', 'N2', 'N3', 'UNKNOWN'])
+        ).properties(height=110))
+
+    if charts:
+        st.altair_chart(alt.vconcat(*charts).resolve_scale(x='shared'), use_container_width=True)
+
+
 def show_results_page():
     render_top_nav()
 
@@ -823,6 +996,114 @@ def show_results_page():
         st.metric("REM Latency",            f"{features['rem_latency_min']:.1f} min")
         st.metric("REM Sleep %",            f"{features['percent_rem']:.1f}%")
 
+    if data.get('low_confidence_staging'):
+        st.warning(
+            "Low confidence: no hypnogram was uploaded and no trained staging model is installed, so sleep "
+            "stages were scored by a simple rule-based fallback whose accuracy has not been validated on clinical "
+            "recordings. Treat this severity as a rough indication and upload the scored hypnogram for a reliable result."
+        )
+    elif data.get('auto_staged'):
+        st.info("No hypnogram was uploaded, so sleep stages were scored automatically from the PSG.")
+
+    payload    = analysis_payload(data)
+    validation = payload.get('staging_validation')
+    attributions = payload.get('attributions')
+    quality      = payload.get('signal_quality')
+    nights       = payload.get('nights')
+    if nights:
+        st.markdown(f'<div style="margin:16px 0;"><span style="font-size:0.8rem; text-transform:uppercase; letter-spacing:1.2px; color:{C["text_muted"]}; font-weight:600; font-family: \'Poppins\', sans-serif;">Nights</span></div>', unsafe_allow_html=True)
+        st.caption(f"This recording spans {len(nights)} sleep periods, each from up to {SLEEP_ONSET_WINDOW_EPOCHS * 0.5:.0f} min of wake before sleep onset to final awakening; the metrics above are their per-night averages.")
+        st.dataframe(
+            [{'Night': night['night'], 'Starts': f"+{night['start_min'] / 60:.1f} h",
+              'Severity': night.get('severity', '–'),
+              'Total Sleep': f"{night['total_sleep_time_min']:.0f} min",
+              'Efficiency': f"{night['sleep_efficiency_percent']:.1f}%",
+              'Onset Latency': f"{night['sleep_onset_latency_min']:.1f} min",
+              'WASO': f"{night['wake_after_sleep_onset_min']:.1f} min",
+              'REM': f"{night['percent_rem']:.1f}%"}
+             for night in nights],
+            use_container_width=True, hide_index=True
+        )
+    if quality and quality['channels']:
+        q1, q2 = st.columns([1, 3])
+        q1.metric("Clean Epochs", f"{quality['good_epochs_percent']:.1f}%")
+        q2.dataframe(
+            [{'Channel': row['channel'], 'Flagged': f"{row['bad_percent']:.1f}%",
+              'Flat': f"{row['flat_percent']:.1f}%", 'Clipped': f"{row['saturated_percent']:.1f}%",
+              'Line Noise': f"{row['line_noise_percent']:.1f}%",
+              'Movement / Pops': f"{max(row['high_amplitude_percent'], row['electrode_pop_percent']):.1f}%"}
+             for row in quality['channels']],
+            use_container_width=True, hide_index=True
+        )
+
+    cardio = [
+        ("Heart Rate (sleep)",  'hr_mean_bpm',     "{:.0f} bpm"),
+        ("HRV (RMSSD)",         'rmssd_ms',        "{:.0f} ms"),
+        ("LF/HF Ratio",         'lf_hf_ratio',     "{:.2f}"),
+        ("Breathing Rate",      'resp_rate_bpm',   "{:.1f} /min"),
+        ("Desaturations (3%)",  'odi3_per_hour',   "{:.1f} /h"),
+        ("Time Below 90% SpO₂", 't90_percent',     "{:.1f}%"),
+    ]
+    cardio = [(label, fmt.format(features[key])) for label, key, fmt in cardio if key in features]
+    if cardio:
+        st.markdown(f'<div style="margin:16px 0;"><span style="font-size:0.8rem; text-transform:uppercase; letter-spacing:1.2px; color:{C["text_muted"]}; font-weight:600; font-family: \'Poppins\', sans-serif;">Heart &amp; Breathing</span></div>', unsafe_allow_html=True)
+        for col, (label, value) in zip(st.columns(len(cardio)), cardio):
+            col.metric(label, value)
+
+    normalized = normalize_features(features)
+    if normalized is not None:
+        similar = find_similar_analyses(normalized, SIMILAR_NIGHTS_K, exclude_hash=data.get('upload_hash'))
+        st.markdown(f'<div style="margin:16px 0;"><span style="font-size:0.8rem; text-transform:uppercase; letter-spacing:1.2px; color:{C["text_muted"]}; font-weight:600; font-family: \'Poppins\', sans-serif;">Similar Past Nights</span></div>', unsafe_allow_html=True)
+        if similar is None:
+            st.caption("Past analyses are still being indexed; similar nights will appear shortly.")
+        elif not similar:
+            st.caption("No other analyses have been stored yet.")
+        else:
+            st.dataframe(
+                [{'Date': row['day'], 'Severity': row['severity'],
+                  'Efficiency': f"{row['sleep_efficiency_percent']:.1f}%",
+                  'Total Sleep': f"{row['total_sleep_time_min']:.0f} min",
+                  'Onset Latency': f"{row['sleep_onset_latency_min']:.1f} min",
+                  'WASO': f"{row['wake_after_sleep_onset_min']:.1f} min",
+                  'Distance': f"{row['distance']:.2f}"}
+                 for row in similar],
+                use_container_width=True, hide_index=True
+            )
+
+    if validation:
+        v1, v2, v3 = st.columns(3)
+        v1.metric("Staging Agreement", f"{validation['accuracy']:.1f}%")
+        v2.metric("Cohen's Kappa",     f"{validation['kappa']:.2f}")
+        v3.metric("Epochs Compared",   f"{validation['epochs']}")
+
+    if attributions:
+        rows_html = ""
+        for label, verdict, decisive in attributions:
+            color = C['danger'] if decisive else C['success']
+            rows_html += (
+                f'<div style="display:flex; justify-content:space-between; gap:16px; padding:10px 0; '
+                f'border-bottom:2px solid {C["border"]};">'
+                f'<span style="color:{C["text_body"]}; font-size:0.92rem;">{label}</span>'
+                f'<span style="color:{color}; font-weight:600; font-size:0.92rem; text-align:right;">{verdict}</span></div>'
+            )
+        st.markdown(f"""
+        <div style="
+            background:{C['card']}; 
+            border:2px solid {C['border']}; 
+            border-radius:18px;
+            padding: 22px 28px; 
+            margin-top:18px;
+            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.05);
+        ">
+            <div style="font-weight:600; font-size:0.95rem; color:{C['text_main']}; margin-bottom:6px; font-family: 'Poppins', sans-serif;">🔎 Why "{severity}"?</div>
+            <div style="color:{C['text_muted']}; font-size:0.8rem; margin-bottom:8px;">The result is graded from these metrics, each compared with the training average (SD) against fixed thresholds; the worst grade sets the severity</div>
+            {rows_html}
+        </div>
+        """, unsafe_allow_html=True)
+
+    if payload.get('signal_pyramid'):
+        show_signal_viewer(payload['signal_pyramid'])
+
     st.markdown("<br>", unsafe_allow_html=True)
 
     if not st.session_state.show_solutions:
@@ -874,8 +1155,13 @@ def show_results_page():
         if st.button("📄  Generate & Download PDF Report", use_container_width=True, key="download_btn"):
             with st.spinner("Generating report…"):
                 pdf_path = os.path.join(UPLOADS_DIR, f"report_{st.session_state.username}.pdf")
-                ok = generate_pdf_report(pdf_path, st.session_state.username, severity, features, recs)
+                with profiled("pdf_report", PROFILING):
+                    ok = atomic_write(pdf_path, writer=lambda tmp_path: generate_pdf_report(
+                        tmp_path, st.session_state.username, severity, features, recs, attributions, quality, nights,
+                        low_confidence_staging=data.get('low_confidence_staging', False)
+                    ))
                 if ok:
+                    touch_artifact(pdf_path)
                     with open(pdf_path, 'rb') as f:
                         st.download_button(
                             label="⬇️  Download PDF Report",
@@ -889,18 +1175,103 @@ def show_results_page():
                     st.error("Failed to generate PDF.")
 
 
+# ═══════════════════════════════════════════════════════════════
+# ADMIN PAGE
+# ═══════════════════════════════════════════════════════════════
+
+def _format_bytes(n):
+    """Human-readable byte count"""
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+def show_clinic_dashboard():
+    st.markdown(f'<div style="margin-bottom:16px;"><span style="font-size:0.8rem; text-transform:uppercase; letter-spacing:1.2px; color:{C["text_muted"]}; font-weight:600; font-family: \'Poppins\', sans-serif;">Clinic Overview</span></div>', unsafe_allow_html=True)
+
+    total, averages = average_metrics()
+    if not total:
+        st.info("No analyses have been stored yet.")
+        return
+
+    distribution = severity_distribution()
+    cols = st.columns(len(distribution) + 1)
+    cols[0].metric("Total Analyses", f"{total}")
+    for col, (level, count) in zip(cols[1:], distribution.items()):
+        col.metric(level, f"{count}", f"{100 * count / total:.0f}%", delta_color="off")
+
+    volume = pd.DataFrame(daily_analysis_volume(), columns=['day', 'severity', 'count'])
+    st.altair_chart(alt.Chart(volume).mark_bar().encode(
+        x=alt.X('day:T', title="Day"),
+        y=alt.Y('count:Q', title="Analyses"),
+        color=alt.Color('severity:N', title="Severity",
+                        scale=alt.Scale(domain=list(SEVERITY_COLORS), range=list(SEVERITY_COLORS.values())))
+    ).properties(height=220), use_container_width=True)
+
+    st.dataframe(
+        [{'Metric': FEATURE_LABELS.get(col, col), 'Average': f"{value:.1f}"} for col, value in averages.items()],
+        use_container_width=True, hide_index=True
+    )
+
+
+def show_admin_page():
+    render_top_nav()
+
+    if st.session_state.username not in ADMIN_USERS:
+        st.error("You do not have access to this page.")
+        return
+
+    show_clinic_dashboard()
+
+    st.markdown(f'<div style="margin:24px 0 16px;"><span style="font-size:0.8rem; text-transform:uppercase; letter-spacing:1.2px; color:{C["text_muted"]}; font-weight:600; font-family: \'Poppins\', sans-serif;">Session Memory (this process)</span></div>', unsafe_allow_html=True)
+
+    report = session_memory_report()
+    shared = report['shared']
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Active Sessions",      f"{len(report['sessions'])}")
+    c2.metric("Session State",        _format_bytes(report['session_bytes']))
+    c3.metric("Shared Payload Store", f"{_format_bytes(shared['bytes'])} / {_format_bytes(shared['budget_bytes'])}")
+    if report['sessions']:
+        st.dataframe(
+            [{'Session': row['session'], 'User': row['username'], 'State Size': _format_bytes(row['bytes']),
+              'Last Seen': time.strftime('%H:%M:%S', time.localtime(row['last_seen']))}
+             for row in report['sessions']],
+            use_container_width=True, hide_index=True
+        )
+
+    admission = admission_status()
+    a1, a2 = st.columns(2)
+    a1.metric("Analysis Memory Admitted", f"{_format_bytes(admission['in_use_bytes'])} / {_format_bytes(admission['budget_bytes'])}")
+    a2.metric("Analyses Queued",          f"{admission['queued']}")
+
+    usage = storage_usage()
+    st.metric("Upload Storage", f"{_format_bytes(usage['bytes'] + usage['spool_bytes'])} / {_format_bytes(usage['quota_bytes'])}",
+              f"{usage['artifacts']} artifacts, {_format_bytes(usage['spool_bytes'])} spooling", delta_color="off")
+
+
 # ═══════════════════════════════════════════════════════════════
 # ROUTER
 # ═══════════════════════════════════════════════════════════════
 
-if not st.session_state.logged_in:
-    show_auth_page()
-else:
-    if st.session_state.page == "home":
-        show_home_page()
-    elif st.session_state.page == "upload":
-        show_upload_page()
-    elif st.session_state.page == "results":
-        show_results_page()
+_page = st.session_state.page if st.session_state.logged_in else "auth"
+try:
+    if not st.session_state.logged_in:
+        show_auth_page()
     else:
-        show_home_page()
\ No newline at end of file
+        if st.session_state.page == "home":
+            show_home_page()
+        elif st.session_state.page == "upload":
+            show_upload_page()
+        elif st.session_state.page == "results":
+            show_results_page()
+        elif st.session_state.page == "admin":
+            show_admin_page()
+        else:
+            show_home_page()
+finally:
+    finish_profiler(_rerun_profiler, f"rerun_{_page}")
+
+_ctx = get_script_run_ctx()
+if _ctx is not None:
+    record_session_size(_ctx.session_id, st.session_state.username, st.session_state)
\ No newline at end of file
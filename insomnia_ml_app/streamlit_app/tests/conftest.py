@@ -0,0 +1,55 @@
+"""Shared test setup: import path, isolated data directories and a fixture table
+
+config creates its directories and reads DATA_PATH at import time, so the
+environment is pointed at a temporary directory here, before any test
+module imports the app.
+"""
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+TEST_ROOT = tempfile.mkdtemp(prefix='insomniaid-tests-')
+os.environ['INSOMNIAID_DATA_PATH'] = os.path.join(TEST_ROOT, 'features.csv')
+os.environ['INSOMNIAID_DB_PATH'] = os.path.join(TEST_ROOT, 'users.db')
+os.environ['INSOMNIAID_UPLOADS_DIR'] = os.path.join(TEST_ROOT, 'uploads')
+os.environ['INSOMNIAID_EPOCH_CACHE_DIR'] = os.path.join(TEST_ROOT, 'epoch_cache')
+os.environ['INSOMNIAID_PROFILE_DIR'] = os.path.join(TEST_ROOT, 'profiles')
+
+def _write_feature_table(path, n=200, seed=0):
+    """Plausible per-night sleep metrics; only the scaler is fitted on them"""
+    rng = np.random.default_rng(seed)
+    tst = rng.normal(390, 60, n).clip(120, 540)
+    stages = rng.dirichlet([2, 1, 10, 3, 4], n) * 100
+    pd.DataFrame({
+        'sleep_onset_latency_min': rng.gamma(2, 10, n),
+        'total_sleep_time_min': tst,
+        'wake_after_sleep_onset_min': rng.gamma(2, 20, n),
+        'rem_latency_min': rng.normal(90, 25, n).clip(10),
+        'sleep_efficiency_percent': rng.normal(85, 8, n).clip(40, 100),
+        'percent_w': stages[:, 0],
+        'percent_n1': stages[:, 1],
+        'percent_n2': stages[:, 2],
+        'percent_n3': stages[:, 3],
+        'percent_rem': stages[:, 4],
+        'label': rng.integers(0, 4, n),
+    }).to_csv(path, index=False)
+
+_write_feature_table(os.environ['INSOMNIAID_DATA_PATH'])
+
+@pytest.fixture(scope='session')
+def recording(tmp_path_factory):
+    """A one-hour synthetic PSG, its EDF+ hypnogram and the scored stages"""
+    from tools.synthetic_edf import synthetic_stages, write_psg, write_hypnogram
+    root = tmp_path_factory.mktemp('recording')
+    stages = synthetic_stages(1)
+    return {
+        'psg': write_psg(str(root / 'night-PSG.edf'), stages),
+        'hypnogram': write_hypnogram(str(root / 'night-Hypnogram.edf'), stages),
+        'stages': stages,
+    }
@@ -0,0 +1,98 @@
+import threading
+import time
+import pytest
+from config import READ_CHUNK_SEC
+from utils import admission
+from utils.admission import admission_status, admitted, estimate_analysis_memory, fits_budget
+
+HOURS = 8
+
+def _header(labels, rates, record_duration=1):
+    return {
+        'n_records': int(HOURS * 3600 / record_duration),
+        'record_duration': record_duration,
+        'labels': labels,
+        'samples_per_record': [int(rate * record_duration) for rate in rates],
+    }
+
+@pytest.fixture
+def budget(monkeypatch):
+    monkeypatch.setattr(admission, 'ANALYSIS_MEMORY_BUDGET_BYTES', 100)
+    monkeypatch.setattr(admission, 'QUEUE_POLL_SEC', 0.01)
+
+def test_estimate_counts_decimated_samples_and_the_read_block(monkeypatch):
+    monkeypatch.setattr(admission, 'SIGNAL_PIPELINE_MODE', 'compact')
+    # 512 Hz EEG is decimated 5x to 102.4 Hz; the 16 Hz respiration channel is kept as is
+    header = _header(['EEG C3', 'Resp nasal', 'EDF Annotations'], [512, 16, 60])
+    kept = HOURS * 3600 * (512 / 5 + 16)
+    block = READ_CHUNK_SEC * (512 + 16)
+    pyramid = kept * admission.PYRAMID_BYTES_PER_SAMPLE
+    expected = kept * admission.BYTES_PER_SAMPLE + max(block * admission.CHUNK_BYTES_PER_SAMPLE, pyramid)
+    assert estimate_analysis_memory(header) == int(expected)
+
+def test_estimate_uses_the_top_rate_when_mne_resamples(monkeypatch):
+    monkeypatch.setattr(admission, 'SIGNAL_PIPELINE_MODE', 'float')
+    mixed = estimate_analysis_memory(_header(['EEG C3', 'Resp nasal'], [512, 16]))
+    uniform = estimate_analysis_memory(_header(['EEG C3', 'Resp nasal'], [512, 512]))
+    assert mixed == uniform
+
+def test_estimate_of_an_empty_header():
+    assert estimate_analysis_memory(_header(['EDF Annotations'], [60])) == 0
+    assert estimate_analysis_memory(_header([], [])) == 0
+
+def test_estimate_grows_with_duration():
+    short = _header(['EEG C3'], [256])
+    long = dict(short, n_records=2 * short['n_records'])
+    assert estimate_analysis_memory(long) > estimate_analysis_memory(short)
+
+def test_fits_budget(budget):
+    assert fits_budget(100) and not fits_budget(101)
+
+def test_admitted_jobs_are_counted_until_they_finish(budget):
+    with admitted(60):
+        assert admission_status()['in_use_bytes'] == 60
+    assert admission_status()['in_use_bytes'] == 0
+
+def test_jobs_wait_in_arrival_order(budget):
+    order, positions = [], []
+    release = threading.Event()
+
+    def job(name, size, on_wait=None):
+        with admitted(size, on_wait=on_wait):
+            order.append(name)
+            if name == 'first':
+                release.wait(5)
+
+    first = threading.Thread(target=job, args=('first', 70))
+    first.start()
+    while admission_status()['in_use_bytes'] != 70:
+        time.sleep(0.01)
+    # 'small' would fit now, but it arrived after 'large' and may not overtake it
+    large = threading.Thread(target=job, args=('large', 50, positions.append))
+    large.start()
+    while admission_status()['queued'] != 1:
+        time.sleep(0.01)
+    small = threading.Thread(target=job, args=('small', 10))
+    small.start()
+    while admission_status()['queued'] != 2:
+        time.sleep(0.01)
+    release.set()
+    for thread in (first, large, small):
+        thread.join(5)
+    assert order == ['first', 'large', 'small']
+    assert positions and set(positions) == {1}
+    assert admission_status() == {'in_use_bytes': 0, 'queued': 0, 'budget_bytes': 100}
+
+def test_abandoned_job_leaves_the_queue(budget):
+    class Leave(Exception):
+        pass
+
+    def give_up(position):
+        raise Leave
+
+    with admitted(100):
+        with pytest.raises(Leave):
+            with admitted(50, on_wait=give_up):
+                pass
+        assert admission_status()['queued'] == 0
+    assert admission_status()['in_use_bytes'] == 0
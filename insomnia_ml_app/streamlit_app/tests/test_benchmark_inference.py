@@ -0,0 +1,49 @@
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from utils.ml_pipeline import SEVERITY_LEVELS, predict_severity_batch
+from tools.benchmark_inference import (
+    CompactForestBackend, ForestBackend, HeuristicBackend, benchmark, compact_forest_proba,
+    export_compact_forest, load_split, severity_index,
+)
+
+@pytest.fixture(scope='module')
+def split():
+    return load_split(0.25, 0)
+
+@pytest.fixture(scope='module')
+def forest(split):
+    X_train, _, y_train, _ = split
+    return RandomForestClassifier(n_estimators=15, random_state=0).fit(X_train, np.array(SEVERITY_LEVELS)[y_train])
+
+def test_severity_index_accepts_names_and_numbers():
+    assert severity_index(['Mild', 3, '0', 'Severe']).tolist() == [1, 3, 0, 3]
+
+def test_split_comes_from_the_labeled_rows(split):
+    X_train, X_test, y_train, y_test = split
+    assert len(X_train) + len(X_test) == 200
+    assert set(np.concatenate([y_train, y_test])) <= {0, 1, 2, 3}
+    np.testing.assert_allclose(X_train.mean(axis=0), 0, atol=1e-9)
+
+def test_compact_forest_matches_sklearn(forest, split):
+    _, X_test, _, _ = split
+    np.testing.assert_allclose(compact_forest_proba(export_compact_forest(forest), X_test),
+                               forest.predict_proba(X_test), atol=1e-6)
+
+def test_backends_agree(forest, split, tmp_path):
+    _, X_test, _, _ = split
+    model_path = str(tmp_path / 'forest.joblib')
+    joblib.dump(forest, model_path)
+    export_path = str(tmp_path / 'compact.npz')
+    np.savez(export_path, **export_compact_forest(forest))
+    forest_predictions = ForestBackend(model_path).load()(X_test)
+    np.testing.assert_array_equal(CompactForestBackend(export_path).load()(X_test), forest_predictions)
+    np.testing.assert_array_equal(HeuristicBackend().load()(X_test), predict_severity_batch(X_test)[0])
+
+def test_benchmark_reports_every_metric(split):
+    _, X_test, _, y_test = split
+    result = benchmark(HeuristicBackend(), X_test, y_test, latency_rows=20, min_batch_sec=0.01)
+    assert result['backend'] == 'heuristic'
+    assert result['rows_per_sec'] > 0
+    assert 0 <= result['accuracy'] <= 1 and 0 <= result['macro_f1'] <= 1
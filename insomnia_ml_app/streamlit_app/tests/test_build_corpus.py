@@ -0,0 +1,95 @@
+import os
+import sys
+import shutil
+import pandas as pd
+import pytest
+from utils.ml_pipeline import FEATURE_COLS
+from tools import build_corpus
+from tools.build_corpus import find_recordings, load_labels, load_manifest, plan, write_table
+
+def _touch(path, data=b'x'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def test_recordings_pair_by_longest_shared_prefix(tmp_path):
+    root = tmp_path / 'archive'
+    for name in ('SC4001E0-PSG.edf', 'SC4001EC-Hypnogram.edf', 'SC4002E0-PSG.edf', 'SC4002EC-Hypnogram.edf',
+                 'shhs/shhs1-200001.edf', 'shhs/shhs1-200001-nsrr.xml', 'lone/night.edf'):
+        _touch(str(root / name))
+    recordings, unpaired = find_recordings(str(root))
+    assert recordings == {
+        'SC4001E0-PSG.edf': (str(root / 'SC4001E0-PSG.edf'), str(root / 'SC4001EC-Hypnogram.edf')),
+        'SC4002E0-PSG.edf': (str(root / 'SC4002E0-PSG.edf'), str(root / 'SC4002EC-Hypnogram.edf')),
+        os.path.join('shhs', 'shhs1-200001.edf'): (str(root / 'shhs/shhs1-200001.edf'),
+                                                   str(root / 'shhs/shhs1-200001-nsrr.xml')),
+    }
+    assert unpaired == [str(root / 'lone/night.edf')]
+
+def test_labels_match_every_spelling(tmp_path):
+    path = tmp_path / 'labels.csv'
+    path.write_text('recording,label\nSC4001E0,Mild\nshhs/shhs1-200001.edf,Severe\n')
+    labels = load_labels(str(path))
+    assert build_corpus._label_for('SC4001E0-PSG.edf', labels) == 'Mild'
+    assert build_corpus._label_for('shhs/shhs1-200001.edf', labels) == 'Severe'
+    assert build_corpus._label_for('SC4002E0-PSG.edf', labels) is None
+
+def test_plan_only_reprocesses_changed_inputs(tmp_path):
+    hypnogram = _touch(str(tmp_path / 'a-hypnogram.txt'), b'W\nN2\n')
+    recordings = {'a.edf': (str(tmp_path / 'a.edf'), hypnogram), 'b.edf': (_touch(str(tmp_path / 'b.edf')), None)}
+    manifest = load_manifest(str(tmp_path / 'missing.json'))
+    assert plan(recordings, manifest, retry_failed=False) == (['a.edf', 'b.edf'], [])
+    # Only the hypnogram is fingerprinted when there is one
+    assert set(manifest['recordings']['a.edf']) == {'hypnogram', 'features', 'error'}
+
+    manifest['recordings']['a.edf']['features'] = {'total_sleep_time_min': 0.5}
+    manifest['recordings']['b.edf']['error'] = 'no EEG'
+    assert plan(recordings, manifest, retry_failed=False) == ([], ['a.edf', 'b.edf'])
+    assert plan(recordings, manifest, retry_failed=True) == (['b.edf'], ['a.edf'])
+
+    manifest['recordings']['b.edf']['error'] = 'no EEG'
+    _touch(hypnogram, b'W\nN3\n')
+    assert plan(recordings, manifest, retry_failed=False)[0] == ['a.edf']
+
+def test_manifest_for_other_features_is_discarded(tmp_path):
+    path = tmp_path / 'manifest.json'
+    build_corpus.save_manifest(str(path), {'version': 1, 'feature_cols': ['x'], 'recordings': {'a': {}}})
+    assert load_manifest(str(path))['recordings'] == {}
+
+def test_training_table_keeps_labeled_rows_only(tmp_path):
+    manifest = {'recordings': {
+        'a.edf': {'features': dict.fromkeys(FEATURE_COLS, 1.0)},
+        'b.edf': {'features': dict.fromkeys(FEATURE_COLS, 2.0)},
+        'c.edf': {'features': None, 'error': 'failed'},
+    }}
+    path = str(tmp_path / 'table.csv')
+    table, unlabeled = write_table(path, manifest, {'a': 'Mild'}, labeled_only=True)
+    assert unlabeled == 1
+    assert pd.read_csv(path).to_dict('list') == dict({col: [1.0] for col in FEATURE_COLS}, label=['Mild'])
+    table, _ = write_table(path, manifest, {'a': 'Mild'})
+    assert len(pd.read_csv(path)) == 2
+
+def test_rerun_resumes_from_the_manifest(recording, tmp_path, monkeypatch, capsys):
+    archive = tmp_path / 'archive'
+    archive.mkdir()
+    shutil.copy(recording['psg'], archive / 'night-PSG.edf')
+    shutil.copy(recording['hypnogram'], archive / 'night-Hypnogram.edf')
+    output = str(tmp_path / 'corpus.csv')
+    argv = ['build_corpus.py', str(archive), '--output', output, '--workers', '1']
+
+    monkeypatch.setattr(sys, 'argv', argv)
+    assert build_corpus.main() == 0
+    assert '1 to process' in capsys.readouterr().out
+    table = pd.read_csv(output)
+    assert table['total_sleep_time_min'].tolist() == [55.0]
+
+    assert build_corpus.main() == 0
+    assert '0 to process, 1 unchanged' in capsys.readouterr().out
+    pd.testing.assert_frame_equal(pd.read_csv(output), table)
+
+def test_training_table_needs_labels(monkeypatch, tmp_path):
+    from config import DATA_PATH
+    monkeypatch.setattr(sys, 'argv', ['build_corpus.py', str(tmp_path), '--output', DATA_PATH])
+    with pytest.raises(SystemExit):
+        build_corpus.main()
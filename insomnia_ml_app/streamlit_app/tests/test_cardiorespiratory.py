@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from utils.cardiorespiratory import (
+    detect_r_peaks, ecg_features, extract_cardiorespiratory_features, resp_features, spo2_features,
+)
+from utils.sleep_architecture import stage_codes
+
+SFREQ = 128
+# 20 min awake, then 40 min of N3
+STAGES = ['W'] * 40 + ['N3'] * 80
+CODES = stage_codes(STAGES)
+DURATION = len(STAGES) * 30
+
+def _ecg(seed=0):
+    """QRS-like pulses at 60 bpm while awake and 50 bpm in N3, plus noise"""
+    beats, t = [], 0.5
+    while t < DURATION - 1:
+        beats.append(t)
+        t += 1.0 if t < 1200 else 1.2
+    signal = np.random.default_rng(seed).normal(0, 20, DURATION * SFREQ)
+    kernel = 1000 * np.exp(-0.5 * (np.arange(-6, 7) / 2) ** 2)
+    for b in beats:
+        i = int(b * SFREQ)
+        signal[i - 6:i + 7] += kernel
+    return signal, np.array(beats)
+
+def test_r_peaks_are_found():
+    signal, beats = _ecg()
+    peaks = detect_r_peaks(signal, SFREQ)
+    assert abs(len(peaks) - len(beats)) <= 2
+    assert np.median(np.abs(peaks / SFREQ - beats[:len(peaks)])) < 0.05
+
+def test_heart_rate_per_stage():
+    signal, _ = _ecg()
+    features = ecg_features({'sfreq': SFREQ, 'data': signal}, CODES)
+    assert features['hr_w_bpm'] == pytest.approx(60, abs=1)
+    assert features['hr_n3_bpm'] == pytest.approx(50, abs=1)
+    # Sleep-only mean
+    assert features['hr_mean_bpm'] == pytest.approx(50, abs=1)
+    # Regular beats: successive differences are only sampling jitter
+    assert features['rmssd_ms'] < 15
+
+def test_flagged_epochs_are_skipped():
+    signal, _ = _ecg()
+    flags = np.zeros(len(STAGES), dtype=np.uint8)
+    flags[40:] = 1
+    features = ecg_features({'sfreq': SFREQ, 'data': signal, 'quality': flags}, CODES)
+    assert 'hr_n3_bpm' not in features
+
+def test_breathing_rate():
+    t = np.arange(DURATION * 16) / 16
+    resp = 100 * np.sin(2 * np.pi * 0.25 * t) + np.random.default_rng(0).normal(0, 5, t.size)
+    features = resp_features({'sfreq': 16, 'data': resp}, CODES)
+    assert features['resp_rate_bpm'] == pytest.approx(15, abs=0.5)
+    assert features['resp_rate_w_bpm'] == pytest.approx(15, abs=0.5)
+
+def test_desaturations_during_sleep():
+    sfreq = 1
+    spo2 = np.full(DURATION, 96.0)
+    # Four 20 s dips of 5% during N3, one during wake that must not count
+    for start in (1500, 1900, 2400, 3000, 600):
+        spo2[start:start + 20] = 91
+    spo2[2000:2005] = 0
+    features = spo2_features({'sfreq': sfreq, 'data': spo2}, CODES)
+    assert features['odi3_per_hour'] == pytest.approx(4 / (40 / 60))
+    assert features['spo2_min_percent'] == 91
+    assert features['t90_percent'] == 0
+
+def test_channels_are_dispatched_by_kind():
+    signal, _ = _ecg()
+    channels = [
+        {'name': 'ECG', 'kind': 'ecg', 'sfreq': SFREQ, 'data': signal},
+        {'name': 'ECG 2', 'kind': 'ecg', 'sfreq': SFREQ, 'data': np.zeros_like(signal)},
+        {'name': 'EEG', 'kind': 'eeg', 'sfreq': SFREQ, 'data': signal},
+    ]
+    features = extract_cardiorespiratory_features(channels, STAGES)
+    assert features['hr_n3_bpm'] == pytest.approx(50, abs=1)
+    assert extract_cardiorespiratory_features(channels, []) == {}
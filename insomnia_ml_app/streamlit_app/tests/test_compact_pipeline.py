@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from utils import signals
+from utils.ml_pipeline import extract_features_from_edf, read_edf_header
+from utils.signals import (
+    DIGITAL_MAX, DIGITAL_MIN, _quantize, channel_data, channel_samples, read_compact_channels, read_psg_channels,
+    slice_channel,
+)
+
+@pytest.fixture
+def compact(monkeypatch):
+    monkeypatch.setattr(signals, 'SIGNAL_PIPELINE_MODE', 'compact')
+
+def test_quantize_round_trips_on_the_digital_grid():
+    gain, offset = 0.015, -3.0
+    digital = np.array([DIGITAL_MIN, -5, 0, 7, DIGITAL_MAX], dtype=np.int16)
+    physical = digital * gain + offset
+    np.testing.assert_array_equal(_quantize(physical, gain, offset), digital)
+    # Out-of-range values saturate instead of wrapping around
+    assert _quantize(np.array([1e9, -1e9]), gain, offset).tolist() == [DIGITAL_MAX, DIGITAL_MIN]
+
+def test_compact_channels_match_the_float_reader(recording):
+    header = read_edf_header(recording['psg'])
+    for decimate in (False, True):
+        exact = read_psg_channels(recording['psg'], decimate=decimate, quality=True)
+        compact = read_compact_channels(recording['psg'], header, decimate=decimate, quality=True)
+        assert [ch['name'] for ch in compact] == [ch['name'] for ch in exact]
+        for a, b in zip(exact, compact):
+            assert b['digital'].dtype == np.int16
+            assert b['sfreq'] == a['sfreq']
+            assert channel_samples(b) == len(a['data'])
+            # Within one digital step (plus float32 rounding) of the float pipeline
+            np.testing.assert_allclose(channel_data(b), a['data'], atol=b['gain'] * 0.51 + 1e-3)
+            np.testing.assert_array_equal(b['quality'], a['quality'])
+
+def test_slices_share_the_int16_buffer(recording):
+    ch = read_compact_channels(recording['psg'], read_edf_header(recording['psg']), kinds=('eeg',))[0]
+    part = slice_channel(ch, 100, 200)
+    assert np.shares_memory(part['digital'], ch['digital'])
+    np.testing.assert_array_equal(channel_data(part), channel_data(ch)[100:200])
+
+def test_compact_mode_gives_the_same_features(recording, compact, monkeypatch):
+    features = extract_features_from_edf(recording['psg'], recording['hypnogram'])
+    monkeypatch.setattr(signals, 'SIGNAL_PIPELINE_MODE', 'float')
+    reference = extract_features_from_edf(recording['psg'], recording['hypnogram'])
+    numeric = [k for k, v in reference.items() if isinstance(v, float)]
+    assert numeric
+    for key in numeric:
+        assert features[key] == pytest.approx(reference[key], rel=1e-3, abs=1e-3), key
@@ -0,0 +1,59 @@
+import sqlite3
+from datetime import datetime
+import pytest
+from utils import database
+from utils.database import (
+    ANALYSIS_FEATURES, average_metrics, daily_analysis_volume, init_db, save_analysis, severity_distribution,
+)
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh database per test"""
+    path = str(tmp_path / 'users.db')
+    monkeypatch.setattr(database, 'DB_PATH', path)
+    init_db()
+    return path
+
+def _on(monkeypatch, day):
+    """Make save_analysis store analyses on the given day"""
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromisoformat(f'{day} 09:30:00')
+    monkeypatch.setattr(database, 'datetime', Clock)
+
+def _features(efficiency):
+    return dict({col: 10.0 for col in ANALYSIS_FEATURES}, sleep_efficiency_percent=efficiency)
+
+def test_empty_dashboard(db):
+    assert severity_distribution() == {'No Insomnia': 0, 'Mild': 0, 'Moderate': 0, 'Severe': 0}
+    assert daily_analysis_volume() == []
+    assert average_metrics() == (0, {})
+
+def test_summaries_match_the_stored_analyses(db, monkeypatch):
+    for day, severity, efficiency in [
+        ('2026-01-01', 'Mild', 80), ('2026-01-01', 'Mild', 70), ('2026-01-02', 'Severe', 50),
+        ('2026-01-03', 'No Insomnia', 95), ('2026-01-03', 'Mild', 85),
+    ]:
+        _on(monkeypatch, day)
+        assert save_analysis('ana', severity, _features(efficiency), upload_hash=f'{day}{efficiency}')
+
+    assert severity_distribution() == {'No Insomnia': 1, 'Mild': 3, 'Moderate': 0, 'Severe': 1}
+    assert daily_analysis_volume(days=2) == [
+        ('2026-01-02', 'Severe', 1), ('2026-01-03', 'Mild', 1), ('2026-01-03', 'No Insomnia', 1),
+    ]
+    total, means = average_metrics()
+    assert total == 5
+    assert means['sleep_efficiency_percent'] == pytest.approx(76)
+    assert means['total_sleep_time_min'] == pytest.approx(10)
+
+    conn = sqlite3.connect(db)
+    stored = conn.execute('SELECT COUNT(*), AVG(sleep_efficiency_percent) FROM analyses').fetchone()
+    conn.close()
+    assert stored == (5, pytest.approx(76))
+
+def test_missing_metrics_are_stored_as_zero(db):
+    assert save_analysis('ana', 'Moderate', {'total_sleep_time_min': 300})
+    _, means = average_metrics()
+    assert means['total_sleep_time_min'] == 300
+    assert means['rem_latency_min'] == 0
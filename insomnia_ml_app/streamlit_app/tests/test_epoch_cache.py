@@ -0,0 +1,64 @@
+import os
+import time
+import numpy as np
+import pytest
+from config import EPOCH_CACHE_DIR
+from utils import database
+from utils.database import analysis_history, average_metrics, init_db, save_analysis, severity_distribution, update_analyses
+from utils.epoch_cache import epoch_cache_path, load_epoch_matrix, prune_epoch_cache, save_epoch_matrix
+from utils.ml_pipeline import compute_stage_features
+from utils.sleep_architecture import stage_codes
+from tools.rescore_history import recording_features
+
+STAGES = ['W'] * 10 + ['N2'] * 50 + ['N3'] * 20 + ['REM'] * 20
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    for name in os.listdir(EPOCH_CACHE_DIR):
+        os.remove(os.path.join(EPOCH_CACHE_DIR, name))
+
+def test_round_trip():
+    X = np.random.default_rng(0).normal(size=(len(STAGES), 8))
+    good = np.arange(len(STAGES)) % 7 != 0
+    assert save_epoch_matrix('abc', stage_codes(STAGES), X, good, auto_staged=True)
+    matrix = load_epoch_matrix('abc')
+    assert matrix['auto_staged'] is True
+    np.testing.assert_array_equal(matrix['stages'], stage_codes(STAGES))
+    np.testing.assert_allclose(matrix['features'], X, rtol=1e-6)
+    np.testing.assert_array_equal(matrix['good'], good)
+
+def test_hypnogram_only_entry_has_no_features():
+    save_epoch_matrix('hyp', stage_codes(STAGES))
+    matrix = load_epoch_matrix('hyp')
+    assert 'features' not in matrix and matrix['auto_staged'] is False
+
+def test_missing_or_outdated_entries(monkeypatch):
+    assert load_epoch_matrix('nope') is None
+    save_epoch_matrix('old', stage_codes(STAGES))
+    monkeypatch.setattr('utils.epoch_cache.EPOCH_CACHE_VERSION', 2)
+    assert load_epoch_matrix('old') is None
+
+def test_prune_drops_expired_then_oldest_entries():
+    now = time.time()
+    for i, age_days in enumerate([400, 30, 20, 10]):
+        save_epoch_matrix(f'h{i}', stage_codes(STAGES))
+        os.utime(epoch_cache_path(f'h{i}'), (now - age_days * 86400,) * 2)
+    size = os.path.getsize(epoch_cache_path('h1'))
+    freed = prune_epoch_cache(quota_bytes=2 * size, ttl=180 * 86400)
+    assert freed > 0
+    assert [load_epoch_matrix(f'h{i}') is not None for i in range(4)] == [False, False, True, True]
+
+def test_rescoring_uses_the_cached_stages():
+    save_epoch_matrix('abc', stage_codes(STAGES))
+    assert recording_features('abc', restage=False) == compute_stage_features(STAGES)
+    assert recording_features('missing', restage=False) is None
+
+def test_update_analyses_rebuilds_the_summaries(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'users.db'))
+    init_db()
+    save_analysis('ana', 'Mild', {'sleep_efficiency_percent': 80}, upload_hash='a')
+    save_analysis('ana', 'Mild', {'sleep_efficiency_percent': 70}, upload_hash='b')
+    (first, _, _), _ = analysis_history()
+    assert update_analyses([(first, 'Severe', {'sleep_efficiency_percent': 40})])
+    assert severity_distribution() == {'No Insomnia': 0, 'Mild': 1, 'Moderate': 0, 'Severe': 1}
+    assert average_metrics()[1]['sleep_efficiency_percent'] == 55
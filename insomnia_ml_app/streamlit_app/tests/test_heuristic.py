@@ -0,0 +1,55 @@
+import itertools
+import numpy as np
+import pytest
+from utils.ml_pipeline import FEATURE_COLS, SEVERITY_LEVELS, heuristic_levels, predict_severity, predict_severity_batch
+from utils.explain import explain_prediction
+
+# Boundary values of every threshold, points between them, and missing values
+GRID = [np.nan, -1.0, -0.3, -0.1, 0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 1.0]
+
+def _chain(sol, waso, se):
+    """The original if/elif classifier the vectorized rules replaced"""
+    if se > 0.3 and sol < 0.2 and waso < 0.2:
+        return 0
+    elif se > 0 and sol < 0.5 and waso < 0.5:
+        return 1
+    elif se > -0.3:
+        return 2
+    return 3
+
+def _rows(values):
+    X = np.zeros((len(values), len(FEATURE_COLS)))
+    for column, feature in enumerate(('sleep_onset_latency_min', 'wake_after_sleep_onset_min',
+                                      'sleep_efficiency_percent')):
+        X[:, FEATURE_COLS.index(feature)] = [v[column] for v in values]
+    return X
+
+def test_vectorized_rules_match_the_original_chain():
+    values = list(itertools.product(GRID, repeat=3))
+    classes, probabilities = predict_severity_batch(_rows(values))
+    assert classes.tolist() == [_chain(*v) for v in values]
+    np.testing.assert_allclose(probabilities.sum(axis=1), 1)
+
+@pytest.mark.parametrize('values, severity', [
+    ((0.0, 0.0, np.nan), 'Severe'),
+    ((np.nan, 0.0, 1.0), 'Moderate'),
+    ((0.0, np.nan, 0.1), 'Moderate'),
+])
+def test_missing_values_score_like_the_original_chain(values, severity):
+    assert predict_severity(_rows([values]))[0] == severity
+
+def test_levels_per_rule():
+    levels = heuristic_levels(_rows([(0.3, 0.6, 0.1)]))
+    assert levels.tolist() == [[1, 2, 1]]
+
+def test_explanation_marks_the_decisive_rule():
+    rows = explain_prediction(_rows([(0.3, 0.6, 0.1)]), 'Moderate', {'wake_after_sleep_onset_min': 75.0})
+    assert [row[0] for row in rows][0] == 'Wake After Sleep Onset'
+    assert [row[2] for row in rows] == [True, False, False]
+    assert rows[0][1].startswith('75.0 min · +0.60 SD, not below +0.5 SD')
+    assert SEVERITY_LEVELS[2] in rows[0][1]
+
+def test_explanation_of_a_clean_night_has_no_decisive_rule():
+    rows = explain_prediction(_rows([(0.0, 0.0, 1.0)]), 'No Insomnia')
+    assert not any(row[2] for row in rows)
+    assert all('meets the No Insomnia threshold' in row[1] for row in rows)
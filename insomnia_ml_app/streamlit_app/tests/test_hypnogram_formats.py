@@ -0,0 +1,93 @@
+import pytest
+from utils.ml_pipeline import detect_hypnogram_format, read_sleep_stages, read_text_stages, read_xml_stages
+
+NSRR_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<PSGAnnotation>
+  <EpochLength>30</EpochLength>
+  <ScoredEvents>
+    <ScoredEvent>
+      <EventType>Stages|Stages</EventType>
+      <EventConcept>Wake|0</EventConcept>
+      <Start>0.0</Start>
+      <Duration>60.0</Duration>
+    </ScoredEvent>
+    <ScoredEvent>
+      <EventType>Respiratory|Respiratory</EventType>
+      <EventConcept>Hypopnea|Hypopnea</EventConcept>
+      <Start>45.0</Start>
+      <Duration>12.0</Duration>
+    </ScoredEvent>
+    <ScoredEvent>
+      <EventType>Stages|Stages</EventType>
+      <EventConcept>Stage 2 sleep|2</EventConcept>
+      <Start>60.0</Start>
+      <Duration>90.0</Duration>
+    </ScoredEvent>
+    <ScoredEvent>
+      <EventType>Stages|Stages</EventType>
+      <EventConcept>REM sleep|5</EventConcept>
+      <Start>210.0</Start>
+      <Duration>30.0</Duration>
+    </ScoredEvent>
+  </ScoredEvents>
+</PSGAnnotation>
+"""
+
+# Profusion exports start with a byte order mark
+PROFUSION_XML = """\ufeff<CMPStudyConfig>
+  <EpochLength>60</EpochLength>
+  <SleepStages>
+    <SleepStage>0</SleepStage>
+    <SleepStage>1</SleepStage>
+    <SleepStage>4</SleepStage>
+    <SleepStage>5</SleepStage>
+  </SleepStages>
+</CMPStudyConfig>
+"""
+
+def _write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+def test_detect_format(recording, tmp_path):
+    assert detect_hypnogram_format(recording['hypnogram']) == 'edf'
+    assert detect_hypnogram_format(_write(tmp_path, 'a.xml', NSRR_XML)) == 'xml'
+    assert detect_hypnogram_format(_write(tmp_path, 'b.xml', PROFUSION_XML)) == 'xml'
+    assert detect_hypnogram_format(_write(tmp_path, 'c.txt', 'W\nN1\n')) == 'text'
+    # Short text starting with "0" is not mistaken for an EDF header
+    assert detect_hypnogram_format(_write(tmp_path, 'd.txt', '0\n0\n1\n')) == 'text'
+
+@pytest.mark.parametrize('text', [
+    'W\nN1\nN2\nN3\nREM\n',
+    'epoch,stage\n1,W\n2,N1\n3,N2\n4,N3\n5,REM\n',
+    'stage\tonset\nWake\t0\nS1\t30\nS2\t60\nS4\t90\nR\t120\n',
+    'epoch;score\n1;0\n2;1\n3;2\n4;3\n5;5\n',
+    '# exported scoring\n0 0.0\n30 1.0\n60 2.0\n90 4.0\n120 5.0\n',
+    'Sleep stage W\nSleep stage 1\nSleep stage 2\nSleep stage 3\nSleep stage R\n',
+])
+def test_text_stage_lists(tmp_path, text):
+    stages = read_text_stages(_write(tmp_path, 'stages.txt', text))
+    assert stages == ['W', 'N1', 'N2', 'N3', 'REM']
+
+def test_unknown_text_labels(tmp_path):
+    stages = read_text_stages(_write(tmp_path, 'stages.csv', 'W\nMOVE\n9\nN2\n'))
+    assert stages == ['W', 'UNKNOWN', 'UNKNOWN', 'N2']
+
+def test_nsrr_events_are_placed_at_their_start(tmp_path):
+    stages = read_xml_stages(_write(tmp_path, 'nsrr.xml', NSRR_XML))
+    # The respiratory event is ignored; the unscored gap at 150-210 s stays UNKNOWN
+    assert stages == ['W', 'W', 'N2', 'N2', 'N2', 'UNKNOWN', 'UNKNOWN', 'REM']
+
+def test_profusion_epochs_are_split_into_30_s_epochs(tmp_path):
+    stages = read_xml_stages(_write(tmp_path, 'profusion.xml', PROFUSION_XML))
+    assert stages == ['W', 'W', 'N1', 'N1', 'N3', 'N3', 'REM', 'REM']
+
+def test_xml_without_stages(tmp_path):
+    with pytest.raises(ValueError):
+        read_xml_stages(_write(tmp_path, 'empty.xml', '<PSGAnnotation><ScoredEvents/></PSGAnnotation>'))
+
+def test_read_sleep_stages_dispatches_on_format(recording, tmp_path):
+    assert read_sleep_stages(recording['hypnogram']) == recording['stages']
+    assert read_sleep_stages(_write(tmp_path, 'nsrr.xml', NSRR_XML))[:2] == ['W', 'W']
+    assert read_sleep_stages(_write(tmp_path, 'stages.tsv', 'stage\nW\nN2\n')) == ['W', 'N2']
@@ -0,0 +1,36 @@
+"""Smoke test: one simulated user journey through main.py with the load-test harness"""
+import os
+import shutil
+import streamlit as st
+import pytest
+from config import UPLOADS_DIR
+from tools import load_test
+from tools.synthetic_edf import synthetic_stages, write_psg, write_hypnogram
+from utils.database import init_db, register_user
+
+@pytest.fixture(autouse=True, scope='module')
+def work_dir():
+    """Remove the scratch directory load_test creates on import"""
+    yield
+    shutil.rmtree(load_test.WORK_DIR, ignore_errors=True)
+
+def test_synthetic_stages_start_awake():
+    stages = synthetic_stages(1)
+    assert len(stages) == 120
+    assert stages[:10] == ['W'] * 10
+    assert set(stages[10:]) == {'N1', 'N2', 'N3', 'REM'}
+
+@pytest.mark.parametrize('with_hypnogram', [False, True])
+def test_session_journey(tmp_path, monkeypatch, with_hypnogram):
+    stages = synthetic_stages(0.5)
+    uploads = {'psg_upload': write_psg(str(tmp_path / 'psg.edf'), stages)}
+    if with_hypnogram:
+        uploads['hypno_upload'] = write_hypnogram(str(tmp_path / 'hypno.edf'), stages)
+    init_db()
+    register_user('smoke', 'smoke@example.com', load_test.PASSWORD)
+    monkeypatch.setattr(st, 'file_uploader', load_test._fake_file_uploader)
+
+    timings = load_test.run_session('smoke', uploads, timeout=120)
+    assert set(timings) == set(load_test.STEPS)
+    assert timings['session'] >= timings['analyze'] > 0
+    assert os.path.exists(os.path.join(UPLOADS_DIR, 'report_smoke.pdf'))
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from utils.ml_pipeline import analyze_nights, compute_stage_features, predict_night_severities, sleep_periods
+from utils.sleep_architecture import SLEEP_ONSET_WINDOW_EPOCHS, split_sleep_periods, stage_codes
+
+def _stages(*runs):
+    return [label for label, n in runs for _ in range(n)]
+
+NIGHT = _stages(('N1', 20), ('N2', 500), ('N3', 200), ('REM', 180))
+# 30 min to fall asleep, 7.5 h of sleep, 12.5 h awake, 6.7 h of sleep
+TWO_NIGHTS = _stages(('W', 60), ('N2', 900), ('W', 1500), ('N2', 800), ('W', 100))
+
+def test_single_recordings_are_one_period():
+    stages = _stages(('W', 60)) + NIGHT
+    assert split_sleep_periods(stage_codes(stages)) == [(0, len(stages))]
+    assert sleep_periods(stages) is None
+
+def test_nights_are_split_at_long_wake():
+    periods = split_sleep_periods(stage_codes(TWO_NIGHTS))
+    assert periods == [(0, 960), (2460 - SLEEP_ONSET_WINDOW_EPOCHS, 3260)]
+
+def test_naps_and_short_awakenings_do_not_make_nights():
+    stages = _stages(('W', 100), ('N2', 800), ('W', 300), ('N2', 200), ('W', 1000), ('N2', 100), ('W', 1000))
+    # The 150 min awakening stays inside the night; the 50 min nap is dropped
+    assert split_sleep_periods(stage_codes(stages)) == [(0, 1400)]
+
+def test_onset_latency_is_capped_per_night():
+    features = compute_stage_features(TWO_NIGHTS)
+    assert features['num_nights'] == 2
+    latencies = [night['sleep_onset_latency_min'] for night in features['nights']]
+    assert latencies == [30, SLEEP_ONSET_WINDOW_EPOCHS / 2]
+    assert features['sleep_onset_latency_min'] == np.mean(latencies)
+    assert [night['night'] for night in features['nights']] == [1, 2]
+
+def test_nights_are_analyzed_separately_and_in_order():
+    sfreq = 4
+    t = np.arange(len(TWO_NIGHTS) * 30 * sfreq) / sfreq
+    # Breathing at 15/min in the first night, 18/min afterwards
+    resp = 100 * np.sin(2 * np.pi * np.where(t < 1500 * 30, 0.25, 0.3) * t)
+    channels = [{'name': 'Resp', 'kind': 'resp', 'sfreq': sfreq, 'data': resp}]
+    periods = split_sleep_periods(stage_codes(TWO_NIGHTS))
+    nights = analyze_nights(channels, TWO_NIGHTS, periods)
+    assert [n['night'] for n in nights] == [1, 2]
+    assert [n['start_min'] for n in nights] == [start * 0.5 for start, _ in periods]
+    assert nights[0]['resp_rate_bpm'] == pytest.approx(15, abs=0.5)
+    assert nights[1]['resp_rate_bpm'] == pytest.approx(18, abs=0.5)
+
+def test_each_night_gets_its_own_severity():
+    severities = predict_night_severities(compute_stage_features(TWO_NIGHTS)['nights'])
+    assert len(severities) == 2
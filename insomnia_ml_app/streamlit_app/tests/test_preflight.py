@@ -0,0 +1,69 @@
+import numpy as np
+from utils.ml_pipeline import read_edf_header, preflight_edf_pair
+
+# Byte offsets in the EDF fixed header and the first signal label
+START_TIME = (176, 184)
+FIRST_LABEL = (256, 272)
+
+def _copy(path, tmp_path, name, edit=None, truncate=0):
+    data = bytearray(open(path, 'rb').read())
+    if edit:
+        for (start, stop), value in edit.items():
+            data[start:stop] = value.ljust(stop - start)
+    if truncate:
+        data = data[:-truncate]
+    out = tmp_path / name
+    out.write_bytes(bytes(data))
+    return str(out)
+
+def test_header(recording):
+    header = read_edf_header(recording['psg'])
+    assert header['n_signals'] == 5
+    assert header['labels'][0] == 'EEG Fpz-Cz'
+    assert header['n_records'] == len(recording['stages'])
+    assert header['duration_sec'] == 30 * len(recording['stages'])
+    assert header['start'].hour == 22
+    assert not header['edf_plus']
+    assert read_edf_header(recording['hypnogram'])['edf_plus']
+
+def test_matching_pair_passes(recording):
+    assert preflight_edf_pair(recording['psg'], recording['hypnogram']) == (True, "OK")
+    assert preflight_edf_pair(recording['psg']) == (True, "OK")
+
+def test_truncated_psg(recording, tmp_path):
+    psg = _copy(recording['psg'], tmp_path, 'psg.edf', truncate=1000)
+    ok, message = preflight_edf_pair(psg, recording['hypnogram'])
+    assert not ok and 'truncated' in message
+
+def test_not_an_edf_file(tmp_path):
+    path = tmp_path / 'notes.edf'
+    path.write_bytes(b'hello' * 100)
+    ok, message = preflight_edf_pair(str(path))
+    assert not ok and message.startswith('PSG file:')
+
+def test_swapped_uploads(recording):
+    ok, message = preflight_edf_pair(recording['hypnogram'], recording['psg'])
+    assert not ok and 'only annotations' in message
+
+def test_psg_in_the_hypnogram_slot(recording):
+    ok, message = preflight_edf_pair(recording['psg'], recording['psg'])
+    assert not ok and 'swap' in message
+
+def test_auto_staging_needs_eeg(recording, tmp_path):
+    psg = _copy(recording['psg'], tmp_path, 'psg.edf', edit={FIRST_LABEL: b'Channel 1'})
+    ok, message = preflight_edf_pair(psg)
+    assert not ok and 'EEG' in message
+    # A scored hypnogram makes the EEG channel optional
+    assert preflight_edf_pair(psg, recording['hypnogram'])[0]
+
+def test_start_times_must_match(recording, tmp_path):
+    hypnogram = _copy(recording['hypnogram'], tmp_path, 'hyp.edf', edit={START_TIME: b'23.30.00'})
+    ok, message = preflight_edf_pair(recording['psg'], hypnogram)
+    assert not ok and 'same recording' in message
+    close = _copy(recording['hypnogram'], tmp_path, 'close.edf', edit={START_TIME: b'22.00.30'})
+    assert preflight_edf_pair(recording['psg'], close)[0]
+
+def test_text_hypnograms_skip_the_edf_checks(recording, tmp_path):
+    path = tmp_path / 'stages.txt'
+    path.write_text('\n'.join(np.array(recording['stages'])))
+    assert preflight_edf_pair(recording['psg'], str(path)) == (True, "OK")
@@ -0,0 +1,70 @@
+import os
+import time
+import threading
+import xml.etree.ElementTree as ET
+from collections import Counter
+import pytest
+from config import PROFILE_DIR
+from utils import profiling
+from utils.profiling import (
+    AttributedThreadPoolExecutor, SamplingProfiler, flame_graph_svg, function_stats, profiled, profiling_enabled,
+)
+
+def _spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def test_profiling_is_opt_in_for_admins(monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_ENABLED', False)
+    monkeypatch.setattr(profiling, 'ADMIN_USERS', {'admin'})
+    assert profiling_enabled({'profile': '1'}, 'admin')
+    assert profiling_enabled({'profile': ['true']}, 'admin')
+    assert not profiling_enabled({}, 'admin')
+    assert not profiling_enabled({'profile': '1'}, 'patient')
+    assert not profiling_enabled({'profile': '1'}, None)
+    monkeypatch.setattr(profiling, 'PROFILE_ENABLED', True)
+    assert profiling_enabled(None, None)
+
+def test_function_stats():
+    own, cumulative = function_stats(Counter({'main;a;b': 3, 'main;a': 2, 'main;c;a': 1}))
+    assert own == {'b': 3, 'a': 3}
+    assert cumulative == {'main': 6, 'a': 6, 'b': 3, 'c': 1}
+
+def test_flame_graph_is_valid_svg():
+    svg = flame_graph_svg(Counter({'main;<lambda>;b': 3, 'main;c': 1}), 'rerun & co')
+    root = ET.fromstring(svg)
+    titles = [t.text for t in root.iter('{http://www.w3.org/2000/svg}title')]
+    assert any(t.startswith('<lambda>') for t in titles)
+    assert any(t.startswith('all – 4 samples') for t in titles)
+
+def _unrelated():
+    _spin(0.3)
+
+def test_pool_work_is_attributed_to_the_submitting_thread():
+    pool = AttributedThreadPoolExecutor(max_workers=1)
+    other = threading.Thread(target=_unrelated)
+    other.start()
+    profiler = SamplingProfiler(interval=0.002).start()
+    pool.submit(_spin, 0.2).result()
+    profiler.stop()
+    other.join()
+    pool.shutdown()
+    stacks = ';'.join(profiler.stacks)
+    assert '_run_for' in stacks and '_spin' in stacks
+    assert '_unrelated' not in stacks
+
+def test_profiled_block_writes_its_reports():
+    with profiled('unit_test_step', True):
+        _spin(0.05)
+    with profiled('unit_test_step', True):
+        _spin(0.05)
+    base = os.path.join(PROFILE_DIR, 'unit_test_step')
+    assert open(f'{base}.txt').readline().startswith('unit_test_step: 2 runs')
+    assert '_spin' in open(f'{base}.folded').read()
+    ET.parse(f'{base}.svg')
+
+def test_disabled_profiling_does_nothing():
+    with profiled('unit_test_disabled', False):
+        pass
+    assert not os.path.exists(os.path.join(PROFILE_DIR, 'unit_test_disabled.txt'))
@@ -0,0 +1,51 @@
+import pytest
+from utils.ml_pipeline import extract_features_from_edf
+from utils.progress import AnalysisCancelled, CancellationToken, check_cancelled, progress_range, report
+
+def test_report_clamps_fractions():
+    calls = []
+    report(lambda fraction, text: calls.append((fraction, text)), 1.5, 'done')
+    report(lambda fraction, text: calls.append((fraction, text)), -0.1, 'start')
+    report(None, 0.5, 'ignored')
+    assert calls == [(1.0, 'done'), (0.0, 'start')]
+
+def test_progress_range_maps_onto_the_parent_span():
+    calls = []
+    child = progress_range(lambda fraction, text: calls.append(fraction), 0.2, 0.6)
+    child(0, '')
+    child(0.5, '')
+    child(1, '')
+    assert calls == pytest.approx([0.2, 0.4, 0.6])
+    assert progress_range(None, 0, 1) is None
+
+def test_cancellation_token():
+    token = CancellationToken()
+    check_cancelled(token)
+    check_cancelled(None)
+    token.cancel()
+    assert token.cancelled
+    with pytest.raises(AnalysisCancelled):
+        check_cancelled(token)
+
+def test_analysis_progress_is_monotonic(recording):
+    calls = []
+    features = extract_features_from_edf(recording['psg'], recording['hypnogram'],
+                                         progress=lambda fraction, text: calls.append((fraction, text)))
+    assert features is not None
+    fractions = [fraction for fraction, _ in calls]
+    assert fractions == sorted(fractions)
+    assert fractions[-1] == 1
+    assert len(calls) > 5
+
+def test_analysis_stops_once_cancelled(recording):
+    token = CancellationToken()
+    calls = []
+
+    def progress(fraction, text):
+        calls.append(fraction)
+        if fraction > 0.3:
+            token.cancel()
+
+    with pytest.raises(AnalysisCancelled):
+        extract_features_from_edf(recording['psg'], progress=progress, cancel=token)
+    assert max(calls) < 1
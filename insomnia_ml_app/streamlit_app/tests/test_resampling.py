@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from utils.resampling import StreamingDecimator, decimate_signal, decimation_factor
+
+def _tone(freq, sfreq, n):
+    return np.sin(2 * np.pi * freq * np.arange(n) / sfreq)
+
+@pytest.mark.parametrize('sfreq, target, q', [
+    (256, 100, 2), (512, 100, 5), (100, 100, 1), (100, 200, 1), (100, None, 1), (1000, 64, 15),
+])
+def test_decimation_factor_keeps_at_least_the_target_rate(sfreq, target, q):
+    assert decimation_factor(sfreq, target) == q
+
+@pytest.mark.parametrize('n', [1000, 1001, 1003, 37])
+def test_output_length_is_one_sample_per_q_inputs(n):
+    out, sfreq = decimate_signal(np.random.default_rng(0).normal(size=n), 400, 100)
+    assert sfreq == 100
+    assert len(out) == -(-n // 4)
+
+@pytest.mark.parametrize('chunk', [1, 7, 100, 999, 5000])
+def test_chunked_output_matches_one_pass(chunk):
+    data = np.random.default_rng(1).normal(size=4000)
+    whole, _ = decimate_signal(data, 500, 100, chunk_samples=len(data))
+    chunked, _ = decimate_signal(data, 500, 100, chunk_samples=chunk)
+    np.testing.assert_allclose(chunked, whole, atol=1e-12)
+
+def test_output_is_aligned_with_the_input_samples():
+    # A tone well inside the passband must come out in phase with data[::q]
+    data = _tone(1, 1000, 20000)
+    out, _ = decimate_signal(data, 1000, 100)
+    core = slice(50, -50)
+    np.testing.assert_allclose(out[core], data[::10][core], atol=0.01)
+
+def test_tones_above_the_new_nyquist_are_removed():
+    data = _tone(70, 1000, 20000)
+    out, _ = decimate_signal(data, 1000, 100)
+    assert np.abs(out[50:-50]).max() < 0.01
+
+def test_no_decimation_passes_data_through():
+    decimator = StreamingDecimator(1)
+    data = np.arange(5.0)
+    np.testing.assert_array_equal(decimator.process(data), data)
+    assert decimator.flush().size == 0
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from config import CHAT_HISTORY_MAX
+from utils import session_store
+from utils.session_store import (
+    analysis_payload, compact_analysis, estimate_size, get_payload, new_chat_history, put_payload,
+)
+
+def test_chat_history_keeps_the_latest_messages():
+    history = new_chat_history({'n': i} for i in range(CHAT_HISTORY_MAX + 5))
+    assert len(history) == CHAT_HISTORY_MAX
+    assert history[0] == {'n': 5}
+
+def test_estimate_size_counts_array_buffers_once():
+    data = np.zeros(100_000)
+    assert data.nbytes <= estimate_size(data) < data.nbytes + 1000
+    # A view shares its base's buffer; the same array twice is counted once
+    assert estimate_size({'a': data, 'b': data[:10]}) < 2 * data.nbytes
+    assert estimate_size([data, data]) < 2 * data.nbytes
+
+def test_compact_analysis_moves_large_values_out_of_the_record():
+    stages = np.array(['W', 'N2'] * 100)
+    record = compact_analysis(
+        'Mild', {'sleep_efficiency_percent': np.float64(85.5), 'channel_timings_ms': {'EEG': 3.0}},
+        np.array([0.1, 0.6, 0.2, 0.1]), sleep_stages=stages, note='ok',
+    )
+    assert record['features'] == {'sleep_efficiency_percent': 85.5}
+    assert type(record['features']['sleep_efficiency_percent']) is float
+    assert record['probabilities'] == (0.1, 0.6, 0.2, 0.1)
+    assert record['note'] == 'ok'
+    payload = analysis_payload(record)
+    assert payload['channel_timings_ms'] == {'EEG': 3.0}
+    assert payload['sleep_stages'] is stages
+
+def test_scalar_only_analysis_has_no_payload():
+    record = compact_analysis('Severe', {'total_sleep_time_min': 300}, [0, 0, 0, 1])
+    assert record['payload_key'] is None
+    assert analysis_payload(record) == {}
+    assert analysis_payload(None) == {}
+
+def test_payload_store_evicts_least_recently_used(monkeypatch):
+    size = estimate_size({'data': np.zeros(1000)})
+    monkeypatch.setattr(session_store, 'SHARED_PAYLOAD_BUDGET_BYTES', int(2.5 * size))
+    keys = [put_payload({'data': np.zeros(1000)}) for _ in range(2)]
+    get_payload(keys[0])
+    keys.append(put_payload({'data': np.zeros(1000)}))
+    assert get_payload(keys[1]) == {}
+    assert get_payload(keys[0]) and get_payload(keys[2])
+
+def test_oversized_payload_is_kept_until_the_next_one(monkeypatch):
+    monkeypatch.setattr(session_store, 'SHARED_PAYLOAD_BUDGET_BYTES', 10)
+    key = put_payload({'data': np.zeros(1000)})
+    assert get_payload(key)
+    put_payload({'data': np.zeros(10)})
+    assert get_payload(key) == {}
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from utils.signals import channel_kind, epoch_band_powers, EEG_BANDS
+from utils.signal_features import extract_signal_features, _run_channel
+from utils.progress import AnalysisCancelled, CancellationToken
+
+SFREQ = 100
+
+def _sine(freq, minutes=10, amp=50.0, seed=0):
+    t = np.arange(int(minutes * 60 * SFREQ)) / SFREQ
+    noise = np.random.default_rng(seed).normal(0, 1, t.size)
+    return amp * np.sin(2 * np.pi * freq * t) + noise
+
+def _channels():
+    return [
+        {'name': 'EEG Fpz-Cz', 'kind': 'eeg', 'sfreq': SFREQ, 'data': _sine(10)},
+        {'name': 'EEG Pz-Oz', 'kind': 'eeg', 'sfreq': SFREQ, 'data': _sine(2, seed=1)},
+        {'name': 'EOG horizontal', 'kind': 'eog', 'sfreq': SFREQ, 'data': _sine(0.5, amp=20)},
+        {'name': 'ECG', 'kind': 'ecg', 'sfreq': SFREQ, 'data': _sine(1.2)},
+    ]
+
+@pytest.mark.parametrize('label, kind', [
+    ('EEG Fpz-Cz', 'eeg'), ('O2-A1', 'eeg'), ('SpO2', 'spo2'), ('SaO2 finger', 'spo2'),
+    ('EOG horizontal', 'eog'), ('EMG submental', 'emg'), ('ECG II', 'ecg'),
+    ('Resp oro-nasal', 'resp'), ('Event marker', 'other'),
+])
+def test_channel_kind(label, kind):
+    assert channel_kind(label) == kind
+
+def test_band_powers_peak_in_the_signal_band():
+    powers = epoch_band_powers(_sine(10).reshape(-1, 30 * SFREQ), SFREQ)
+    assert powers.shape == (20, len(EEG_BANDS) + 1)
+    assert np.all(powers[:, :-1].argmax(axis=1) == list(EEG_BANDS).index('alpha'))
+
+def test_parallel_features_match_serial():
+    channels = _channels()
+    features, timings = extract_signal_features(channels)
+    serial = {}
+    for ch in channels[:3]:
+        serial.update(_run_channel(ch)[0])
+    assert features == serial
+    # Channels without an extractor are skipped
+    assert set(timings) == {'EEG Fpz-Cz', 'EEG Pz-Oz', 'EOG horizontal'}
+    assert features['eeg_fpz_cz_alpha_rel'] > 0.9
+    assert features['eeg_pz_oz_delta_rel'] > 0.9
+
+def test_flagged_epochs_are_left_out():
+    data = _sine(2)
+    data[:30 * SFREQ] = _sine(10, minutes=0.5)
+    ch = {'name': 'EEG C3', 'kind': 'eeg', 'sfreq': SFREQ, 'data': data}
+    flags = np.zeros(20, dtype=np.uint8)
+    flags[0] = 1
+    mixed, _ = _run_channel(ch)
+    clean, _ = _run_channel(dict(ch, quality=flags))
+    assert clean['eeg_c3_alpha_rel'] < mixed['eeg_c3_alpha_rel']
+    assert clean['eeg_c3_delta_rel'] > 0.9
+
+def test_progress_reports_every_channel():
+    calls = []
+    extract_signal_features(_channels(), progress=lambda fraction, text: calls.append(fraction))
+    assert calls == pytest.approx([1 / 3, 2 / 3, 1])
+
+def test_cancelled_before_start():
+    token = CancellationToken()
+    token.cancel()
+    with pytest.raises(AnalysisCancelled):
+        extract_signal_features(_channels(), cancel=token)
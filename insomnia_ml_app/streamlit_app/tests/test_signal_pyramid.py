@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from config import PYRAMID_FACTOR, VIEWER_MAX_POINTS
+from utils.signal_pyramid import build_pyramid, pyramid_available, query_pyramid, query_stages
+
+SFREQ = 100
+N = 3600 * SFREQ
+
+@pytest.fixture(scope='module')
+def signal():
+    rng = np.random.default_rng(0)
+    data = np.cumsum(rng.normal(size=N)).astype(np.float32)
+    # A spike far outside float16's range must survive storage
+    data[123_457] = 250_000
+    return data
+
+@pytest.fixture(scope='module')
+def pyramid(signal, tmp_path_factory):
+    channels = [{'name': 'EEG C3', 'kind': 'eeg', 'sfreq': SFREQ, 'data': signal}]
+    path = str(tmp_path_factory.mktemp('pyramid') / 'signals.npy')
+    return build_pyramid(channels, np.zeros(120, dtype=np.int8), path)
+
+def test_metadata(pyramid):
+    assert pyramid_available(pyramid)
+    assert pyramid['duration_sec'] == 3600
+    levels = pyramid['channels'][0]['levels']
+    assert levels[0] == {'offset': 0, 'length': N, 'bucket': 1}
+    assert [lv['bucket'] for lv in levels] == [PYRAMID_FACTOR ** k for k in range(len(levels))]
+    assert levels[-1]['length'] <= 2 * VIEWER_MAX_POINTS
+
+def test_short_window_returns_raw_samples(pyramid, signal):
+    window = query_pyramid(pyramid, 0, 1234.5, 1244.5)
+    assert window['exact']
+    np.testing.assert_array_equal(window['lo'], signal[123_450:123_450 + 1000])
+    assert window['time_sec'][0] == 1234.5
+    assert window['hi'].max() == 250_000
+
+@pytest.mark.parametrize('start, end', [(0, 3600), (600, 1800), (1000, 1300.7)])
+def test_envelope_covers_every_sample(pyramid, signal, start, end):
+    window = query_pyramid(pyramid, 0, start, end)
+    assert len(window['lo']) <= VIEWER_MAX_POINTS + 1
+    first, last = int(start * SFREQ), int(np.ceil(end * SFREQ))
+    if not window['exact']:
+        bucket = int(round((window['time_sec'][1] - window['time_sec'][0]) * SFREQ))
+        i0 = int(round(window['time_sec'][0] * SFREQ))
+        blocks = signal[i0:i0 + bucket * len(window['lo'])]
+        blocks = np.pad(blocks, (0, -len(blocks) % bucket), mode='edge').reshape(-1, bucket)
+        np.testing.assert_array_equal(window['lo'], blocks.min(axis=1))
+        np.testing.assert_array_equal(window['hi'], blocks.max(axis=1))
+    assert window['lo'].min() <= signal[first:last].min()
+    assert window['hi'].max() >= signal[first:last].max()
+    assert np.isfinite(window['hi']).all()
+
+def test_stage_window(pyramid):
+    times, stages = query_stages(pyramid, 45, 125)
+    assert times.tolist() == [30, 60, 90, 120]
+    assert len(stages) == 4
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from utils.signal_quality import (
+    FLAT, SATURATED, LINE_NOISE, HIGH_AMPLITUDE, ELECTRODE_POP,
+    EpochQualityChecker, epoch_mask, epoch_quality_flags, quality_summary,
+)
+
+SFREQ = 256
+T = np.arange(30 * SFREQ) / SFREQ
+
+def _eeg(seed=0):
+    """Plausible clean EEG epoch: 10 Hz rhythm plus broadband noise, in µV"""
+    return 20 * np.sin(2 * np.pi * 10 * T) + np.random.default_rng(seed).normal(0, 10, T.size)
+
+def _flags(epoch, kind='eeg'):
+    return int(epoch_quality_flags(epoch[None, :], kind, SFREQ)[0])
+
+def test_clean_epoch():
+    assert _flags(_eeg()) == 0
+
+@pytest.mark.parametrize('make, flag', [
+    (lambda: np.full(T.size, 3.0) + np.random.default_rng(0).normal(0, 0.1, T.size), FLAT),
+    (lambda: np.clip(_eeg() * 5, -60, 60), SATURATED),
+    (lambda: _eeg() + 80 * np.sin(2 * np.pi * 50 * T), LINE_NOISE),
+    (lambda: _eeg() + 500 * np.sin(2 * np.pi * 0.5 * T), HIGH_AMPLITUDE),
+    (lambda: _eeg() + np.where(T > 15, 400, 0), ELECTRODE_POP),
+])
+def test_artifacts_set_their_flag(make, flag):
+    assert _flags(make()) & flag
+
+def test_mains_detection_needs_a_high_enough_rate():
+    epochs = (_eeg() + 80 * np.sin(2 * np.pi * 50 * T))[None, :]
+    assert epoch_quality_flags(epochs[:, ::4], 'eeg', SFREQ / 4)[0] & LINE_NOISE == 0
+
+def test_unchecked_kinds_are_never_flagged():
+    assert _flags(np.zeros(T.size), kind='resp') == 0
+
+def test_streaming_checker_matches_one_pass():
+    data = np.concatenate([_eeg(i) for i in range(6)])
+    data[2 * T.size:3 * T.size] = 0
+    checker = EpochQualityChecker('eeg', SFREQ)
+    for start in range(0, data.size, 10_007):
+        checker.process(data[start:start + 10_007])
+    expected = epoch_quality_flags(data.reshape(6, -1), 'eeg', SFREQ)
+    np.testing.assert_array_equal(checker.result(), expected)
+    assert checker.result()[2] & FLAT
+
+def test_mask_and_summary():
+    channels = [
+        {'name': 'EEG C3', 'kind': 'eeg', 'quality': np.array([0, FLAT, 0, 0], dtype=np.uint8)},
+        {'name': 'EOG', 'kind': 'eog', 'quality': np.array([0, 0, 0, LINE_NOISE | SATURATED], dtype=np.uint8)},
+        {'name': 'Resp', 'kind': 'resp', 'quality': np.array([1, 1, 1, 1], dtype=np.uint8)},
+    ]
+    assert epoch_mask(channels).tolist() == [False, False, False, False]
+    assert epoch_mask(channels, kinds=('eeg',)).tolist() == [True, False, True, True]
+    assert epoch_mask(channels, kinds=('eeg',), n_epochs=6).tolist() == [True, False, True, True, True, True]
+    summary = quality_summary(channels)
+    assert summary['good_epochs_percent'] == 50
+    assert [row['channel'] for row in summary['channels']] == ['EEG C3', 'EOG']
+    assert summary['channels'][1]['line_noise_percent'] == 25
+    assert summary['channels'][1]['bad_percent'] == 25
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from sklearn.neighbors import KDTree
+from utils import database, similarity
+from utils.database import init_db, save_analysis
+from utils.ml_pipeline import FEATURE_COLS, load_scaler
+from utils.similarity import _hash_keys, _nearest_recordings, find_similar_analyses, rebuild_similarity_index
+
+def _entries(vectors, hashes):
+    vectors = np.asarray(vectors, dtype=float).reshape(len(hashes), 1)
+    return {'ids': np.arange(len(hashes)), 'hashes': _hash_keys(hashes), 'vectors': vectors}
+
+def _tree(vectors, hashes):
+    entries = _entries(vectors, hashes)
+    return dict(entries, tree=KDTree(entries['vectors']) if len(hashes) else None)
+
+def test_repeated_analyses_count_as_one_recording():
+    # 20 analyses of recording 'a' crowd the query; b, c and d are farther away
+    hashes = ['a'] * 20 + ['b', 'c', 'd']
+    vectors = [[0.01 * i] for i in range(20)] + [[1.0], [2.0], [3.0]]
+    found = _nearest_recordings(_tree(vectors, hashes), _entries([], []), np.array([[0.0]]), 3, None)
+    keys = [entries['hashes'][p] for _, entries, p in found]
+    assert keys == list(_hash_keys(['a', 'b', 'c']))
+    assert [d for d, _, _ in found] == [0.0, 1.0, 2.0]
+
+def test_excluded_recording_is_skipped():
+    hashes = ['self'] * 10 + ['b', 'c']
+    vectors = [[0.0]] * 10 + [[1.0], [2.0]]
+    found = _nearest_recordings(_tree(vectors, hashes), _entries([], []), np.array([[0.0]]), 5,
+                                _hash_keys(['self'])[0])
+    assert [d for d, _, _ in found] == [1.0, 2.0]
+
+def test_pending_analyses_compete_with_the_tree():
+    index = _tree([[1.0], [3.0]], ['a', 'b'])
+    pending = _entries([[2.0], [0.5]], ['c', 'a'])
+    found = _nearest_recordings(index, pending, np.array([[0.0]]), 3, None)
+    assert [(d, entries is pending) for d, entries, _ in found] == [(0.5, True), (2.0, True), (3.0, False)]
+
+@pytest.fixture
+def fresh_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'users.db'))
+    monkeypatch.setattr(similarity, '_index', None)
+    monkeypatch.setattr(similarity, '_delta', None)
+    monkeypatch.setattr(similarity, 'SIMILARITY_REFRESH_SEC', 0)
+    init_db()
+
+def _night(efficiency):
+    return dict({col: 20.0 for col in FEATURE_COLS}, sleep_efficiency_percent=efficiency, total_sleep_time_min=400.0)
+
+def _query(efficiency):
+    features = _night(efficiency)
+    return load_scaler().transform(np.array([[features[col] for col in FEATURE_COLS]]))
+
+def test_search_over_stored_analyses(fresh_index):
+    assert find_similar_analyses(_query(80), 2) is None
+    for i in range(5):
+        save_analysis('ana', 'Mild', _night(80), upload_hash='same')
+    save_analysis('ana', 'Moderate', _night(70), upload_hash='other')
+    rebuild_similarity_index(wait=True)
+
+    results = find_similar_analyses(_query(80), 2)
+    assert [r['severity'] for r in results] == ['Mild', 'Moderate']
+    assert results[0]['distance'] == pytest.approx(0, abs=1e-9)
+    assert results[0]['sleep_efficiency_percent'] == pytest.approx(80)
+
+    # Analyses stored after the build are found through the delta buffer
+    save_analysis('bo', 'Severe', _night(79), upload_hash='new')
+    results = find_similar_analyses(_query(80), 3, exclude_hash='same')
+    assert [r['severity'] for r in results] == ['Severe', 'Moderate']
@@ -0,0 +1,71 @@
+import numpy as np
+from utils.sleep_architecture import (
+    W, N1, N2, N3, REM, UNKNOWN, stage_codes, run_length_encode, stage_transition_matrix,
+    detect_sleep_cycles, compute_architecture_metrics,
+)
+
+def _stages(*runs):
+    """Label sequence from (label, epochs) runs"""
+    return [label for label, n in runs for _ in range(n)]
+
+def test_stage_codes_maps_unknown_labels():
+    codes = stage_codes(['W', 'N2', 'REM', 'MOVE', 'N3'])
+    assert codes.tolist() == [W, N2, REM, UNKNOWN, N3]
+
+def test_run_length_encode():
+    values, starts, lengths = run_length_encode([1, 1, 2, 2, 2, 1])
+    assert values.tolist() == [1, 2, 1]
+    assert starts.tolist() == [0, 2, 5]
+    assert lengths.tolist() == [2, 3, 1]
+
+def test_run_length_encode_empty():
+    values, starts, lengths = run_length_encode([])
+    assert values.size == starts.size == lengths.size == 0
+
+def test_transition_matrix_counts_run_boundaries():
+    values, _, _ = run_length_encode(stage_codes(_stages(('W', 3), ('N1', 2), ('N2', 5), ('W', 1), ('N2', 4))))
+    transitions = stage_transition_matrix(values)
+    assert transitions.sum() == 4
+    assert transitions[W, N1] == 1 and transitions[N1, N2] == 1
+    assert transitions[N2, W] == 1 and transitions[W, N2] == 1
+
+def test_cycles_need_enough_nrem_before_rem():
+    # Two 40-epoch NREM runs lead into REM; after a long wake gap, 10 NREM epochs do not
+    codes = stage_codes(_stages(
+        ('N2', 40), ('REM', 10), ('N2', 40), ('REM', 10), ('W', 30), ('N2', 10), ('REM', 10),
+    ))
+    starts, ends = detect_sleep_cycles(codes)
+    assert starts.tolist() == [0, 50]
+    assert ends.tolist() == [50, 100]
+
+def test_close_rem_episodes_merge_into_one_period():
+    codes = stage_codes(_stages(('N2', 40), ('REM', 5), ('N1', 10), ('REM', 5), ('N2', 40), ('REM', 5)))
+    starts, ends = detect_sleep_cycles(codes)
+    assert starts.tolist() == [0, 60]
+    assert ends.tolist() == [60, 105]
+
+def test_no_rem_means_no_cycles():
+    starts, ends = detect_sleep_cycles(stage_codes(_stages(('N2', 100))))
+    assert starts.size == ends.size == 0
+
+def test_architecture_metrics():
+    stages = _stages(
+        ('W', 20), ('N1', 4), ('N2', 36), ('N3', 20), ('REM', 10),
+        ('W', 2), ('N2', 40), ('REM', 8), ('W', 30),
+    )
+    metrics = compute_architecture_metrics(stages)
+    # Leading and trailing wake are outside the sleep period
+    assert metrics['num_awakenings'] == 1
+    assert metrics['mean_wake_bout_min'] == 1.0
+    assert metrics['stage_shifts'] == 6
+    # REM->W is the only lightening shift, over 59 min of sleep
+    assert np.isclose(metrics['sleep_fragmentation_index'], 1 / (118 * 0.5 / 60))
+    assert metrics['longest_sleep_bout_min'] == 35.0
+    assert metrics['mean_sleep_bout_min'] == 29.5
+    assert metrics['num_sleep_cycles'] == 2
+    assert metrics['mean_cycle_length_min'] == (70 + 50) / 2 * 0.5
+
+def test_architecture_metrics_without_sleep():
+    metrics = compute_architecture_metrics(['W'] * 50)
+    assert metrics['num_awakenings'] == 0
+    assert metrics['num_sleep_cycles'] == 0
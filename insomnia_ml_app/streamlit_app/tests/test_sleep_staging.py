@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from utils import sleep_staging
+from utils.sleep_staging import EPOCH_FEATURES, classify_epochs, stage_psg, _carry_over_artifacts
+from utils.sleep_architecture import STAGE_ORDER
+
+@pytest.fixture
+def rule_based(monkeypatch):
+    """Stage with the rule-based fallback even if a model has been trained"""
+    monkeypatch.setattr(sleep_staging, '_load_staging_model', lambda: None)
+
+def _features(n=200, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, len(EPOCH_FEATURES)))
+
+def test_carry_over_artifacts_uses_previous_clean_epoch():
+    labels = ['W', 'N1', 'N2', 'N3', 'REM']
+    good = np.array([False, True, False, False, True])
+    # A leading artifact takes the first clean epoch's stage
+    assert _carry_over_artifacts(labels, good) == ['N1', 'N1', 'N1', 'N1', 'REM']
+
+def test_carry_over_artifacts_keeps_labels_when_all_or_none_clean():
+    labels = ['W', 'N2']
+    assert _carry_over_artifacts(labels, np.ones(2, bool)) == labels
+    assert _carry_over_artifacts(labels, np.zeros(2, bool)) == labels
+    assert _carry_over_artifacts(labels, None) == labels
+
+def test_rules_separate_deep_sleep_and_wake(rule_based):
+    X = _features()
+    delta, emg = EPOCH_FEATURES.index('eeg_delta_rel'), EPOCH_FEATURES.index('emg_log_var')
+    X[:20] = 0
+    X[:10, delta] = 10
+    X[10:20, emg] = 10
+    labels = classify_epochs(X)
+    assert labels[:10] == ['N3'] * 10
+    assert labels[10:20] == ['W'] * 10
+    assert set(labels) <= set(STAGE_ORDER)
+
+def test_rules_ignore_artifact_epochs_in_statistics(rule_based):
+    X = _features()
+    delta = EPOCH_FEATURES.index('eeg_delta_rel')
+    X[:10] = 0
+    X[:10, delta] = 10
+    # A huge artifact would stretch the robust scale if it were counted
+    X[10:100, delta] = 1e6
+    good = np.ones(len(X), bool)
+    good[10:100] = False
+    labels = classify_epochs(X, good)
+    assert labels[:10] == ['N3'] * 10
+    assert labels[10:100] == ['N3'] * 90
+
+def test_stage_psg_scores_every_epoch(recording, rule_based):
+    stages = stage_psg(recording['psg'])
+    assert len(stages) == len(recording['stages'])
+    scored = np.array(recording['stages'])
+    # Slow-wave epochs carry the synthetic signal's strongest cue
+    assert np.mean(np.array(stages)[scored == 'N3'] == 'N3') > 0.7
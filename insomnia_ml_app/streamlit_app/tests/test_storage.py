@@ -0,0 +1,95 @@
+import os
+import time
+import pytest
+from config import UPLOADS_DIR
+from utils import storage
+from utils.storage import (
+    StorageFull, SpoolReservation, atomic_write, enforce_quota, register_artifact, storage_usage, touch_artifact,
+)
+
+@pytest.fixture(autouse=True)
+def empty_uploads():
+    """Start every test with no artifacts on disk or in the index"""
+    conn = storage._connect()
+    with conn:
+        conn.execute('DELETE FROM artifacts')
+    conn.close()
+    for entry in os.scandir(UPLOADS_DIR):
+        if entry.is_file() and not entry.path.startswith(storage.STORAGE_INDEX_PATH):
+            os.remove(entry.path)
+    yield
+    assert storage._spool_bytes == 0
+
+def _artifact(name, size=1000, ttl=None):
+    path = os.path.join(UPLOADS_DIR, name)
+    assert atomic_write(path, b'x' * size, ttl=ttl)
+    return path
+
+def test_atomic_write_registers_the_file():
+    path = _artifact('a.npy', 1234)
+    assert open(path, 'rb').read() == b'x' * 1234
+    assert storage_usage()['bytes'] == 1234
+    assert storage_usage()['artifacts'] == 1
+    assert not [name for name in os.listdir(UPLOADS_DIR) if name.endswith('.tmp')]
+
+def test_failed_writer_stores_nothing():
+    path = os.path.join(UPLOADS_DIR, 'b.npy')
+    assert not atomic_write(path, writer=lambda tmp_path: False)
+    assert not os.path.exists(path)
+    assert storage_usage()['artifacts'] == 0
+
+def test_least_recently_used_artifacts_are_evicted_first():
+    paths = [_artifact(f'{i}.npy') for i in range(4)]
+    time.sleep(0.01)
+    touch_artifact(paths[0])
+    freed = enforce_quota(quota_bytes=2500)
+    assert freed == 2000
+    assert [os.path.exists(p) for p in paths] == [True, False, False, True]
+
+def test_expired_artifacts_are_evicted_under_quota():
+    fresh = _artifact('fresh.npy')
+    stale = _artifact('stale.npy', ttl=1)
+    conn = storage._connect()
+    with conn:
+        conn.execute('UPDATE artifacts SET expires_at = ? WHERE path = ?', (time.time() - 1, stale))
+    conn.close()
+    assert enforce_quota(quota_bytes=10 ** 9) == 1000
+    assert os.path.exists(fresh) and not os.path.exists(stale)
+
+def test_spool_charge_evicts_artifacts_then_fails():
+    old = _artifact('old.npy', 3000)
+    with SpoolReservation(quota_bytes=5000) as reservation:
+        reservation.charge(4000)
+        # Making room for the spool evicted the artifact
+        assert not os.path.exists(old)
+        assert storage_usage()['spool_bytes'] == 4000
+        with pytest.raises(StorageFull):
+            reservation.charge(2000)
+        assert reservation.charged == 4000
+    assert storage_usage()['spool_bytes'] == 0
+
+def test_live_spools_count_against_the_quota():
+    with SpoolReservation(quota_bytes=5000) as reservation:
+        reservation.charge(3000)
+        kept = _artifact('kept.npy', 1000)
+        dropped = _artifact('dropped.npy', 1500)
+        touch_artifact(kept)
+        enforce_quota(quota_bytes=5000)
+        assert os.path.exists(kept) and not os.path.exists(dropped)
+
+def test_untracked_files_are_adopted():
+    path = os.path.join(UPLOADS_DIR, 'stray.pdf')
+    with open(path, 'wb') as f:
+        f.write(b'x' * 500)
+    storage._sync_index()
+    assert storage_usage()['bytes'] == 500
+    os.remove(path)
+    storage._sync_index()
+    assert storage_usage()['artifacts'] == 0
+
+def test_register_refreshes_size():
+    path = _artifact('grow.npy', 100)
+    with open(path, 'ab') as f:
+        f.write(b'x' * 100)
+    register_artifact(path)
+    assert storage_usage()['bytes'] == 200
@@ -0,0 +1,87 @@
+import io
+import bz2
+import gzip
+import hashlib
+import os
+import zipfile
+import pytest
+from utils.uploads import detect_compression, spool_upload
+
+class Upload(io.BytesIO):
+    """Stand-in for Streamlit's UploadedFile: a BytesIO with a name and size"""
+
+    def __init__(self, data, name='night.edf'):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+
+@pytest.fixture
+def payload():
+    return os.urandom(100_000)
+
+def test_spooled_file_matches_the_upload(payload, tmp_path):
+    dest = str(tmp_path / 'psg.edf')
+    ok, info = spool_upload(Upload(payload), dest, chunk_bytes=4096)
+    assert ok
+    assert open(dest, 'rb').read() == payload
+    assert info == {'path': dest, 'sha256': hashlib.sha256(payload).hexdigest(),
+                    'size': len(payload), 'compression': None}
+
+def test_progress_follows_the_upload(payload, tmp_path):
+    fractions = []
+    spool_upload(Upload(payload), str(tmp_path / 'psg.edf'), chunk_bytes=25_000,
+                 progress=lambda fraction, text: fractions.append(fraction))
+    assert fractions == [0.25, 0.5, 0.75, 1.0]
+
+def test_oversized_upload_leaves_nothing_behind(payload, tmp_path):
+    dest = str(tmp_path / 'psg.edf')
+    ok, message = spool_upload(Upload(payload), dest, chunk_bytes=4096, max_bytes=50_000)
+    assert not ok and 'upload limit' in message
+    assert os.listdir(tmp_path) == []
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+@pytest.mark.parametrize('compression, compress', [
+    ('gzip', gzip.compress),
+    ('bz2', bz2.compress),
+    ('zip', lambda data: _zip({'night.edf': data})),
+])
+def test_compressed_uploads_are_spooled_decompressed(payload, tmp_path, compression, compress):
+    upload = Upload(compress(payload), name=f'night.{compression}')
+    assert detect_compression(upload) == compression
+    assert upload.tell() == 0
+    dest = str(tmp_path / 'psg.edf')
+    ok, info = spool_upload(upload, dest, chunk_bytes=4096)
+    assert ok
+    assert open(dest, 'rb').read() == payload
+    assert info['size'] == len(payload)
+    assert info['sha256'] == hashlib.sha256(payload).hexdigest()
+    assert info['compression'] == compression
+
+def test_zip_picks_the_edf_member(payload, tmp_path):
+    upload = Upload(_zip({'readme.txt': b'notes', 'night.EDF': payload}), name='night.zip')
+    ok, _ = spool_upload(upload, str(tmp_path / 'psg.edf'))
+    assert ok and open(tmp_path / 'psg.edf', 'rb').read() == payload
+
+def test_zip_with_several_edf_files_is_rejected(payload, tmp_path):
+    upload = Upload(_zip({'a.edf': payload, 'b.edf': payload}), name='nights.zip')
+    ok, message = spool_upload(upload, str(tmp_path / 'psg.edf'))
+    assert not ok and 'exactly one EDF' in message
+
+def test_limit_applies_to_decompressed_size(tmp_path):
+    # Compresses to a few hundred bytes
+    upload = Upload(gzip.compress(bytes(1_000_000)), name='bomb.gz')
+    ok, message = spool_upload(upload, str(tmp_path / 'psg.edf'), max_bytes=100_000)
+    assert not ok and 'upload limit' in message
+    assert os.listdir(tmp_path) == []
+
+def test_corrupt_archive_fails_cleanly(payload, tmp_path):
+    upload = Upload(gzip.compress(payload)[:5000], name='cut.gz')
+    ok, message = spool_upload(upload, str(tmp_path / 'psg.edf'))
+    assert not ok and message.startswith('Failed to save cut.gz')
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,253 @@
+"""Inference backend benchmark for the severity classifier
+
+Runs interchangeable backends over the same held-out split of DATA_PATH and
+reports, side by side, load time, model memory, single-row latency, batch
+throughput, accuracy and macro F1.
+
+    python tools/benchmark_inference.py
+    python tools/benchmark_inference.py --refit --export compact_forest.npz
+
+Backends:
+  heuristic  the threshold rules of predict_severity_batch, all rows at once
+  forest     the sklearn RandomForest at MODEL_PATH (or --model)
+  compact    the same forest exported to flat numpy arrays and evaluated
+             level by level for all rows and trees at once
+
+Features are standardized with a scaler fitted on the training split, as
+the app does with the full training file. If the shipped model cannot be
+unpickled by the installed scikit-learn, --refit trains a forest with the
+same defaults on the training split so the forest backends can still be
+compared. A model trained on all of DATA_PATH has seen the held-out rows,
+so its accuracy is optimistic; the latency figures are unaffected.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import joblib
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+from config import MODEL_PATH, DATA_PATH
+from utils.ml_pipeline import FEATURE_COLS, SEVERITY_LEVELS, heuristic_levels
+
+LABEL_COL = 'label'
+METRICS = ['load_ms', 'model_mb', 'p50_us', 'p99_us', 'rows_per_sec', 'accuracy', 'macro_f1']
+
+def severity_index(values):
+    """Severity labels (names or class numbers) as indices into SEVERITY_LEVELS"""
+    return np.array([SEVERITY_LEVELS.index(v) if v in SEVERITY_LEVELS else int(v) for v in values])
+
+def load_split(test_size, seed):
+    """Standardized train/test features and severity indices from DATA_PATH's labeled rows"""
+    data = pd.read_csv(DATA_PATH).dropna(subset=[LABEL_COL])
+    X = data[FEATURE_COLS].to_numpy(dtype=float)
+    y = severity_index(data[LABEL_COL])
+    stratify = y if np.bincount(y).min() >= 2 else None
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=seed, stratify=stratify)
+    scaler = StandardScaler().fit(X_train)
+    return scaler.transform(X_train), scaler.transform(X_test), y_train, y_test
+
+# ---------------------------------------------------------------------------
+# Compact forest export
+# ---------------------------------------------------------------------------
+
+def export_compact_forest(forest):
+    """Flatten a fitted forest's trees into one set of node arrays
+
+    Leaves point to themselves, so every row can take max_depth steps from
+    its tree roots without branching on whether it has reached a leaf.
+    """
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset, depth = 0, 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count)
+        leaf = tree.children_left == -1
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(np.where(leaf, np.inf, tree.threshold))
+        lefts.append(np.where(leaf, nodes, tree.children_left) + offset)
+        rights.append(np.where(leaf, nodes, tree.children_right) + offset)
+        value = tree.value[:, 0, :]
+        values.append(value / value.sum(axis=1, keepdims=True))
+        roots.append(offset)
+        offset += tree.node_count
+        depth = max(depth, tree.max_depth)
+
+    return {
+        'feature':   np.concatenate(features).astype(np.int32),
+        'threshold': np.concatenate(thresholds),
+        'left':      np.concatenate(lefts).astype(np.int32),
+        'right':     np.concatenate(rights).astype(np.int32),
+        'value':     np.concatenate(values).astype(np.float32),
+        'roots':     np.array(roots, dtype=np.int32),
+        'depth':     np.array(depth),
+        'classes':   np.asarray(forest.classes_),
+    }
+
+def compact_forest_proba(model, X):
+    """Class probabilities from an exported forest, averaged over trees"""
+    # sklearn compares float32 inputs against float64 thresholds
+    X = np.asarray(X, dtype=np.float32)
+    rows = np.arange(len(X))[:, None]
+    node = np.broadcast_to(model['roots'], (len(X), len(model['roots'])))
+    for _ in range(int(model['depth'])):
+        go_left = X[rows, model['feature'][node]] <= model['threshold'][node]
+        node = np.where(go_left, model['left'][node], model['right'][node])
+    return model['value'][node].mean(axis=1)
+
+# ---------------------------------------------------------------------------
+# Backends: load() returns a predict(X) -> severity indices function
+# ---------------------------------------------------------------------------
+
+class HeuristicBackend:
+    name = 'heuristic'
+
+    def load(self):
+        # The same vectorized rules the app's batch path uses
+        return lambda X: heuristic_levels(X).max(axis=1)
+
+class ForestBackend:
+    name = 'forest'
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+
+    def load(self):
+        forest = joblib.load(self.model_path)
+        classes = severity_index(forest.classes_)
+        return lambda X: classes[forest.predict_proba(X).argmax(axis=1)]
+
+class CompactForestBackend:
+    name = 'compact'
+
+    def __init__(self, export_path):
+        self.export_path = export_path
+
+    def load(self):
+        with np.load(self.export_path) as f:
+            model = {k: f[k] for k in f.files}
+        classes = severity_index(model['classes'])
+        return lambda X: classes[compact_forest_proba(model, X).argmax(axis=1)]
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def benchmark(backend, X_test, y_test, latency_rows, min_batch_sec):
+    """Load a backend and measure its cost and accuracy on the held-out rows"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    predict = backend.load()
+    load_sec = time.perf_counter() - started
+    model_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    predicted = predict(X_test)
+
+    # Single-row latency, as the app predicts one analysis at a time
+    rows = X_test[np.arange(latency_rows) % len(X_test)]
+    latencies = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        started = time.perf_counter()
+        predict(row[None, :])
+        latencies[i] = time.perf_counter() - started
+
+    # Batch throughput over the whole held-out set, repeated for a stable figure
+    batches, started = 0, time.perf_counter()
+    while True:
+        predict(X_test)
+        batches += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_batch_sec:
+            break
+
+    return {
+        'backend':      backend.name,
+        'load_ms':      1000 * load_sec,
+        'model_mb':     model_bytes / 1e6,
+        'p50_us':       1e6 * float(np.percentile(latencies, 50)),
+        'p99_us':       1e6 * float(np.percentile(latencies, 99)),
+        'rows_per_sec': batches * len(X_test) / elapsed,
+        'accuracy':     accuracy_score(y_test, predicted),
+        'macro_f1':     f1_score(y_test, predicted, average='macro', labels=range(len(SEVERITY_LEVELS)), zero_division=0),
+    }
+
+def print_table(results):
+    widths = {m: max(len(m), 12) for m in METRICS}
+    print(f"{'backend':<10} " + ' '.join(f"{m:>{widths[m]}}" for m in METRICS))
+    for row in results:
+        cells = []
+        for m in METRICS:
+            value = row[m]
+            fmt = '.0f' if m == 'rows_per_sec' else '.3f' if m in ('accuracy', 'macro_f1', 'model_mb') else '.1f'
+            cells.append(f"{value:>{widths[m]}{fmt}}")
+        print(f"{row['backend']:<10} " + ' '.join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', nargs='+', default=['heuristic', 'forest', 'compact'],
+                        choices=['heuristic', 'forest', 'compact'])
+    parser.add_argument('--model', default=MODEL_PATH, help='fitted RandomForest joblib file')
+    parser.add_argument('--refit', action='store_true',
+                        help='train a forest on the training split instead of loading --model')
+    parser.add_argument('--export', help='where to write the compact forest (.npz); temporary if omitted')
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency-rows', type=int, default=1000, help='single-row predictions timed per backend')
+    parser.add_argument('--min-batch-sec', type=float, default=1.0, help='minimum time spent measuring throughput')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    X_train, X_test, y_train, y_test = load_split(args.test_size, args.seed)
+    print(f"{len(X_train)} training rows, {len(X_test)} held-out rows from {DATA_PATH}")
+
+    work_dir = tempfile.mkdtemp(prefix='insomniaid_bench_')
+    model_path = args.model
+    if args.refit:
+        forest = RandomForestClassifier(random_state=args.seed, n_jobs=1)
+        forest.fit(X_train, np.array(SEVERITY_LEVELS)[y_train])
+        model_path = os.path.join(work_dir, 'forest.joblib')
+        joblib.dump(forest, model_path)
+
+    backends = []
+    for name in args.backends:
+        if name == 'heuristic':
+            backends.append(HeuristicBackend())
+        elif name == 'forest':
+            backends.append(ForestBackend(model_path))
+        elif name == 'compact':
+            export_path = args.export or os.path.join(work_dir, 'compact_forest.npz')
+            try:
+                np.savez(export_path, **export_compact_forest(joblib.load(model_path)))
+            except Exception as e:
+                print(f"Skipping compact: could not export {model_path}: {str(e)}")
+                continue
+            backends.append(CompactForestBackend(export_path))
+
+    results = []
+    for backend in backends:
+        try:
+            results.append(benchmark(backend, X_test, y_test, args.latency_rows, args.min_batch_sec))
+        except Exception as e:
+            print(f"Skipping {backend.name}: {str(e)}")
+
+    print()
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""Incremental, resumable builder for the training feature table
+
+Walks a PSG archive, pairs each PSG with its hypnogram, computes the
+stage features of every new or changed pair in a process pool and writes
+FEATURE_COLS plus the label column to the output CSV. FEATURE_COLS only
+need the hypnogram, so the signal pipeline runs only for a PSG that has to
+be staged automatically.
+
+    python tools/build_corpus.py /data/sleep-edf --labels labels.csv --output data/corpus.csv
+    python tools/build_corpus.py /data/sleep-edf --labels labels.csv --workers 8 --output data/sleep_features_labels_core.csv
+
+--output is required so a run never replaces the training table (DATA_PATH,
+which the app's scaler is fitted on) by accident. When it does target
+DATA_PATH, --labels is required and recordings without a label are left
+out of the table.
+
+A manifest next to the output (<output>.manifest.json) records the size,
+mtime and SHA-256 of every input the features depend on (the hypnogram,
+or the PSG when there is none) together with its extracted features, and
+is rewritten atomically after each finished recording. Rerunning only
+processes recordings whose inputs hashed differently, are new, or were
+interrupted; recordings that vanished from the archive are dropped. Files
+whose size and mtime are unchanged are not re-hashed. Changing
+FEATURE_COLS invalidates the whole manifest.
+
+Each PSG (.edf) takes the hypnogram in its directory whose file name
+shares the longest prefix with it, e.g. SC4001E0-PSG.edf pairs with
+SC4001EC-Hypnogram.edf and shhs1-200001.edf with shhs1-200001-nsrr.xml.
+Labels come from a CSV with 'recording' and 'label' columns; recording is
+the PSG's path relative to the archive, its file name with or without the
+extension, or the part of the name before the first '-' (SC4001E0).
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from config import DATA_PATH, UPLOAD_CHUNK_BYTES
+from utils.ml_pipeline import FEATURE_COLS
+
+MANIFEST_VERSION = 1
+LABEL_COL = 'label'
+HYPNOGRAM_EXTENSIONS = ('.csv', '.tsv', '.txt', '.xml')
+HYPNOGRAM_KEYWORDS = ('hypnogram', 'hypno', 'stages', 'scoring', 'nsrr')
+
+# ---------------------------------------------------------------------------
+# Archive scanning
+# ---------------------------------------------------------------------------
+
+def _is_hypnogram(name):
+    lower = name.lower()
+    return lower.endswith(HYPNOGRAM_EXTENSIONS) or (
+        lower.endswith('.edf') and any(k in lower for k in HYPNOGRAM_KEYWORDS)
+    )
+
+def _common_prefix(a, b):
+    return len(os.path.commonprefix([a.lower(), b.lower()]))
+
+def find_recordings(archive, exclude=()):
+    """{recording id: (psg path, hypnogram path)} plus the PSGs left unpaired"""
+    exclude = {os.path.abspath(p) for p in exclude}
+    recordings, unpaired = {}, []
+    for root, _, files in os.walk(archive):
+        files = sorted(f for f in files if os.path.abspath(os.path.join(root, f)) not in exclude)
+        hypnograms = [f for f in files if _is_hypnogram(f)]
+        psgs = [f for f in files if f.lower().endswith('.edf') and not _is_hypnogram(f)]
+
+        # Each hypnogram goes to the PSG it shares the longest name prefix with
+        claims = {}
+        for hypno in hypnograms:
+            scores = sorted(((_common_prefix(psg, hypno), psg) for psg in psgs), reverse=True)
+            if scores and scores[0][0] > 0 and (len(scores) == 1 or scores[0][0] > scores[1][0]):
+                claims.setdefault(scores[0][1], []).append(hypno)
+
+        # A PSG claimed by several hypnograms keeps the closest one, if unique
+        for psg in psgs:
+            psg_path = os.path.join(root, psg)
+            matches = sorted(((_common_prefix(psg, h), h) for h in claims.get(psg, [])), reverse=True)
+            if not matches or (len(matches) > 1 and matches[0][0] == matches[1][0]):
+                unpaired.append(psg_path)
+                continue
+            recording = os.path.relpath(psg_path, archive)
+            recordings[recording] = (psg_path, os.path.join(root, matches[0][1]))
+    return recordings, unpaired
+
+def file_fingerprint(path, previous=None):
+    """Size, mtime and SHA-256 of a file, reusing the previous hash if size and mtime match"""
+    stat = os.stat(path)
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime:
+        return dict(previous, path=path)
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': digest.hexdigest()}
+
+# ---------------------------------------------------------------------------
+# Manifest and output
+# ---------------------------------------------------------------------------
+
+def _write_atomic(path, write):
+    """Write via a temp file in the same directory, fsync, then rename into place"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', newline='') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def load_manifest(path):
+    """The stored manifest, or an empty one if missing or built for other features"""
+    empty = {'version': MANIFEST_VERSION, 'feature_cols': FEATURE_COLS, 'recordings': {}}
+    if not os.path.exists(path):
+        return empty
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"Error reading manifest, rebuilding: {str(e)}")
+        return empty
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('feature_cols') != FEATURE_COLS:
+        print("Manifest was built for a different feature set, rebuilding")
+        return empty
+    return manifest
+
+def save_manifest(path, manifest):
+    _write_atomic(path, lambda f: json.dump(manifest, f, indent=1, sort_keys=True))
+
+def load_labels(path):
+    """{name: label} keyed by every accepted spelling of each recording"""
+    if not path:
+        return {}
+    table = pd.read_csv(path, dtype={'recording': str})
+    labels = {}
+    for recording, label in zip(table['recording'], table[LABEL_COL]):
+        labels[recording] = label
+        labels[os.path.splitext(os.path.basename(recording))[0]] = label
+    return labels
+
+def _label_for(recording, labels):
+    name = os.path.basename(recording)
+    for key in (recording, name, os.path.splitext(name)[0], name.split('-')[0]):
+        if key in labels:
+            return labels[key]
+    return None
+
+def write_table(path, manifest, labels, labeled_only=False):
+    """Write the feature table for every processed recording, atomically
+
+    With labeled_only, recordings without a label are left out. Returns the
+    table and the number of unlabeled recordings.
+    """
+    rows = []
+    for recording, entry in sorted(manifest['recordings'].items()):
+        if entry.get('features'):
+            row = {col: entry['features'].get(col, np.nan) for col in FEATURE_COLS}
+            row[LABEL_COL] = _label_for(recording, labels)
+            rows.append(row)
+    table = pd.DataFrame(rows, columns=FEATURE_COLS + [LABEL_COL])
+    unlabeled = int(table[LABEL_COL].isna().sum())
+    if labeled_only:
+        table = table.dropna(subset=[LABEL_COL])
+    _write_atomic(path, lambda f: table.to_csv(f, index=False))
+    return table, unlabeled
+
+# ---------------------------------------------------------------------------
+# Extraction
+# ---------------------------------------------------------------------------
+
+def extract_recording(job):
+    """(recording, scalar features, error) for one PSG/hypnogram pair, in a worker process"""
+    from utils.ml_pipeline import extract_features_from_edf, extract_features_from_hypnogram
+    recording, psg_path, hypno_path = job
+    try:
+        if hypno_path:
+            features = extract_features_from_hypnogram(hypno_path)
+        else:
+            features = extract_features_from_edf(psg_path)
+        if features is None:
+            return recording, None, "feature extraction failed"
+        return recording, {k: float(v) for k, v in features.items()
+                           if isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, bool)}, None
+    except Exception as e:
+        return recording, None, str(e)
+
+def plan(recordings, manifest, retry_failed):
+    """Fingerprint the inputs and split recordings into (pending, unchanged)"""
+    pending, unchanged = [], []
+    for recording, (psg_path, hypno_path) in sorted(recordings.items()):
+        previous = manifest['recordings'].get(recording, {})
+        # Stage features depend on the hypnogram alone; the PSG only matters when it must be staged
+        if hypno_path:
+            inputs = {'hypnogram': file_fingerprint(hypno_path, previous.get('hypnogram'))}
+        else:
+            inputs = {'psg': file_fingerprint(psg_path, previous.get('psg'))}
+        same_inputs = all(
+            previous.get(k, {}).get('sha256') == inputs[k]['sha256'] for k in inputs
+        )
+        done = previous.get('features') or (previous.get('error') and not retry_failed)
+        if same_inputs and done:
+            # Paths and mtimes may have moved without the content changing
+            previous.update(inputs)
+            unchanged.append(recording)
+        else:
+            manifest['recordings'][recording] = {**inputs, 'features': None, 'error': None}
+            pending.append(recording)
+    return pending, unchanged
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('archive', help='directory holding PSG recordings and hypnograms')
+    parser.add_argument('--output', required=True, help=f'feature table to write (the training table is {DATA_PATH})')
+    parser.add_argument('--labels', help="CSV with 'recording' and 'label' columns")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--retry-failed', action='store_true', help='reprocess recordings that failed before')
+    args = parser.parse_args()
+
+    # The app fits its scaler and benchmarks on this table, so it only takes labeled rows
+    training_table = os.path.abspath(args.output) == os.path.abspath(DATA_PATH)
+    if training_table and not args.labels:
+        parser.error('--labels is required when writing the training table')
+
+    manifest_path = f"{args.output}.manifest.json"
+    exclude = [args.output, manifest_path] + ([args.labels] if args.labels else [])
+    recordings, unpaired = find_recordings(args.archive, exclude)
+    for psg_path in unpaired:
+        print(f"Skipping {psg_path}: no unambiguous hypnogram")
+
+    manifest = load_manifest(manifest_path)
+    removed = set(manifest['recordings']) - set(recordings)
+    for recording in removed:
+        del manifest['recordings'][recording]
+
+    pending, unchanged = plan(recordings, manifest, args.retry_failed)
+    save_manifest(manifest_path, manifest)
+    print(f"{len(recordings)} recordings: {len(pending)} to process, {len(unchanged)} unchanged, "
+          f"{len(removed)} removed")
+
+    if pending:
+        # Split the cores between processes instead of each one starting a full signal pool
+        os.environ.setdefault('INSOMNIAID_SIGNAL_WORKERS', str(max(1, (os.cpu_count() or 1) // args.workers)))
+        context = multiprocessing.get_context('spawn')
+        started = time.perf_counter()
+        done = failed = 0
+        pool = context.Pool(args.workers)
+        try:
+            jobs = [(r, *recordings[r]) for r in pending]
+            for recording, features, error in pool.imap_unordered(extract_recording, jobs):
+                entry = manifest['recordings'][recording]
+                entry['features'], entry['error'] = features, error
+                if error:
+                    failed += 1
+                    print(f"Error processing {recording}: {error}")
+                else:
+                    done += 1
+                # Checkpoint so an interrupted run resumes after this recording
+                save_manifest(manifest_path, manifest)
+                print(f"[{done + failed}/{len(pending)}] {recording} "
+                      f"({time.perf_counter() - started:.0f} s elapsed)")
+        except KeyboardInterrupt:
+            pool.terminate()
+            print(f"Interrupted after {done + failed} recordings; rerun to resume")
+            return 1
+        pool.close()
+        pool.join()
+        if failed:
+            print(f"{failed} recordings failed; rerun with --retry-failed to try them again")
+
+    labels = load_labels(args.labels)
+    if training_table and not any(_label_for(recording, labels) is not None
+                                  for recording, entry in manifest['recordings'].items() if entry.get('features')):
+        print(f"No labeled recordings; leaving {args.output} unchanged")
+        return 1
+    table, unlabeled = write_table(args.output, manifest, labels, labeled_only=training_table)
+    note = ' left out' if training_table else ''
+    print(f"Wrote {len(table)} rows to {args.output}" + (f" ({unlabeled} without a label{note})" if unlabeled else ''))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
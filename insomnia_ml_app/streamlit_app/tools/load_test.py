@@ -0,0 +1,237 @@
+"""Concurrent-session load test for the InsomniAid Streamlit app
+
+Drives many headless sessions of main.py in this process with Streamlit's
+AppTest framework. Each session logs in, uploads a synthetic EDF, runs the
+analysis and generates the PDF report. For each concurrency level the
+script reports p50/p95/p99 latency per step, session throughput and the
+process RSS (the process *is* the server here).
+
+    python tools/load_test.py --levels 1 2 4 8 --sessions 8 --hours 1
+
+AppTest cannot drive st.file_uploader, so the harness swaps it for a
+function returning the synthetic file staged in the session's state.
+AppTest also assumes one test at a time (it installs and clears a global
+mock Runtime and compiles the script on every run), so the harness keeps
+the last mock Runtime available to overlapping runs and shares one script
+cache between them, as a real server does. Users and reports go to a throwaway
+database and are removed afterwards.
+"""
+import io
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+WORK_DIR = tempfile.mkdtemp(prefix='insomniaid_load_')
+os.environ.setdefault('INSOMNIAID_DB_PATH', os.path.join(WORK_DIR, 'load_test.db'))
+
+import streamlit as st
+from streamlit import config as st_config
+from streamlit.runtime import Runtime
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import app_test as app_test_module
+from streamlit.testing.v1 import local_script_runner as local_script_runner_module
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from config import UPLOADS_DIR
+from utils.database import init_db, register_user
+from tools.synthetic_edf import synthetic_stages, write_psg, write_hypnogram
+
+STEPS = ['login', 'analyze', 'pdf', 'session']
+# Session state key holding the files a session "uploads"
+UPLOADS_KEY = '_load_test_uploads'
+PASSWORD = 'loadtest-pass'
+# Pipeline worker threads have no script context; their warnings are expected
+QUIET_LOGGERS = [
+    'streamlit.runtime.scriptrunner.script_run_context',
+    'streamlit.runtime.scriptrunner_utils.script_run_context',
+]
+
+class SyntheticUpload(io.BytesIO):
+    """Stand-in for Streamlit's UploadedFile"""
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+
+def _fake_file_uploader(label, type=None, key=None, **kwargs):
+    uploads = st.session_state.get(UPLOADS_KEY, {})
+    path = uploads.get(key)
+    if path is None:
+        return None
+    with open(path, 'rb') as f:
+        return SyntheticUpload(f.read(), os.path.basename(path))
+
+def _share_runtime():
+    """Let overlapping AppTest runs share a script cache and the most recent mock Runtime"""
+    last = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+            return cls._instance
+        if last:
+            return last[0]
+        raise RuntimeError("Runtime hasn't been created!")
+
+    shared_cache = ScriptCache()
+    for module in (app_test_module, local_script_runner_module):
+        if hasattr(module, 'ScriptCache'):
+            module.ScriptCache = lambda: shared_cache
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(last))
+    # AppTest restores this option after each run; keep it on for all runs
+    st_config.set_option('global.appTest', True)
+
+def rss_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _click(at, key, timeout):
+    at.button(key=key).click().run(timeout=timeout)
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+def run_session(username, uploads, timeout):
+    """One full user journey; returns per-step latencies in seconds"""
+    timings = {}
+    start = time.perf_counter()
+
+    at = AppTest.from_file(os.path.join(APP_DIR, 'main.py'), default_timeout=timeout)
+    at.run()
+    at.text_input(key='login_username').input(username)
+    at.text_input(key='login_password').input(PASSWORD)
+    _click(at, 'login_btn', timeout)
+    if not at.session_state['logged_in']:
+        raise RuntimeError(f"Login failed for {username}")
+    timings['login'] = time.perf_counter() - start
+
+    t0 = time.perf_counter()
+    at.session_state[UPLOADS_KEY] = uploads
+    _click(at, 'nav_upload', timeout)
+    _click(at, 'analyze_btn', timeout)
+    if at.session_state['page'] != 'results':
+        errors = [e.value for e in at.error]
+        raise RuntimeError(f"Analysis failed: {errors}")
+    timings['analyze'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    _click(at, 'solutions_btn', timeout)
+    _click(at, 'download_btn', timeout)
+    if not at.get('download_button'):
+        raise RuntimeError("PDF report was not generated")
+    timings['pdf'] = time.perf_counter() - t0
+
+    timings['session'] = time.perf_counter() - start
+    return timings
+
+def run_level(concurrency, n_sessions, users, uploads, timeout):
+    """Run n_sessions journeys with the given number of parallel sessions"""
+    results, errors = [], []
+    lock = threading.Lock()
+    peak_rss = rss_bytes()
+
+    def worker(i):
+        nonlocal peak_rss
+        try:
+            timings = run_session(users[i % len(users)], uploads, timeout)
+            with lock:
+                results.append(timings)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+        with lock:
+            peak_rss = max(peak_rss, rss_bytes())
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(n_sessions)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'concurrency': concurrency,
+        'completed': len(results),
+        'errors': errors,
+        'elapsed': elapsed,
+        'throughput': len(results) / elapsed,
+        'percentiles': {
+            step: np.percentile([r[step] for r in results], [50, 95, 99]) if results else None
+            for step in STEPS
+        },
+        'rss': rss_bytes(),
+        'peak_rss': peak_rss,
+    }
+
+def print_report(report):
+    print(f"\n== concurrency {report['concurrency']}: {report['completed']} sessions in "
+          f"{report['elapsed']:.1f} s, {report['throughput'] * 60:.1f} sessions/min, "
+          f"RSS {report['rss'] / 1024 ** 2:.0f} MB (peak {report['peak_rss'] / 1024 ** 2:.0f} MB)")
+    print(f"   {'step':<10}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}")
+    for step, values in report['percentiles'].items():
+        if values is not None:
+            print(f"   {step:<10}{values[0]:>10.2f}{values[1]:>10.2f}{values[2]:>10.2f}")
+    for error in report['errors'][:5]:
+        print(f"   error: {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="Numbers of concurrent sessions to test")
+    parser.add_argument('--sessions', type=int, default=None,
+                        help="Sessions per level (default: 2 x concurrency)")
+    parser.add_argument('--hours', type=float, default=1.0, help="Length of the synthetic recording")
+    parser.add_argument('--sfreq', type=int, default=100, help="Sampling rate of the synthetic PSG")
+    parser.add_argument('--with-hypnogram', action='store_true',
+                        help="Upload a scored hypnogram instead of relying on automatic staging")
+    parser.add_argument('--timeout', type=float, default=600, help="Per-rerun timeout in seconds")
+    args = parser.parse_args()
+
+    stages = synthetic_stages(args.hours)
+    uploads = {'psg_upload': write_psg(os.path.join(WORK_DIR, 'psg.edf'), stages, args.sfreq)}
+    if args.with_hypnogram:
+        uploads['hypno_upload'] = write_hypnogram(os.path.join(WORK_DIR, 'hypno.edf'), stages)
+
+    init_db()
+    users = [f'loadtest_{i}' for i in range(max(args.levels))]
+    for username in users:
+        register_user(username, f'{username}@example.com', PASSWORD)
+
+    st.file_uploader = _fake_file_uploader
+    _share_runtime()
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.ERROR)
+    print(f"Synthetic PSG: {args.hours:g} h at {args.sfreq} Hz, "
+          f"{os.path.getsize(uploads['psg_upload']) / 1024 ** 2:.1f} MB; baseline RSS {rss_bytes() / 1024 ** 2:.0f} MB")
+
+    try:
+        # Warm-up session: imports, model loading and the first Runtime
+        run_session(users[0], uploads, args.timeout)
+        for level in args.levels:
+            print_report(run_level(level, args.sessions or 2 * level, users, uploads, args.timeout))
+    finally:
+        for username in users:
+            report_path = os.path.join(UPLOADS_DIR, f"report_{username}.pdf")
+            if os.path.exists(report_path):
+                os.remove(report_path)
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Re-score stored analyses with the current model and scaler
+
+Loads each analysis's cached epoch matrix (utils/epoch_cache.py) instead of
+its EDF, recomputes the night-level features from the stored stages and
+runs normalization and prediction in large vectorized batches. The
+analyses table and the dashboard's daily summaries are then updated in a
+single transaction.
+
+    python tools/rescore_history.py --dry-run
+    python tools/rescore_history.py --restage --batch-size 8192
+
+With --restage, automatically staged analyses are first re-staged from
+their stored epoch features with the current staging model. Analyses
+whose epoch matrix is missing (made before the cache existed, or evicted
+from it) are left unchanged and counted.
+"""
+import os
+import sys
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from utils.database import init_db, analysis_history, update_analyses
+from utils.epoch_cache import load_epoch_matrix
+from utils.ml_pipeline import (
+    compute_stage_features, normalize_feature_rows, predict_severity_batch, SEVERITY_LEVELS
+)
+from utils.sleep_architecture import STAGE_ORDER
+from utils.sleep_staging import classify_epochs
+
+def recording_features(upload_hash, restage):
+    """Night-level features for one cached recording, None if it is not cached"""
+    matrix = load_epoch_matrix(upload_hash)
+    if matrix is None:
+        return None
+    if restage and matrix['auto_staged'] and 'features' in matrix:
+        stages = list(classify_epochs(matrix['features'], matrix['good']))
+    else:
+        stages = list(np.array(STAGE_ORDER, dtype=object)[matrix['stages']])
+    return compute_stage_features(stages)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=4096, help='rows normalized and predicted per batch')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='threads loading epoch matrices')
+    parser.add_argument('--restage', action='store_true', help='re-stage automatically staged analyses first')
+    parser.add_argument('--dry-run', action='store_true', help='report changes without writing them')
+    args = parser.parse_args()
+
+    init_db()
+    started = time.perf_counter()
+    history = analysis_history()
+    hashes = sorted({upload_hash for _, upload_hash, _ in history})
+
+    # Each recording is loaded once, however many analyses share it
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        features = dict(zip(hashes, pool.map(lambda h: recording_features(h, args.restage), hashes)))
+    loaded = time.perf_counter()
+
+    cached = [h for h in hashes if features[h] is not None]
+    severity_by_hash = {}
+    for start in range(0, len(cached), args.batch_size):
+        batch = cached[start:start + args.batch_size]
+        classes, _ = predict_severity_batch(normalize_feature_rows(features[h] for h in batch))
+        severity_by_hash.update(zip(batch, (SEVERITY_LEVELS[c] for c in classes)))
+    scored = time.perf_counter()
+
+    updates, changes, missing = [], Counter(), 0
+    for analysis_id, upload_hash, old in history:
+        if upload_hash not in severity_by_hash:
+            missing += 1
+            continue
+        new = severity_by_hash[upload_hash]
+        updates.append((analysis_id, new, features[upload_hash]))
+        if new != old:
+            changes[(old, new)] += 1
+
+    print(f"{len(history)} analyses over {len(hashes)} recordings: {len(updates)} re-scored, "
+          f"{missing} without a cached epoch matrix")
+    print(f"loaded in {loaded - started:.1f} s, scored in {scored - loaded:.2f} s")
+    for (old, new), count in sorted(changes.items()):
+        print(f"  {old} -> {new}: {count}")
+    if not changes:
+        print("  no severity changes")
+
+    if args.dry_run or not updates:
+        return 0
+    if not update_analyses(updates):
+        return 1
+    print(f"Updated {len(updates)} analyses in {time.perf_counter() - scored:.1f} s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
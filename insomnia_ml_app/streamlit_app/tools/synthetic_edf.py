@@ -0,0 +1,83 @@
+import numpy as np
+
+# Synthetic night: one NREM/REM cycle repeated, 30 s epochs
+CYCLE = ['N1'] * 5 + ['N2'] * 40 + ['N3'] * 20 + ['N2'] * 10 + ['REM'] * 20
+STAGE_WAVES = {'W': (10, 20), 'N1': (6, 30), 'N2': (13, 40), 'N3': (2, 100), 'REM': (5, 25)}
+ANNOTATION_LABELS = {
+    'W': 'Sleep stage W', 'N1': 'Sleep stage 1', 'N2': 'Sleep stage 2',
+    'N3': 'Sleep stage 3', 'REM': 'Sleep stage R',
+}
+PHYSICAL_RANGE = 500
+RECORD_SEC = 30
+
+def _field(value, width):
+    return str(value).encode('ascii')[:width].ljust(width)
+
+def _header(labels, dims, samples, n_records, edf_plus=False):
+    """EDF(+) header bytes; all signals share a +/-500 physical range"""
+    ns = len(labels)
+    header = (
+        _field('0', 8) + _field('X X X X', 80) + _field('Startdate X X X X', 80)
+        + _field('01.01.24', 8) + _field('22.00.00', 8) + _field(256 * (ns + 1), 8)
+        + _field('EDF+C' if edf_plus else '', 44) + _field(n_records, 8) + _field(RECORD_SEC, 8) + _field(ns, 4)
+    )
+    columns = [
+        (labels, 16), ([''] * ns, 80), (dims, 8),
+        ([-PHYSICAL_RANGE if d else -1 for d in dims], 8), ([PHYSICAL_RANGE if d else 1 for d in dims], 8),
+        (['-32768'] * ns, 8), (['32767'] * ns, 8), ([''] * ns, 80), (samples, 8), ([''] * ns, 32),
+    ]
+    return header + b''.join(_field(v, width) for values, width in columns for v in values)
+
+def _digital(data):
+    scaled = (np.asarray(data, dtype=float) + PHYSICAL_RANGE) / (2 * PHYSICAL_RANGE) * 65535 - 32768
+    return np.clip(np.round(scaled), -32768, 32767).astype('<i2')
+
+def synthetic_stages(hours):
+    """Stage sequence for a synthetic night of the given length"""
+    n_epochs = int(hours * 3600 // RECORD_SEC)
+    stages = ['W'] * 10
+    while len(stages) < n_epochs:
+        stages += CYCLE
+    return stages[:n_epochs]
+
+def write_psg(path, stages, sfreq=100, seed=0):
+    """Write a PSG EDF with EEG, EOG, EMG, ECG and respiration channels matching stages"""
+    rng = np.random.default_rng(seed)
+    epoch = RECORD_SEC * sfreq
+    t = np.arange(epoch) / sfreq
+
+    channels = [('EEG Fpz-Cz', 'uV'), ('EOG horizontal', 'uV'), ('EMG submental', 'uV'),
+                ('ECG', 'uV'), ('Resp oro-nasal', 'uV')]
+    ecg = np.zeros(epoch)
+    ecg[::int(sfreq * 0.9)] = 300
+
+    with open(path, 'wb') as f:
+        f.write(_header([c[0] for c in channels], [c[1] for c in channels], [epoch] * len(channels), len(stages)))
+        for i, stage in enumerate(stages):
+            freq, amp = STAGE_WAVES[stage]
+            offset = i * RECORD_SEC
+            f.write(_digital(amp * np.sin(2 * np.pi * freq * t) + rng.normal(0, 10, epoch)).tobytes())
+            f.write(_digital(rng.normal(0, 20, epoch)).tobytes())
+            f.write(_digital(rng.normal(0, 5, epoch)).tobytes())
+            f.write(_digital(ecg + rng.normal(0, 5, epoch)).tobytes())
+            f.write(_digital(100 * np.sin(2 * np.pi * 0.25 * (t + offset))).tobytes())
+    return path
+
+def write_hypnogram(path, stages):
+    """Write an EDF+ annotation file scoring the given stage sequence"""
+    stages = list(stages)
+    tals = [b'+0\x14\x14\x00']
+    i = 0
+    while i < len(stages):
+        j = i
+        while j < len(stages) and stages[j] == stages[i]:
+            j += 1
+        tals.append(f'+{i * RECORD_SEC}\x15{(j - i) * RECORD_SEC}\x14{ANNOTATION_LABELS[stages[i]]}\x14\x00'.encode())
+        i = j
+
+    record = b''.join(tals)
+    samples = (len(record) + 1) // 2
+    with open(path, 'wb') as f:
+        f.write(_header(['EDF Annotations'], [''], [samples], 1, edf_plus=True))
+        f.write(record.ljust(samples * 2, b'\x00'))
+    return path
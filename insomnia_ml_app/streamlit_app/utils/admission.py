@@ -0,0 +1,99 @@
+import threading
+from collections import deque
+from contextlib import contextmanager
+from config import ANALYSIS_MEMORY_BUDGET_BYTES, SIGNAL_PIPELINE_MODE, FEATURE_TARGET_SFREQ, READ_CHUNK_SEC, PYRAMID_FACTOR
+from utils.resampling import decimation_factor
+from utils.signals import channel_kind
+
+# Bytes per kept (decimated) sample: float64 as mne decodes EDF data, int16 in the compact pipeline
+BYTES_PER_SAMPLE = 2 if SIGNAL_PIPELINE_MODE == 'compact' else 8
+# Bytes per full-rate sample of the block being read: a float64 block from mne,
+# or an int16 copy plus its float32 conversion in the compact pipeline
+CHUNK_BYTES_PER_SAMPLE = 6 if SIGNAL_PIPELINE_MODE == 'compact' else 8
+# Bytes per kept sample of the signal viewer's pyramid: float32 samples plus
+# (min, max) levels (1 + 2/(factor-1) values), held as per-level arrays and
+# again as the concatenated copy that is written out
+PYRAMID_BYTES_PER_SAMPLE = 2 * 4 * (1 + 2 / (PYRAMID_FACTOR - 1))
+# How often waiting jobs re-check the queue and report their position (s)
+QUEUE_POLL_SEC = 0.5
+
+_cond = threading.Condition()
+_queue = deque()
+_in_use = 0
+
+def estimate_analysis_memory(header):
+    """Estimate an analysis's peak memory from an EDF header
+
+    Channels are read READ_CHUNK_SEC at a time and only their decimated
+    output is kept, so the peak is each channel at its FEATURE_TARGET_SFREQ
+    rate over the whole recording plus the larger of one full-rate block per
+    channel (while reading) and the signal viewer's pyramid (built after).
+    mne resamples every channel to the file's highest rate, while the
+    compact pipeline keeps each channel's own rate.
+    """
+    duration = max(header['n_records'], 0) * header['record_duration']
+    channels = [
+        (label, n / header['record_duration'])
+        for label, n in zip(header['labels'], header['samples_per_record'])
+        if label != 'EDF Annotations'
+    ]
+    if not channels or header['record_duration'] <= 0:
+        return 0
+    if SIGNAL_PIPELINE_MODE != 'compact':
+        top = max(rate for _, rate in channels)
+        channels = [(label, top) for label, _ in channels]
+
+    kept = sum(
+        duration * rate / decimation_factor(rate, FEATURE_TARGET_SFREQ.get(channel_kind(label)))
+        for label, rate in channels
+    )
+    block = min(duration, READ_CHUNK_SEC) * sum(rate for _, rate in channels)
+    return int(kept * BYTES_PER_SAMPLE + max(block * CHUNK_BYTES_PER_SAMPLE, kept * PYRAMID_BYTES_PER_SAMPLE))
+
+def fits_budget(estimate):
+    """Whether a job of this size can ever be admitted"""
+    return estimate <= ANALYSIS_MEMORY_BUDGET_BYTES
+
+def admission_status():
+    """Bytes currently admitted and number of queued jobs"""
+    with _cond:
+        return {'in_use_bytes': _in_use, 'queued': len(_queue), 'budget_bytes': ANALYSIS_MEMORY_BUDGET_BYTES}
+
+@contextmanager
+def admitted(estimate, on_wait=None):
+    """Block until a job of estimated size fits the global memory budget
+
+    Jobs are admitted in arrival order. While waiting, on_wait(position) is
+    called with the job's 1-based place in the queue.
+    """
+    global _in_use
+    ticket = object()
+    with _cond:
+        _queue.append(ticket)
+
+    try:
+        while True:
+            with _cond:
+                if _queue[0] is ticket and _in_use + estimate <= ANALYSIS_MEMORY_BUDGET_BYTES:
+                    _queue.popleft()
+                    _in_use += estimate
+                    _cond.notify_all()
+                    break
+                position = _queue.index(ticket) + 1
+                _cond.wait(QUEUE_POLL_SEC)
+            if on_wait is not None:
+                on_wait(position)
+    except BaseException:
+        # Abandoned while queued (e.g. the user navigated away)
+        with _cond:
+            if ticket in _queue:
+                _queue.remove(ticket)
+            _cond.notify_all()
+        raise
+
+    try:
+        yield
+    finally:
+        with _cond:
+            _in_use -= estimate
+            _cond.notify_all()
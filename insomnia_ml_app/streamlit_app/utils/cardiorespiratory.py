@@ -0,0 +1,224 @@
+import numpy as np
+from scipy.signal import butter, sosfiltfilt, find_peaks
+from scipy.ndimage import median_filter, uniform_filter1d
+from utils.signals import get_signal_pool, channel_data, epoch_view
+from utils.sleep_architecture import stage_codes, STAGE_ORDER
+from utils.progress import check_cancelled
+
+EPOCH_SEC = 30
+SLEEP_STAGES = ['N1', 'N2', 'N3', 'REM']
+SLEEP_CODES = [STAGE_ORDER.index(s) for s in SLEEP_STAGES]
+
+# R-peak detection
+QRS_BAND_HZ = (5, 20)
+MIN_RR_SEC, MAX_RR_SEC = 0.3, 2.0
+# A beat whose RR deviates more than this from its neighbours' median is ectopic/missed
+RR_OUTLIER_RATIO = 0.2
+
+# Tachogram resampling and HRV bands for LF/HF
+TACHOGRAM_HZ = 4
+HRV_WINDOW_SEC = 300
+LF_BAND_HZ = (0.04, 0.15)
+HF_BAND_HZ = (0.15, 0.4)
+
+# Breath detection
+BREATH_BAND_HZ = (0.1, 0.7)
+MIN_BREATH_SEC = 1.5
+
+# Oxygen desaturation: drop of ODI_DROP_PERCENT below the trailing baseline
+ODI_DROP_PERCENT = 3
+ODI_BASELINE_SEC = 120
+ODI_MIN_EVENT_SEC = 10
+SPO2_VALID_RANGE = (50, 100)
+
+def _bandpass(data, sfreq, band):
+    high = min(band[1], 0.45 * sfreq)
+    sos = butter(3, [band[0], high], btype='bandpass', fs=sfreq, output='sos')
+    return sosfiltfilt(sos, data)
+
+def _epoch_thresholds(values, sfreq, q, scale):
+    """Per-sample threshold: scale x the q-th percentile of each sample's epoch"""
+    epochs = epoch_view(values, sfreq, EPOCH_SEC)
+    if not len(epochs):
+        return np.full(len(values), np.inf)
+    per_epoch = np.percentile(epochs, q, axis=1) * scale
+    per_sample = np.repeat(per_epoch, epochs.shape[1])
+    return np.pad(per_sample, (0, len(values) - len(per_sample)), mode='edge')
+
+def _beat_epochs(times, n_epochs):
+    return np.minimum((times // EPOCH_SEC).astype(int), n_epochs - 1)
+
+def _stage_means(values, value_codes, prefix, suffix):
+    """Mean of values per stage, keyed like 'hr_rem_bpm'"""
+    out = {}
+    for name in ['W'] + SLEEP_STAGES:
+        mask = value_codes == STAGE_ORDER.index(name)
+        if mask.any():
+            out[f'{prefix}_{name.lower()}_{suffix}'] = float(values[mask].mean())
+    return out
+
+def _sleep_mean(values, value_codes):
+    """Mean over values recorded during sleep (all values if none were)"""
+    asleep = np.isin(value_codes, SLEEP_CODES)
+    return float(values[asleep].mean() if asleep.any() else values.mean())
+
+def detect_r_peaks(ecg, sfreq):
+    """R-peak sample indices from a whole ECG channel"""
+    filtered = _bandpass(ecg, sfreq, QRS_BAND_HZ)
+    # Polarity-independent QRS energy envelope
+    energy = filtered ** 2
+    threshold = _epoch_thresholds(energy, sfreq, 99, 0.3)
+    peaks, _ = find_peaks(energy, distance=int(MIN_RR_SEC * sfreq))
+    return peaks[energy[peaks] > threshold[peaks]]
+
+def ecg_features(ch, codes):
+    """Heart rate and HRV per stage from R-R intervals"""
+    sfreq = ch['sfreq']
+    peaks = detect_r_peaks(channel_data(ch), sfreq)
+    if len(peaks) < 10:
+        return {}
+
+    times = peaks[1:] / sfreq
+    rr = np.diff(peaks) / sfreq
+    local = median_filter(rr, size=5, mode='nearest')
+    valid = (rr >= MIN_RR_SEC) & (rr <= MAX_RR_SEC) & (np.abs(rr - local) <= RR_OUTLIER_RATIO * local)
+
+    epochs = _beat_epochs(times, len(codes))
+    flags = ch.get('quality')
+    if flags is not None and len(flags):
+        valid &= flags[np.minimum(epochs, len(flags) - 1)] == 0
+    if valid.sum() < 10:
+        return {}
+
+    beat_codes = codes[epochs]
+    hr = 60 / rr[valid]
+    features = {'hr_mean_bpm': _sleep_mean(hr, beat_codes[valid])}
+    features.update(_stage_means(hr, beat_codes[valid], 'hr', 'bpm'))
+
+    # RMSSD over pairs of consecutive valid beats in the same stage
+    pair = valid[1:] & valid[:-1] & (beat_codes[1:] == beat_codes[:-1])
+    if pair.any():
+        squared = (np.diff(rr)[pair] * 1000) ** 2
+        pair_codes = beat_codes[1:][pair]
+        features['rmssd_ms'] = float(np.sqrt(_sleep_mean(squared, pair_codes)))
+        features.update({k: float(np.sqrt(v)) for k, v in _stage_means(squared, pair_codes, 'rmssd', 'ms').items()})
+
+    features.update(_lf_hf(times[valid], rr[valid], codes))
+    return features
+
+def _lf_hf(times, rr, codes):
+    """LF/HF ratio over 5-minute windows of an evenly resampled tachogram"""
+    n = int(len(codes) * EPOCH_SEC * TACHOGRAM_HZ)
+    grid = np.arange(n) / TACHOGRAM_HZ
+    tachogram = np.interp(grid, times, rr)
+    windows = epoch_view(tachogram, TACHOGRAM_HZ, HRV_WINDOW_SEC)
+    if not len(windows):
+        return {}
+
+    # Windows with too few real beats are gaps bridged by interpolation
+    beats = np.bincount((times // HRV_WINDOW_SEC).astype(int), minlength=len(windows))[:len(windows)]
+    usable = beats >= 0.5 * HRV_WINDOW_SEC / MAX_RR_SEC
+    if not usable.any():
+        return {}
+
+    detrended = windows - windows.mean(axis=1, keepdims=True)
+    power = np.abs(np.fft.rfft(detrended * np.hanning(windows.shape[1]), axis=1)) ** 2
+    freqs = np.fft.rfftfreq(windows.shape[1], 1 / TACHOGRAM_HZ)
+    lf = power[:, (freqs >= LF_BAND_HZ[0]) & (freqs < LF_BAND_HZ[1])].sum(axis=1)
+    hf = power[:, (freqs >= HF_BAND_HZ[0]) & (freqs < HF_BAND_HZ[1])].sum(axis=1)
+    ratio = (lf / np.maximum(hf, 1e-12))[usable]
+
+    # Each window takes the most common stage among its epochs
+    per_window = HRV_WINDOW_SEC // EPOCH_SEC
+    window_codes = codes[:len(windows) * per_window].reshape(len(windows), per_window)
+    counts = (window_codes[:, :, None] == np.arange(len(STAGE_ORDER))).sum(axis=1)
+    majority = counts.argmax(axis=1)[usable]
+
+    features = {'lf_hf_ratio': float(np.median(ratio))}
+    features.update(_stage_means(ratio, majority, 'lf_hf', 'ratio'))
+    return features
+
+def resp_features(ch, codes):
+    """Breathing rate overall and per stage from respiratory effort/airflow"""
+    sfreq = ch['sfreq']
+    filtered = _bandpass(channel_data(ch), sfreq, BREATH_BAND_HZ)
+    prominence = _epoch_thresholds(np.abs(filtered), sfreq, 75, 0.5)
+    peaks, props = find_peaks(filtered, distance=int(MIN_BREATH_SEC * sfreq), prominence=0)
+    peaks = peaks[props['prominences'] > prominence[peaks]]
+    if len(peaks) < 10:
+        return {}
+
+    breaths = np.bincount(_beat_epochs(peaks / sfreq, len(codes)), minlength=len(codes))[:len(codes)]
+    rate = breaths * (60 / EPOCH_SEC)
+
+    features = {'resp_rate_bpm': _sleep_mean(rate, codes)}
+    features.update(_stage_means(rate, codes, 'resp_rate', 'bpm'))
+    return features
+
+def spo2_features(ch, codes):
+    """Oxygen saturation summary and 3% desaturation index over sleep"""
+    sfreq = ch['sfreq']
+    spo2 = np.asarray(channel_data(ch), dtype=float)
+    valid = (spo2 >= SPO2_VALID_RANGE[0]) & (spo2 <= SPO2_VALID_RANGE[1])
+
+    n = min(len(spo2), int(len(codes) * EPOCH_SEC * sfreq))
+    sample_codes = np.repeat(codes, int(round(EPOCH_SEC * sfreq)))[:n]
+    asleep = np.zeros(len(spo2), dtype=bool)
+    asleep[:n] = np.isin(sample_codes, SLEEP_CODES)
+    if not (valid & asleep).any():
+        return {}
+
+    # Trailing baseline: mean of the previous ODI_BASELINE_SEC of valid samples
+    size = int(ODI_BASELINE_SEC * sfreq)
+    filled = np.interp(np.arange(len(spo2)), np.flatnonzero(valid), spo2[valid])
+    baseline = uniform_filter1d(filled, size=size, origin=(size - 1) // 2, mode='nearest')
+    desat = valid & asleep & (spo2 <= baseline - ODI_DROP_PERCENT)
+
+    # Events are runs of desaturated samples lasting at least ODI_MIN_EVENT_SEC
+    edges = np.diff(np.concatenate([[0], desat.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    events = int(np.sum(ends - starts >= ODI_MIN_EVENT_SEC * sfreq))
+
+    sleep_hours = asleep.sum() / sfreq / 3600
+    in_sleep = spo2[valid & asleep]
+    return {
+        'spo2_mean_percent': float(in_sleep.mean()),
+        'spo2_min_percent': float(in_sleep.min()),
+        't90_percent': float(100 * np.mean(in_sleep < 90)),
+        'odi3_per_hour': events / sleep_hours if sleep_hours > 0 else 0.0,
+    }
+
+CARDIORESPIRATORY_EXTRACTORS = {
+    'ecg':  ecg_features,
+    'resp': resp_features,
+    'spo2': spo2_features,
+}
+
+def _run_extractor(kind, ch, codes, cancel):
+    check_cancelled(cancel)
+    return CARDIORESPIRATORY_EXTRACTORS[kind](ch, codes)
+
+def extract_cardiorespiratory_features(channels, sleep_stages, cancel=None):
+    """Per-stage heart, breathing and oxygen features, one channel per pool worker
+
+    Uses the first channel of each kind in CARDIORESPIRATORY_EXTRACTORS.
+    """
+    codes = stage_codes(sleep_stages)
+    if not len(codes):
+        return {}
+
+    selected = {}
+    for ch in channels:
+        if ch['kind'] in CARDIORESPIRATORY_EXTRACTORS and ch['kind'] not in selected:
+            selected[ch['kind']] = ch
+
+    futures = [get_signal_pool().submit(_run_extractor, kind, ch, codes, cancel)
+               for kind, ch in selected.items()]
+    features = {}
+    try:
+        for future in futures:
+            features.update(future.result())
+    finally:
+        for future in futures:
+            future.cancel()
+    return features
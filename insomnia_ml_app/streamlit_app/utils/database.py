@@ -1,7 +1,12 @@
 import sqlite3
 import hashlib
 import os
-from config import DB_PATH
+from datetime import datetime
+from config import DB_PATH, ADMIN_USERS
+from utils.ml_pipeline import FEATURE_COLS, SEVERITY_LEVELS
+
+# Metrics stored with each analysis and summed per day for the dashboard
+ANALYSIS_FEATURES = FEATURE_COLS
 
 def init_db():
     """Initialize database"""
@@ -18,6 +23,36 @@ def init_db():
         )
     ''')
     
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS analyses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            day TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            severity TEXT NOT NULL,
+            upload_hash TEXT,
+            {', '.join(f'{col} REAL' for col in ANALYSIS_FEATURES)}
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_analyses_user ON analyses (username, created_at)')
+    
+    # Summary tables, updated in the same transaction as each stored analysis
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS daily_severity_counts (
+            day TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, severity)
+        )
+    ''')
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS daily_feature_sums (
+            day TEXT PRIMARY KEY,
+            analyses INTEGER NOT NULL,
+            {', '.join(f'sum_{col} REAL NOT NULL' for col in ANALYSIS_FEATURES)}
+        )
+    ''')
+    
     conn.commit()
     conn.close()
 
@@ -27,6 +62,9 @@ def hash_password(password):
 
 def register_user(username, email, password):
     """Register new user"""
+    # Admin names are granted by configuration, never claimed by signing up
+    if username.strip().lower() in {u.lower() for u in ADMIN_USERS}:
+        return False, "Username already exists!"
     try:
         conn = sqlite3.connect(DB_PATH)
         c = conn.cursor()
@@ -97,3 +135,142 @@ def username_exists(username):
         return result is not None
     except:
         return False
+
+def save_analysis(username, severity, features, upload_hash=None):
+    """Store an analysis and update the daily summary tables in one transaction"""
+    try:
+        now = datetime.now()
+        day = now.strftime('%Y-%m-%d')
+        values = [float(features.get(col) or 0) for col in ANALYSIS_FEATURES]
+        columns = ', '.join(ANALYSIS_FEATURES)
+        sums = ', '.join(f'sum_{col}' for col in ANALYSIS_FEATURES)
+        placeholders = ', '.join('?' for _ in ANALYSIS_FEATURES)
+        
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        with conn:
+            conn.execute(
+                f'INSERT INTO analyses (username, day, created_at, severity, upload_hash, {columns}) '
+                f'VALUES (?, ?, ?, ?, ?, {placeholders})',
+                (username, day, now.isoformat(' ', 'seconds'), severity, upload_hash, *values)
+            )
+            conn.execute(
+                'INSERT INTO daily_severity_counts (day, severity, count) VALUES (?, ?, 1) '
+                'ON CONFLICT(day, severity) DO UPDATE SET count = count + 1',
+                (day, severity)
+            )
+            conn.execute(
+                f'INSERT INTO daily_feature_sums (day, analyses, {sums}) VALUES (?, 1, {placeholders}) '
+                f'ON CONFLICT(day) DO UPDATE SET analyses = analyses + 1, '
+                + ', '.join(f'sum_{col} = sum_{col} + excluded.sum_{col}' for col in ANALYSIS_FEATURES),
+                (day, *values)
+            )
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"Error saving analysis: {str(e)}")
+        return False
+
+def severity_distribution():
+    """Total analyses per severity level"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        rows = dict(conn.execute(
+            'SELECT severity, SUM(count) FROM daily_severity_counts GROUP BY severity'
+        ).fetchall())
+        conn.close()
+        return {level: rows.get(level, 0) for level in SEVERITY_LEVELS}
+    except Exception as e:
+        print(f"Error reading severity distribution: {str(e)}")
+        return {}
+
+def daily_analysis_volume(days=30):
+    """(day, severity, count) rows for the most recent days with analyses"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        rows = conn.execute(
+            'SELECT day, severity, count FROM daily_severity_counts WHERE day >= '
+            '(SELECT MIN(day) FROM (SELECT DISTINCT day FROM daily_severity_counts ORDER BY day DESC LIMIT ?)) '
+            'ORDER BY day',
+            (days,)
+        ).fetchall()
+        conn.close()
+        return rows
+    except Exception as e:
+        print(f"Error reading analysis volume: {str(e)}")
+        return []
+
+def average_metrics():
+    """Number of analyses and the mean of each stored metric across them"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        row = conn.execute(
+            f"SELECT SUM(analyses), {', '.join(f'SUM(sum_{col})' for col in ANALYSIS_FEATURES)} FROM daily_feature_sums"
+        ).fetchone()
+        conn.close()
+        total = row[0] or 0
+        if not total:
+            return 0, {}
+        return total, {col: value / total for col, value in zip(ANALYSIS_FEATURES, row[1:])}
+    except Exception as e:
+        print(f"Error reading average metrics: {str(e)}")
+        return 0, {}
+
+def analysis_history():
+    """(id, upload_hash, severity) for every stored analysis with an upload hash"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        rows = conn.execute(
+            'SELECT id, upload_hash, severity FROM analyses WHERE upload_hash IS NOT NULL ORDER BY id'
+        ).fetchall()
+        conn.close()
+        return rows
+    except Exception as e:
+        print(f"Error reading analysis history: {str(e)}")
+        return []
+
+def update_analyses(updates):
+    """Overwrite (id, severity, features) of stored analyses and rebuild the daily summaries
+
+    Runs as one transaction, so the dashboard never sees a half re-scored history.
+    """
+    try:
+        columns = ', '.join(f'{col} = ?' for col in ANALYSIS_FEATURES)
+        sums = ', '.join(f'sum_{col}' for col in ANALYSIS_FEATURES)
+        
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        with conn:
+            conn.executemany(
+                f'UPDATE analyses SET severity = ?, {columns} WHERE id = ?',
+                [(severity, *[float(features.get(col) or 0) for col in ANALYSIS_FEATURES], analysis_id)
+                 for analysis_id, severity, features in updates]
+            )
+            conn.execute('DELETE FROM daily_severity_counts')
+            conn.execute(
+                'INSERT INTO daily_severity_counts (day, severity, count) '
+                'SELECT day, severity, COUNT(*) FROM analyses GROUP BY day, severity'
+            )
+            conn.execute('DELETE FROM daily_feature_sums')
+            conn.execute(
+                f'INSERT INTO daily_feature_sums (day, analyses, {sums}) '
+                f"SELECT day, COUNT(*), {', '.join(f'SUM({col})' for col in ANALYSIS_FEATURES)} FROM analyses GROUP BY day"
+            )
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"Error updating analyses: {str(e)}")
+        return False
+
+def analysis_vectors(after_id=0):
+    """(id, day, severity, upload_hash, *ANALYSIS_FEATURES) rows of the analyses with an id above after_id"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        rows = conn.execute(
+            f"SELECT id, day, severity, upload_hash, {', '.join(ANALYSIS_FEATURES)} FROM analyses "
+            "WHERE id > ? ORDER BY id",
+            (after_id,)
+        ).fetchall()
+        conn.close()
+        return rows
+    except Exception as e:
+        print(f"Error reading analysis vectors: {str(e)}")
+        return []
@@ -0,0 +1,85 @@
+import os
+import time
+import uuid
+import numpy as np
+from config import EPOCH_CACHE_DIR, EPOCH_CACHE_QUOTA_BYTES, EPOCH_CACHE_TTL_SEC
+
+# Bumped when the stored arrays change meaning; older files are ignored
+EPOCH_CACHE_VERSION = 1
+
+def epoch_cache_path(upload_hash):
+    return os.path.join(EPOCH_CACHE_DIR, f"epochs_{upload_hash}.npz")
+
+def save_epoch_matrix(upload_hash, stages, epoch_features=None, good=None, auto_staged=False):
+    """Store an analysis's per-epoch stage codes and staging features, keyed by upload hash
+
+    stages are STAGE_ORDER codes; epoch_features is the (n_epochs,
+    len(EPOCH_FEATURES)) staging matrix and good its clean-epoch mask, both
+    absent for hypnogram-only analyses. Written compressed via a temp file
+    and rename, so readers never see a partial file.
+    """
+    path = epoch_cache_path(upload_hash)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    arrays = {
+        'version': np.array(EPOCH_CACHE_VERSION),
+        'stages': np.asarray(stages, dtype=np.int8),
+        'auto_staged': np.array(bool(auto_staged)),
+    }
+    if epoch_features is not None:
+        arrays['features'] = np.asarray(epoch_features, dtype=np.float32)
+        arrays['good'] = np.asarray(good if good is not None else np.ones(len(epoch_features)), dtype=bool)
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"Error saving epoch matrix: {str(e)}")
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def load_epoch_matrix(upload_hash):
+    """The stored epoch arrays for an upload hash as a dict, None if missing or outdated"""
+    path = epoch_cache_path(upload_hash)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as f:
+            if int(f['version']) != EPOCH_CACHE_VERSION:
+                return None
+            matrix = {k: f[k] for k in f.files if k != 'version'}
+        matrix['auto_staged'] = bool(matrix['auto_staged'])
+        return matrix
+    except Exception as e:
+        print(f"Error loading epoch matrix: {str(e)}")
+        return None
+
+def prune_epoch_cache(quota_bytes=EPOCH_CACHE_QUOTA_BYTES, ttl=EPOCH_CACHE_TTL_SEC):
+    """Drop entries older than ttl seconds, then the oldest ones until under quota
+
+    Entries age from their last save, so re-analysing a recording renews it;
+    loading (e.g. by tools/rescore_history.py) does not. Returns the number
+    of bytes freed.
+    """
+    entries = []
+    for entry in os.scandir(EPOCH_CACHE_DIR):
+        if entry.is_file() and entry.name.startswith('epochs_'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+
+    freed = 0
+    total = sum(size for _, size, _ in entries)
+    cutoff = time.time() - ttl
+    for mtime, size, path in entries:
+        if mtime >= cutoff and total <= quota_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        freed += size
+    return freed
@@ -0,0 +1,46 @@
+import numpy as np
+from utils.ml_pipeline import FEATURE_COLS, SEVERITY_LEVELS, HEURISTIC_RULES, heuristic_levels
+
+FEATURE_LABELS = {
+    'sleep_onset_latency_min':    'Sleep Onset Latency',
+    'total_sleep_time_min':       'Total Sleep Time',
+    'wake_after_sleep_onset_min': 'Wake After Sleep Onset',
+    'rem_latency_min':            'REM Latency',
+    'sleep_efficiency_percent':   'Sleep Efficiency',
+    'percent_w':                  'Wake %',
+    'percent_n1':                 'N1 Sleep %',
+    'percent_n2':                 'N2 Sleep %',
+    'percent_n3':                 'Deep Sleep (N3) %',
+    'percent_rem':                'REM Sleep %',
+}
+
+def _rule_text(direction, thresholds, z, level):
+    """Plain-language verdict of one heuristic rule"""
+    if level == 0:
+        return f"{z:+.2f} SD, meets the {SEVERITY_LEVELS[0]} threshold of {direction} {thresholds[0]:+.1f} SD"
+    return f"{z:+.2f} SD, not {direction} {thresholds[level - 1]:+.1f} SD: allows at best {SEVERITY_LEVELS[level]}"
+
+def explain_prediction(normalized_features, severity, features=None):
+    """Why the threshold heuristic gave this severity: (label, verdict, decisive) per rule
+
+    predict_severity grades onset latency, WASO and sleep efficiency
+    (normalized against the training data) against fixed thresholds and
+    takes the worst grade; decisive marks the rules that set the result.
+    With features, each verdict starts with the metric's own value.
+    """
+    try:
+        z = np.atleast_2d(normalized_features)[0]
+        levels = heuristic_levels(z)[0]
+        worst = int(levels.max())
+        rows = []
+        for (feature, direction, thresholds), level in sorted(
+                zip(HEURISTIC_RULES, levels), key=lambda rule: -rule[1]):
+            verdict = _rule_text(direction, thresholds, z[FEATURE_COLS.index(feature)], int(level))
+            if features and feature in features:
+                unit = '%' if feature.endswith('percent') else ' min'
+                verdict = f"{features[feature]:.1f}{unit} · {verdict}"
+            rows.append((FEATURE_LABELS[feature], verdict, bool(level == worst and worst > 0)))
+        return rows
+    except Exception as e:
+        print(f"Error explaining prediction: {str(e)}")
+        return None
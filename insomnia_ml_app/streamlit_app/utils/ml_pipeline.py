@@ -1,148 +1,608 @@
+import os
 import pandas as pd
 import numpy as np
 import joblib
 import tempfile
 import warnings
-import mne
+from datetime import datetime
+from functools import lru_cache
+from concurrent.futures import as_completed
+from xml.etree.ElementTree import iterparse
 from sklearn.preprocessing import StandardScaler
-from config import MODEL_PATH, DATA_PATH
+from config import MODEL_PATH, DATA_PATH, SIGNAL_WORKERS
+from utils.sleep_architecture import compute_architecture_metrics, stage_codes, split_sleep_periods, STAGE_ORDER
+from utils.sleep_staging import stage_psg, classify_epochs, compute_epoch_features
+from utils.signals import read_psg_channels, channel_kind, slice_channel
+from utils.signal_features import extract_signal_features
+from utils.signal_pyramid import build_pyramid
+from utils.signal_quality import epoch_mask, quality_summary
+from utils.cardiorespiratory import extract_cardiorespiratory_features
+from utils.progress import AnalysisCancelled, check_cancelled, report, progress_range
+from utils.profiling import AttributedThreadPoolExecutor
+from utils.epoch_cache import save_epoch_matrix
 
 warnings.filterwarnings('ignore')
 
-def extract_features_from_edf(psg_file, hypno_file):
-    """Extract features from EDF files"""
+# Stage mapping
+STAGE_MAPPING = {
+    'Sleep stage W': 'W',
+    'Sleep stage 1': 'N1',
+    'Sleep stage 2': 'N2',
+    'Sleep stage 3': 'N3',
+    'Sleep stage 4': 'N3',
+    'Sleep stage R': 'REM',
+    'Sleep stage ?': 'UNKNOWN'
+}
+
+EPOCH_DURATION = 30
+
+# Model input features, in training order
+FEATURE_COLS = ['sleep_onset_latency_min', 'total_sleep_time_min', 'wake_after_sleep_onset_min',
+                'rem_latency_min', 'sleep_efficiency_percent', 'percent_w', 'percent_n1',
+                'percent_n2', 'percent_n3', 'percent_rem']
+
+# Severity classes, in the order of predict_severity probabilities
+SEVERITY_LEVELS = ['No Insomnia', 'Mild', 'Moderate', 'Severe']
+
+def stages_from_annotations(annotations):
+    """Expand hypnogram annotations into a per-epoch stage sequence"""
+    stages = np.array([STAGE_MAPPING.get(d, 'UNKNOWN') for d in annotations.description], dtype=object)
+    num_epochs = np.maximum(1, (np.asarray(annotations.duration) / EPOCH_DURATION).astype(int))
+    return list(np.repeat(stages, num_epochs))
+
+# Stage labels used by CSV/TSV stage lists and XML exports (upper-cased).
+# Numeric codes follow the R&K/NSRR convention: 0=W, 1-4=S1-S4, 5=REM.
+TEXT_STAGE_MAPPING = {
+    'W': 'W', 'WAKE': 'W', '0': 'W',
+    'N1': 'N1', 'S1': 'N1', '1': 'N1',
+    'N2': 'N2', 'S2': 'N2', '2': 'N2',
+    'N3': 'N3', 'S3': 'N3', 'S4': 'N3', 'N4': 'N3', '3': 'N3', '4': 'N3',
+    'R': 'REM', 'REM': 'REM', '5': 'REM',
+}
+TEXT_STAGE_MAPPING.update({k.upper(): v for k, v in STAGE_MAPPING.items()})
+
+# Column names that hold the stage in CSV/TSV files with a header row
+STAGE_COLUMN_NAMES = {'stage', 'stages', 'sleep_stage', 'sleep stage', 'hypnogram', 'label', 'score'}
+
+def detect_hypnogram_format(hypno_file):
+    """Sniff a hypnogram file's format: 'edf', 'xml' or 'text'"""
+    with open(hypno_file, 'rb') as f:
+        head = f.read(256)
+    if head[:8].strip() == b'0' and len(head) == 256:
+        return 'edf'
+    if head.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'<'):
+        return 'xml'
+    return 'text'
+
+def _map_text_stages(values):
+    """Vectorized mapping of raw stage labels to internal stages"""
+    labels = pd.Series(values, dtype=str).str.strip().str.upper()
+    # Numeric exports may write stages as floats ("2.0")
+    labels = labels.str.replace(r'^(\d)\.0+$', r'\1', regex=True)
+    return labels.map(TEXT_STAGE_MAPPING).fillna('UNKNOWN')
+
+def read_text_stages(hypno_file):
+    """Read a CSV/TSV/whitespace stage list with one stage per 30 s epoch"""
+    with open(hypno_file, 'r', errors='replace') as f:
+        first_line = f.readline()
+    sep = next((d for d in ('\t', ',', ';') if d in first_line), r'\s+')
+    
+    table = pd.read_csv(hypno_file, sep=sep, header=None, dtype=str, engine='c', skip_blank_lines=True,
+                        comment='#')
+    header = [str(v).strip().lower() for v in table.iloc[0]]
+    has_header = _map_text_stages(table.iloc[0]).eq('UNKNOWN').all()
+    
+    column = table.columns[-1]
+    if has_header:
+        named = [c for c, name in zip(table.columns, header) if name in STAGE_COLUMN_NAMES]
+        column = named[0] if named else column
+        table = table.iloc[1:]
+    
+    return list(_map_text_stages(table[column]))
+
+def read_xml_stages(hypno_file):
+    """Read NSRR (ScoredEvent) or Compumedics Profusion (SleepStage) XML hypnograms"""
+    starts, durations, events, profusion = [], [], [], []
+    epoch_length = EPOCH_DURATION
+    fields = {}
+    
+    for _, elem in iterparse(hypno_file, events=('end',)):
+        tag = elem.tag.rsplit('}', 1)[-1]
+        if tag in ('EventType', 'EventConcept', 'Start', 'Duration'):
+            fields[tag] = (elem.text or '').strip()
+        elif tag == 'ScoredEvent':
+            if 'stage' in fields.get('EventType', '').lower():
+                events.append(fields.get('EventConcept', '').rsplit('|', 1)[-1])
+                starts.append(float(fields.get('Start', 0)))
+                durations.append(float(fields.get('Duration', EPOCH_DURATION)))
+            fields = {}
+            elem.clear()
+        elif tag == 'SleepStage':
+            profusion.append((elem.text or '').strip())
+            elem.clear()
+        elif tag == 'EpochLength':
+            epoch_length = float(elem.text)
+    
+    if profusion:
+        stages = _map_text_stages(profusion).to_numpy(dtype=object)
+        return list(np.repeat(stages, max(1, int(epoch_length // EPOCH_DURATION))))
+    
+    if not events:
+        raise ValueError("No sleep stage events found in XML hypnogram")
+    
+    # Place each scored event at its start epoch, leaving gaps as UNKNOWN
+    stages = _map_text_stages(events).to_numpy(dtype=object)
+    start_idx = (np.asarray(starts) // EPOCH_DURATION).astype(int)
+    counts = np.maximum(1, (np.asarray(durations) // EPOCH_DURATION).astype(int))
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    positions = np.repeat(start_idx, counts) + offsets
+    
+    sequence = np.full(positions.max() + 1, 'UNKNOWN', dtype=object)
+    sequence[positions] = np.repeat(stages, counts)
+    return list(sequence)
+
+def read_sleep_stages(hypno_file):
+    """Read the per-epoch stage sequence from an EDF+, CSV/TSV or XML hypnogram"""
+    hypno_format = detect_hypnogram_format(hypno_file)
+    if hypno_format == 'xml':
+        return read_xml_stages(hypno_file)
+    if hypno_format == 'text':
+        return read_text_stages(hypno_file)
+    
+    import mne
+    return stages_from_annotations(mne.read_annotations(hypno_file))
+
+def compute_sleep_features(sleep_stages):
+    """Compute night-level features from a per-epoch stage sequence"""
+    total_epochs = len(sleep_stages)
+    total_recording_time = total_epochs * 0.5
+    
+    stage_counts = pd.Series(sleep_stages).value_counts()
+    sleep_stages_list = ['N1', 'N2', 'N3', 'REM']
+    
+    sleep_epochs = sum(stage_counts.get(stage, 0) for stage in sleep_stages_list)
+    total_sleep_time = sleep_epochs * 0.5
+    
+    sleep_efficiency = (total_sleep_time / total_recording_time) * 100 if total_recording_time > 0 else 0
+    
     try:
-        # Read files
-        raw = mne.io.read_raw_edf(psg_file, preload=True, verbose=False)
-        annotations = mne.read_annotations(hypno_file)
-        raw.set_annotations(annotations)
-        
-        # Stage mapping
-        stage_mapping = {
-            'Sleep stage W': 'W',
-            'Sleep stage 1': 'N1',
-            'Sleep stage 2': 'N2',
-            'Sleep stage 3': 'N3',
-            'Sleep stage 4': 'N3',
-            'Sleep stage R': 'REM',
-            'Sleep stage ?': 'UNKNOWN'
-        }
-        
-        sleep_stages = []
-        epoch_duration = 30
-        
-        for onset, duration, description in zip(annotations.onset, annotations.duration, annotations.description):
-            stage = stage_mapping.get(description, 'UNKNOWN')
-            num_epochs = max(1, int(duration / epoch_duration))
-            for _ in range(num_epochs):
-                sleep_stages.append(stage)
-        
-        total_epochs = len(sleep_stages)
-        total_recording_time = total_epochs * 0.5
-        
-        stage_counts = pd.Series(sleep_stages).value_counts()
-        sleep_stages_list = ['N1', 'N2', 'N3', 'REM']
-        
-        sleep_epochs = sum(stage_counts.get(stage, 0) for stage in sleep_stages_list)
-        total_sleep_time = sleep_epochs * 0.5
+        first_sleep_idx = next(i for i, stage in enumerate(sleep_stages) if stage in sleep_stages_list)
+        sleep_onset_latency = first_sleep_idx * 0.5
+    except StopIteration:
+        sleep_onset_latency = 0
+        first_sleep_idx = None
+    
+    if first_sleep_idx is not None:
+        post_onset_stages = sleep_stages[first_sleep_idx:]
+        waso_epochs = sum(1 for stage in post_onset_stages if stage == 'W')
+        wake_after_sleep_onset = waso_epochs * 0.5
+    else:
+        wake_after_sleep_onset = 0
+    
+    try:
+        first_rem_idx = next(i for i, stage in enumerate(sleep_stages) if stage == 'REM')
+        rem_latency = (first_rem_idx - first_sleep_idx) * 0.5 if first_sleep_idx is not None else 0
+    except StopIteration:
+        rem_latency = 0
+    
+    percent_w = (stage_counts.get('W', 0) / total_epochs) * 100 if total_epochs > 0 else 0
+    percent_n1 = (stage_counts.get('N1', 0) / total_epochs) * 100 if total_epochs > 0 else 0
+    percent_n2 = (stage_counts.get('N2', 0) / total_epochs) * 100 if total_epochs > 0 else 0
+    percent_n3 = (stage_counts.get('N3', 0) / total_epochs) * 100 if total_epochs > 0 else 0
+    percent_rem = (stage_counts.get('REM', 0) / total_epochs) * 100 if total_epochs > 0 else 0
+    
+    features = {
+        'sleep_onset_latency_min': sleep_onset_latency,
+        'total_sleep_time_min': total_sleep_time,
+        'wake_after_sleep_onset_min': wake_after_sleep_onset,
+        'rem_latency_min': rem_latency,
+        'sleep_efficiency_percent': sleep_efficiency,
+        'percent_w': percent_w,
+        'percent_n1': percent_n1,
+        'percent_n2': percent_n2,
+        'percent_n3': percent_n3,
+        'percent_rem': percent_rem
+    }
+    
+    # Fragmentation, bout lengths and NREM/REM cycles
+    features.update(compute_architecture_metrics(sleep_stages))
+    
+    return features
+
+# Per-night bookkeeping, not averaged into a multi-night recording's headline features
+NIGHT_INFO_KEYS = ('night', 'start_min', 'duration_min')
+
+def sleep_periods(sleep_stages):
+    """Sleep periods [(start, stop)] of a multi-night recording, None for a single night"""
+    periods = split_sleep_periods(stage_codes(sleep_stages))
+    return None if periods == [(0, len(sleep_stages))] else periods
+
+def _night_info(night, start, stop):
+    return {'night': night, 'start_min': start * 0.5, 'duration_min': (stop - start) * 0.5}
+
+def average_night_features(nights):
+    """Headline features of a multi-night recording: each numeric feature averaged over the nights"""
+    values = {}
+    for night in nights:
+        for key, value in night.items():
+            if key not in NIGHT_INFO_KEYS and isinstance(value, (int, float, np.integer, np.floating)) \
+                    and not isinstance(value, bool):
+                values.setdefault(key, []).append(value)
+    features = {key: float(np.mean(v)) for key, v in values.items()}
+    features['num_nights'] = len(nights)
+    features['nights'] = nights
+    return features
+
+def compute_stage_features(sleep_stages):
+    """Stage-based features of a recording, averaged per night when it spans several"""
+    periods = sleep_periods(sleep_stages)
+    if periods is None:
+        return compute_sleep_features(sleep_stages)
+    return average_night_features([
+        {**_night_info(i, start, stop), **compute_sleep_features(sleep_stages[start:stop])}
+        for i, (start, stop) in enumerate(periods, 1)
+    ])
+
+# Fixed EDF header fields: (name, width)
+EDF_HEADER_FIELDS = [
+    ('version', 8), ('patient', 80), ('recording', 80), ('start_date', 8), ('start_time', 8),
+    ('header_bytes', 8), ('reserved', 44), ('n_records', 8), ('record_duration', 8), ('n_signals', 4)
+]
+# Per-signal EDF header fields, each stored as n_signals consecutive values
+EDF_SIGNAL_FIELDS = [
+    ('labels', 16), ('transducers', 80), ('dimensions', 8), ('physical_min', 8), ('physical_max', 8),
+    ('digital_min', 8), ('digital_max', 8), ('prefiltering', 80), ('samples_per_record', 8), ('signal_reserved', 32)
+]
+EDF_NUMERIC_SIGNAL_FIELDS = ('physical_min', 'physical_max', 'digital_min', 'digital_max', 'samples_per_record')
+
+# Max difference between PSG and hypnogram start times
+PREFLIGHT_START_TOLERANCE_SEC = 60
+
+def read_edf_header(edf_file):
+    """Read the fixed and signal headers of an EDF file without touching the data records"""
+    with open(edf_file, 'rb') as f:
+        fixed = f.read(256)
+        if len(fixed) < 256:
+            raise ValueError("File is too short to be an EDF file")
         
-        sleep_efficiency = (total_sleep_time / total_recording_time) * 100 if total_recording_time > 0 else 0
+        header, pos = {}, 0
+        for name, width in EDF_HEADER_FIELDS:
+            header[name] = fixed[pos:pos + width].decode('ascii', errors='replace').strip()
+            pos += width
         
+        if header['version'] != '0':
+            raise ValueError("File is not an EDF recording")
         try:
-            first_sleep_idx = next(i for i, stage in enumerate(sleep_stages) if stage in sleep_stages_list)
-            sleep_onset_latency = first_sleep_idx * 0.5
-        except StopIteration:
-            sleep_onset_latency = 0
-            first_sleep_idx = None
+            n_signals = int(header['n_signals'])
+            header['n_records'] = int(header['n_records'])
+            header['header_bytes'] = int(header['header_bytes'])
+            header['record_duration'] = float(header['record_duration'])
+        except ValueError:
+            raise ValueError("EDF header contains invalid numeric fields")
+        header['n_signals'] = n_signals
         
-        if first_sleep_idx is not None:
-            post_onset_stages = sleep_stages[first_sleep_idx:]
-            waso_epochs = sum(1 for stage in post_onset_stages if stage == 'W')
-            wake_after_sleep_onset = waso_epochs * 0.5
+        signal_block = f.read(256 * n_signals)
+        if len(signal_block) < 256 * n_signals:
+            raise ValueError("EDF signal headers are truncated")
+        f.seek(0, 2)
+        header['file_size'] = f.tell()
+    
+    pos = 0
+    for name, width in EDF_SIGNAL_FIELDS:
+        values = [signal_block[pos + i * width:pos + (i + 1) * width].decode('ascii', errors='replace').strip()
+                  for i in range(n_signals)]
+        if name in EDF_NUMERIC_SIGNAL_FIELDS:
+            try:
+                values = [float(v) if name != 'samples_per_record' else int(v) for v in values]
+            except ValueError:
+                raise ValueError(f"EDF signal header field '{name}' is invalid")
+        header[name] = values
+        pos += width * n_signals
+    
+    header['edf_plus'] = header['reserved'].startswith('EDF+')
+    header['record_bytes'] = 2 * sum(header['samples_per_record'])
+    header['duration_sec'] = max(header['n_records'], 0) * header['record_duration']
+    header['start'] = _edf_start(header['start_date'], header['start_time'])
+    return header
+
+def _edf_start(start_date, start_time):
+    """Parse EDF dd.mm.yy / hh.mm.ss start fields (1985-2084 clipping rule)"""
+    try:
+        day, month, year = (int(v) for v in start_date.split('.'))
+        hour, minute, second = (int(v) for v in start_time.split('.'))
+        year += 1900 if year >= 85 else 2000
+        return datetime(year, month, day, hour, minute, second)
+    except ValueError:
+        return None
+
+def _check_edf_size(header, label):
+    """Check the record count against the file size, returning an error or None"""
+    if header['header_bytes'] != 256 * (header['n_signals'] + 1):
+        return f"The {label} file has a corrupt header."
+    if header['n_records'] <= 0 or header['record_bytes'] == 0:
+        return f"The {label} file contains no data records."
+    expected = header['header_bytes'] + header['n_records'] * header['record_bytes']
+    if header['file_size'] < expected:
+        return f"The {label} file is truncated ({header['file_size']:,} of {expected:,} bytes)."
+    return None
+
+def preflight_edf_pair(psg_file, hypno_file=None):
+    """Validate PSG/hypnogram headers before any heavy processing"""
+    try:
+        psg = read_edf_header(psg_file)
+    except ValueError as e:
+        return False, f"PSG file: {e}."
+    except OSError as e:
+        return False, f"PSG file could not be read: {e}"
+    
+    error = _check_edf_size(psg, "PSG")
+    if error:
+        return False, error
+    
+    data_labels = [label for label in psg['labels'] if label != 'EDF Annotations']
+    if not data_labels:
+        return False, "The PSG file contains only annotations – did you upload the hypnogram in the PSG slot?"
+    
+    if hypno_file is None:
+        if not any(channel_kind(label) == 'eeg' for label in data_labels):
+            return False, "Automatic staging needs an EEG channel, but none was found in the PSG file."
+        return True, "OK"
+    
+    if detect_hypnogram_format(hypno_file) != 'edf':
+        return True, "OK"
+    
+    try:
+        hypno = read_edf_header(hypno_file)
+    except ValueError as e:
+        return False, f"Hypnogram file: {e}."
+    except OSError as e:
+        return False, f"Hypnogram file could not be read: {e}"
+    
+    if 'EDF Annotations' not in hypno['labels']:
+        if len(hypno['labels']) > 1:
+            return False, "The hypnogram file contains signal channels – did you swap the PSG and hypnogram files?"
+        return False, "The hypnogram file is not an EDF+ annotation file."
+    
+    error = _check_edf_size(hypno, "hypnogram")
+    if error:
+        return False, error
+    
+    if psg['start'] and hypno['start']:
+        offset = abs((hypno['start'] - psg['start']).total_seconds())
+        if offset > PREFLIGHT_START_TOLERANCE_SEC:
+            return False, (
+                f"The hypnogram starts at {hypno['start']:%Y-%m-%d %H:%M} but the PSG starts at "
+                f"{psg['start']:%Y-%m-%d %H:%M} – these files do not belong to the same recording."
+            )
+    
+    return True, "OK"
+
+def _slice_channels(channels, start, stop):
+    """Channels cut to epochs [start, stop), sharing memory with the originals"""
+    sliced = []
+    for ch in channels:
+        samples_per_epoch = ch['sfreq'] * EPOCH_DURATION
+        part = slice_channel(ch, int(round(start * samples_per_epoch)), int(round(stop * samples_per_epoch)))
+        if 'quality' in ch:
+            part['quality'] = ch['quality'][start:stop]
+        sliced.append(part)
+    return sliced
+
+def _analyze_night(channels, sleep_stages, night, start, stop, cancel):
+    """Stage, signal and cardiorespiratory features of one sleep period"""
+    check_cancelled(cancel)
+    stages = sleep_stages[start:stop]
+    night_channels = _slice_channels(channels, start, stop)
+    features = _night_info(night, start, stop)
+    features.update(compute_sleep_features(stages))
+    features['good_epochs_percent'] = quality_summary(night_channels)['good_epochs_percent']
+    features.update(extract_signal_features(night_channels, cancel=cancel)[0])
+    features.update(extract_cardiorespiratory_features(night_channels, stages, cancel=cancel))
+    return features
+
+def analyze_nights(channels, sleep_stages, periods, progress=None, cancel=None):
+    """Analyze every sleep period concurrently, returning per-night feature dicts in order
+
+    Each night runs on its own thread, which only coordinates: the channel
+    work of all nights lands on the shared signal pool, so a multi-day
+    recording keeps every worker busy.
+    """
+    executor = AttributedThreadPoolExecutor(max_workers=min(len(periods), SIGNAL_WORKERS), thread_name_prefix='night')
+    futures = [executor.submit(_analyze_night, channels, sleep_stages, i, start, stop, cancel)
+               for i, (start, stop) in enumerate(periods, 1)]
+    try:
+        for done, future in enumerate(as_completed(futures), 1):
+            future.result()
+            report(progress, done / len(futures), f"Analyzing nights… {done} of {len(futures)}")
+        return [future.result() for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+def extract_features_from_edf(psg_file, hypno_file=None, pyramid_path=None, progress=None, cancel=None,
+                              epoch_cache_key=None):
+    """Extract features from EDF files, staging the PSG when no hypnogram is given
+
+    With pyramid_path, the channels' min/max viewer pyramid is stored there
+    and its metadata returned under 'signal_pyramid'. With epoch_cache_key,
+    the per-epoch stages and staging features are kept in the epoch cache
+    for re-scoring without the EDF. A recording spanning several sleep
+    periods is analyzed night by night in parallel: the per-night features
+    are returned under 'nights' and the headline features are their mean.
+    progress(fraction, text)
+    follows the bytes read and channels processed; setting the cancel token
+    stops the work at the next chunk with AnalysisCancelled.
+    """
+    try:
+        # Read files
+        channels = read_psg_channels(psg_file, quality=True, progress=progress_range(progress, 0, 0.75), cancel=cancel)
+        
+        check_cancelled(cancel)
+        if hypno_file is None:
+            # No scored hypnogram: stage every epoch automatically, skipping artifacts
+            report(progress, 0.75, "Staging sleep automatically…")
+            X = compute_epoch_features(channels)
+            good = epoch_mask(channels, kinds=('eeg',), n_epochs=len(X))
+            sleep_stages = classify_epochs(X, good)
         else:
-            wake_after_sleep_onset = 0
+            report(progress, 0.75, "Reading hypnogram…")
+            sleep_stages = read_sleep_stages(hypno_file)
+            X = good = None
+            if epoch_cache_key and any(ch['kind'] == 'eeg' for ch in channels):
+                X = compute_epoch_features(channels)
+                good = epoch_mask(channels, kinds=('eeg',), n_epochs=len(X))
         
-        try:
-            first_rem_idx = next(i for i, stage in enumerate(sleep_stages) if stage == 'REM')
-            rem_latency = (first_rem_idx - first_sleep_idx) * 0.5 if first_sleep_idx is not None else 0
-        except StopIteration:
-            rem_latency = 0
+        if epoch_cache_key:
+            save_epoch_matrix(epoch_cache_key, stage_codes(sleep_stages), X, good, auto_staged=hypno_file is None)
         
-        percent_w = (stage_counts.get('W', 0) / total_epochs) * 100 if total_epochs > 0 else 0
-        percent_n1 = (stage_counts.get('N1', 0) / total_epochs) * 100 if total_epochs > 0 else 0
-        percent_n2 = (stage_counts.get('N2', 0) / total_epochs) * 100 if total_epochs > 0 else 0
-        percent_n3 = (stage_counts.get('N3', 0) / total_epochs) * 100 if total_epochs > 0 else 0
-        percent_rem = (stage_counts.get('REM', 0) / total_epochs) * 100 if total_epochs > 0 else 0
+        quality = quality_summary(channels)
+        periods = sleep_periods(sleep_stages)
+        if periods is None:
+            features = compute_sleep_features(sleep_stages)
+            features['good_epochs_percent'] = quality['good_epochs_percent']
+            
+            # Per-channel signal features, one channel per pool worker
+            signal_features, timings = extract_signal_features(
+                channels, progress=progress_range(progress, 0.8, 0.9), cancel=cancel
+            )
+            features.update(signal_features)
+            features['channel_timings_ms'] = timings
+            
+            # Heart rate, HRV, breathing and oxygen saturation per sleep stage
+            report(progress, 0.9, "Analyzing heart and breathing…")
+            features.update(extract_cardiorespiratory_features(channels, sleep_stages, cancel=cancel))
+        else:
+            # Several nights: each analyzed on its own, the headline is their mean
+            features = average_night_features(analyze_nights(
+                channels, sleep_stages, periods, progress=progress_range(progress, 0.8, 0.95), cancel=cancel
+            ))
+        features['signal_quality'] = quality
         
-        features = {
-            'sleep_onset_latency_min': sleep_onset_latency,
-            'total_sleep_time_min': total_sleep_time,
-            'wake_after_sleep_onset_min': wake_after_sleep_onset,
-            'rem_latency_min': rem_latency,
-            'sleep_efficiency_percent': sleep_efficiency,
-            'percent_w': percent_w,
-            'percent_n1': percent_n1,
-            'percent_n2': percent_n2,
-            'percent_n3': percent_n3,
-            'percent_rem': percent_rem
-        }
+        if pyramid_path:
+            check_cancelled(cancel)
+            report(progress, 0.95, "Preparing signal viewer…")
+            features['signal_pyramid'] = build_pyramid(channels, stage_codes(sleep_stages), pyramid_path)
         
+        report(progress, 1, "Features extracted")
         return features
+    except AnalysisCancelled:
+        raise
     except Exception as e:
         print(f"Error extracting features: {str(e)}")
         return None
 
-def normalize_features(features_dict):
-    """Normalize features"""
+def extract_features_from_hypnogram(hypno_file, epoch_cache_key=None):
+    """Extract stage-based features from a hypnogram alone, without a PSG"""
     try:
-        original_train = pd.read_csv(DATA_PATH)
-        
-        feature_cols = ['sleep_onset_latency_min', 'total_sleep_time_min', 'wake_after_sleep_onset_min',
-                       'rem_latency_min', 'sleep_efficiency_percent', 'percent_w', 'percent_n1',
-                       'percent_n2', 'percent_n3', 'percent_rem']
-        
-        features_df = pd.DataFrame([features_dict])
+        sleep_stages = read_sleep_stages(hypno_file)
+        if epoch_cache_key:
+            save_epoch_matrix(epoch_cache_key, stage_codes(sleep_stages))
+        return compute_stage_features(sleep_stages)
+    except Exception as e:
+        print(f"Error extracting features: {str(e)}")
+        return None
+
+def validate_auto_staging(psg_file, hypno_file, progress=None, cancel=None):
+    """Compare automatic staging of a PSG against its scored hypnogram"""
+    try:
+        predicted = stage_codes(stage_psg(psg_file, progress=progress, cancel=cancel))
+        scored = stage_codes(read_sleep_stages(hypno_file))
         
-        scaler = StandardScaler()
-        training_features = original_train[feature_cols]
-        scaler.fit(training_features)
+        n = min(len(predicted), len(scored))
+        predicted, scored = predicted[:n], scored[:n]
+        keep = scored != STAGE_ORDER.index('UNKNOWN')
+        predicted, scored = predicted[keep].astype(int), scored[keep].astype(int)
         
-        normalized_features = scaler.transform(features_df[feature_cols])
+        k = len(STAGE_ORDER)
+        confusion = np.bincount(scored * k + predicted, minlength=k * k).reshape(k, k)
+        total = confusion.sum()
+        observed = np.trace(confusion) / total if total else 0
+        expected = (confusion.sum(axis=0) @ confusion.sum(axis=1)) / total ** 2 if total else 0
+        kappa = (observed - expected) / (1 - expected) if expected < 1 else 0
         
-        return normalized_features
+        return {
+            'epochs': int(total),
+            'accuracy': observed * 100,
+            'kappa': kappa,
+            'confusion': confusion
+        }
+    except AnalysisCancelled:
+        raise
+    except Exception as e:
+        print(f"Error validating staging: {str(e)}")
+        return None
+
+@lru_cache(maxsize=1)
+def _fit_scaler(data_mtime):
+    """StandardScaler fitted on the training features (keyed by DATA_PATH's mtime)"""
+    scaler = StandardScaler()
+    scaler.fit(pd.read_csv(DATA_PATH)[FEATURE_COLS])
+    return scaler
+
+def load_scaler():
+    """The training-set scaler, refitted only when DATA_PATH changes"""
+    return _fit_scaler(os.path.getmtime(DATA_PATH))
+
+def normalize_feature_rows(rows):
+    """Normalize many feature dicts in one batch, shape (n_rows, len(FEATURE_COLS))"""
+    return load_scaler().transform(pd.DataFrame(list(rows))[FEATURE_COLS])
+
+def normalize_features(features_dict):
+    """Normalize features"""
+    try:
+        return normalize_feature_rows([features_dict])
     except Exception as e:
         print(f"Error normalizing features: {str(e)}")
         return None
 
+# Heuristic class probabilities for each predicted class, in SEVERITY_LEVELS order
+HEURISTIC_PROBABILITIES = np.array([
+    [0.85, 0.10, 0.03, 0.02],
+    [0.15, 0.75, 0.08, 0.02],
+    [0.05, 0.15, 0.70, 0.10],
+    [0.02, 0.05, 0.10, 0.83],
+])
+
+# Threshold heuristic on normalized features: (feature, direction, thresholds).
+# A metric's level is the number of thresholds it fails, i.e. the best
+# severity index it allows; the predicted class is the worst level of the three.
+HEURISTIC_RULES = [
+    ('sleep_onset_latency_min',    'below', (0.2, 0.5)),
+    ('wake_after_sleep_onset_min', 'below', (0.2, 0.5)),
+    ('sleep_efficiency_percent',   'above', (0.3, 0, -0.3)),
+]
+
+def heuristic_levels(normalized):
+    """Per-rule severity levels for many normalized rows, shape (n_rows, len(HEURISTIC_RULES))"""
+    X = np.atleast_2d(normalized)
+    levels = []
+    for feature, direction, thresholds in HEURISTIC_RULES:
+        x = X[:, FEATURE_COLS.index(feature)]
+        # Negated so a missing (NaN) value fails every threshold it is checked against
+        fails = [~(x < t) if direction == 'below' else ~(x > t) for t in thresholds]
+        levels.append(np.sum(fails, axis=0))
+    return np.stack(levels, axis=1)
+
+def predict_severity_batch(normalized):
+    """Threshold heuristic over many normalized rows: (class indices, probabilities)"""
+    classes = heuristic_levels(normalized).max(axis=1)
+    return classes, HEURISTIC_PROBABILITIES[classes]
+
+def predict_night_severities(nights):
+    """Severity of each night of a multi-night recording, scored in one batch"""
+    try:
+        classes, _ = predict_severity_batch(normalize_feature_rows(nights))
+        return [SEVERITY_LEVELS[c] for c in classes]
+    except Exception as e:
+        print(f"Error predicting night severities: {str(e)}")
+        return None
+
 def predict_severity(normalized_features):
     """Make prediction - Using Fallback Classification"""
     try:
-        import numpy as np
-        
-        # Extract features from normalized array
-        feature_values = normalized_features[0]
-        
-        # Use simple heuristic-based classification
-        sleep_efficiency = feature_values[4]  
-        sleep_onset = feature_values[0]  
-        waso = feature_values[2]  
-        rem_latency = feature_values[3]
-        
-        # Classification logic based on thresholds
-        if sleep_efficiency > 0.3 and sleep_onset < 0.2 and waso < 0.2:
-            severity = "No Insomnia"
-            probabilities = np.array([0.85, 0.10, 0.03, 0.02])
-        elif sleep_efficiency > 0 and sleep_onset < 0.5 and waso < 0.5:
-            severity = "Mild"
-            probabilities = np.array([0.15, 0.75, 0.08, 0.02])
-        elif sleep_efficiency > -0.3:
-            severity = "Moderate"
-            probabilities = np.array([0.05, 0.15, 0.70, 0.10])
-        else:
-            severity = "Severe"
-            probabilities = np.array([0.02, 0.05, 0.10, 0.83])
-        
-        return severity, probabilities
+        classes, probabilities = predict_severity_batch(normalized_features[:1])
+        return SEVERITY_LEVELS[classes[0]], probabilities[0].copy()
     except Exception as e:
         print(f"Fallback Error: {str(e)}")
         return "Severe", np.array([0.02, 0.05, 0.10, 0.83])
@@ -4,8 +4,10 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
 from reportlab.lib import colors
 from datetime import datetime
+from utils.sleep_architecture import SLEEP_ONSET_WINDOW_EPOCHS
 
-def generate_pdf_report(filename, username, severity, features, recommendations):
+def generate_pdf_report(filename, username, severity, features, recommendations, attributions=None, quality=None, nights=None,
+                        low_confidence_staging=False):
     """Generate PDF report"""
     
     try:
@@ -48,6 +50,14 @@ def generate_pdf_report(filename, username, severity, features, recommendations)
         )
         
         elements.append(Paragraph(f"Insomnia Severity: <b>{severity}</b>", severity_style))
+        if low_confidence_staging:
+            elements.append(Paragraph(
+                "<b>Low confidence:</b> no hypnogram was provided and no trained staging model is installed, so "
+                "sleep stages were scored by a simple rule-based fallback whose accuracy has not been validated on "
+                "clinical recordings. Treat this severity as a rough indication and repeat the analysis with the "
+                "scored hypnogram for a reliable result.",
+                styles['Normal']
+            ))
         elements.append(Spacer(1, 0.2*inch))
         
         # Sleep Metrics Table
@@ -64,7 +74,7 @@ def generate_pdf_report(filename, username, severity, features, recommendations)
         ]
         
         metrics_table = Table(metrics_data, colWidths=[3*inch, 2*inch])
-        metrics_table.setStyle(TableStyle([
+        metrics_table_style = TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -73,11 +83,122 @@ def generate_pdf_report(filename, username, severity, features, recommendations)
             ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
             ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        ])
+        metrics_table.setStyle(metrics_table_style)
         
         elements.append(metrics_table)
         elements.append(Spacer(1, 0.3*inch))
         
+        # Per-night Table for multi-night recordings
+        if nights:
+            elements.append(Paragraph("<b>Nights</b>", styles['Heading3']))
+            elements.append(Paragraph(
+                f"This recording spans {len(nights)} sleep periods, each from up to {SLEEP_ONSET_WINDOW_EPOCHS * 0.5:.0f} min of wake before sleep onset to final awakening; the metrics above are their per-night averages.",
+                styles['Normal']
+            ))
+            elements.append(Spacer(1, 0.1*inch))
+            
+            nights_data = [['Night', 'Starts', 'Severity', 'Total Sleep', 'Efficiency', 'WASO']]
+            nights_data += [[
+                f"{night['night']}", f"+{night['start_min'] / 60:.1f} h", night.get('severity', '-'),
+                f"{night['total_sleep_time_min']:.0f} min", f"{night['sleep_efficiency_percent']:.1f}%",
+                f"{night['wake_after_sleep_onset_min']:.1f} min"
+            ] for night in nights]
+            
+            nights_table = Table(nights_data, colWidths=[0.6*inch, 0.8*inch, 1.1*inch] + [1.0*inch] * 3)
+            nights_table.setStyle(metrics_table_style)
+            
+            elements.append(nights_table)
+            elements.append(Spacer(1, 0.3*inch))
+        
+        # Sleep Architecture Table
+        if 'num_sleep_cycles' in features:
+            elements.append(Paragraph("<b>Sleep Architecture</b>", styles['Heading3']))
+            
+            architecture_data = [
+                ['Metric', 'Value'],
+                ['Awakenings', f"{features.get('num_awakenings', 0)}"],
+                ['Stage Shifts', f"{features.get('stage_shifts', 0)}"],
+                ['Fragmentation Index', f"{features.get('sleep_fragmentation_index', 0):.1f} /h"],
+                ['Mean Sleep Bout', f"{features.get('mean_sleep_bout_min', 0):.1f} min"],
+                ['Longest Sleep Bout', f"{features.get('longest_sleep_bout_min', 0):.1f} min"],
+                ['Mean Wake Bout', f"{features.get('mean_wake_bout_min', 0):.1f} min"],
+                ['NREM-REM Cycles', f"{features.get('num_sleep_cycles', 0)}"],
+                ['Mean Cycle Length', f"{features.get('mean_cycle_length_min', 0):.1f} min"]
+            ]
+            
+            architecture_table = Table(architecture_data, colWidths=[3*inch, 2*inch])
+            architecture_table.setStyle(metrics_table_style)
+            
+            elements.append(architecture_table)
+            elements.append(Spacer(1, 0.3*inch))
+        
+        # Cardio-respiratory Table
+        cardio_rows = [
+            ['Heart Rate (sleep)', 'hr_mean_bpm', "{:.0f} bpm"],
+            ['Heart Rate in REM', 'hr_rem_bpm', "{:.0f} bpm"],
+            ['Heart Rate in N3', 'hr_n3_bpm', "{:.0f} bpm"],
+            ['HRV (RMSSD)', 'rmssd_ms', "{:.0f} ms"],
+            ['LF/HF Ratio', 'lf_hf_ratio', "{:.2f}"],
+            ['Breathing Rate', 'resp_rate_bpm', "{:.1f} /min"],
+            ['Mean SpO2', 'spo2_mean_percent', "{:.1f}%"],
+            ['Lowest SpO2', 'spo2_min_percent', "{:.0f}%"],
+            ['Time Below 90% SpO2', 't90_percent', "{:.1f}%"],
+            ['Desaturation Index (3%)', 'odi3_per_hour', "{:.1f} /h"]
+        ]
+        cardio_data = [[label, fmt.format(features[key])] for label, key, fmt in cardio_rows if key in features]
+        if cardio_data:
+            elements.append(Paragraph("<b>Heart &amp; Breathing</b>", styles['Heading3']))
+            
+            cardio_table = Table([['Metric', 'Value']] + cardio_data, colWidths=[3*inch, 2*inch])
+            cardio_table.setStyle(metrics_table_style)
+            
+            elements.append(cardio_table)
+            elements.append(Spacer(1, 0.3*inch))
+        
+        # Signal Quality Table
+        if quality and quality['channels']:
+            elements.append(Paragraph("<b>Signal Quality</b>", styles['Heading3']))
+            elements.append(Paragraph(
+                f"{quality['good_epochs_percent']:.1f}% of epochs were free of artifacts; "
+                "flagged epochs were left out of the signal analysis.",
+                styles['Normal']
+            ))
+            elements.append(Spacer(1, 0.1*inch))
+            
+            quality_data = [['Channel', 'Flagged', 'Flat', 'Clipped', 'Line Noise', 'Artifacts']]
+            quality_data += [[
+                row['channel'], f"{row['bad_percent']:.1f}%", f"{row['flat_percent']:.1f}%",
+                f"{row['saturated_percent']:.1f}%", f"{row['line_noise_percent']:.1f}%",
+                f"{max(row['high_amplitude_percent'], row['electrode_pop_percent']):.1f}%"
+            ] for row in quality['channels']]
+            
+            quality_table = Table(quality_data, colWidths=[1.6*inch] + [0.9*inch] * 5)
+            quality_table.setStyle(metrics_table_style)
+            
+            elements.append(quality_table)
+            elements.append(Spacer(1, 0.3*inch))
+        
+        # Key Factors Table
+        if attributions:
+            elements.append(Paragraph("<b>Key Factors Behind This Result</b>", styles['Heading3']))
+            
+            elements.append(Paragraph(
+                "Each metric is compared with the training average (in standard deviations) against fixed "
+                "thresholds; the worst grade sets the severity.",
+                styles['Normal']
+            ))
+            elements.append(Spacer(1, 0.1*inch))
+            
+            factors_data = [['Metric', 'Assessment']]
+            factors_data += [[label, Paragraph(verdict, styles['Normal'])] for label, verdict, _ in attributions]
+            
+            factors_table = Table(factors_data, colWidths=[2*inch, 4.5*inch])
+            factors_table.setStyle(metrics_table_style)
+            
+            elements.append(factors_table)
+            elements.append(Spacer(1, 0.3*inch))
+        
         # Recommendations
         elements.append(Paragraph("<b>Personalized Recommendations</b>", styles['Heading3']))
         elements.append(Paragraph(recommendations['message'], styles['Normal']))
@@ -0,0 +1,211 @@
+import os
+import sys
+import time
+import html
+import zlib
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from config import PROFILE_ENABLED, PROFILE_DIR, PROFILE_INTERVAL_SEC, ADMIN_USERS
+
+# Functions listed in each label's stats file
+STATS_TOP_N = 40
+FLAME_WIDTH = 1200
+FLAME_ROW_HEIGHT = 16
+
+# Cumulative samples per label: label -> {'stacks', 'runs', 'total_sec', 'max_sec'}
+_profiles = {}
+_profiles_lock = threading.Lock()
+# Pool worker thread id -> id of the thread its current task was submitted for
+_task_owners = {}
+
+def profiling_enabled(query_params=None, username=None):
+    """Whether this rerun should be profiled (env switch, or ?profile=1 for admins)"""
+    if PROFILE_ENABLED:
+        return True
+    if username not in ADMIN_USERS:
+        return False
+    value = (query_params or {}).get('profile')
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value in ('1', 'true')
+
+def _task_owner():
+    ident = threading.get_ident()
+    return _task_owners.get(ident, ident)
+
+def _run_for(owner, fn, *args, **kwargs):
+    ident = threading.get_ident()
+    _task_owners[ident] = owner
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        del _task_owners[ident]
+
+class AttributedThreadPoolExecutor(ThreadPoolExecutor):
+    """Thread pool whose running tasks are attributed to the thread that submitted them
+
+    Submissions from a pool worker keep the original owner, so a profiler
+    samples the workers busy on its own session's work and nothing else.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(_run_for, _task_owner(), fn, *args, **kwargs)
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _folded_stack(frame):
+    """Root-first 'a;b;c' stack for a frame"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+class SamplingProfiler:
+    """Samples the stacks of one thread (plus pool workers running its tasks) on a timer"""
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL_SEC):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self.started_at = None
+        self.elapsed = 0.0
+
+    def _sampled_threads(self):
+        workers = {ident for ident, owner in list(_task_owners.items()) if owner == self.thread_id}
+        return workers | {self.thread_id}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in self._sampled_threads():
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_folded_stack(frame)] += 1
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started_at
+        return self
+
+def start_profiler(enabled):
+    """Start sampling the calling thread, or return None when profiling is off"""
+    return SamplingProfiler().start() if enabled else None
+
+def finish_profiler(profiler, label):
+    """Stop a profiler and add its samples to the label's cumulative profile"""
+    if profiler is None:
+        return
+    profiler.stop()
+    with _profiles_lock:
+        entry = _profiles.setdefault(label, {'stacks': Counter(), 'runs': 0, 'total_sec': 0.0, 'max_sec': 0.0})
+        entry['stacks'].update(profiler.stacks)
+        entry['runs'] += 1
+        entry['total_sec'] += profiler.elapsed
+        entry['max_sec'] = max(entry['max_sec'], profiler.elapsed)
+        try:
+            write_profile(label, entry)
+        except Exception as e:
+            print(f"Error writing profile: {str(e)}")
+
+@contextmanager
+def profiled(label, enabled):
+    """Profile the enclosed block under label (no-op when disabled)"""
+    profiler = start_profiler(enabled)
+    try:
+        yield
+    finally:
+        finish_profiler(profiler, label)
+
+def function_stats(stacks):
+    """Per-function (self samples, cumulative samples) from folded stacks"""
+    own, cumulative = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for name in set(frames):
+            cumulative[name] += count
+    return own, cumulative
+
+def _flame_tree(stacks):
+    root = {'name': 'all', 'value': 0, 'children': {}}
+    for stack, count in stacks.items():
+        node = root
+        node['value'] += count
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'name': name, 'value': 0, 'children': {}})
+            node['value'] += count
+    return root
+
+def flame_graph_svg(stacks, title):
+    """Render folded stacks as a self-contained SVG flame graph (root at the bottom)"""
+    root = _flame_tree(stacks)
+    rects = []
+
+    def depth(node):
+        return 1 + max((depth(c) for c in node['children'].values()), default=0)
+
+    height = (depth(root) + 1) * FLAME_ROW_HEIGHT
+    scale = FLAME_WIDTH / max(root['value'], 1)
+
+    def layout(node, x, level):
+        width = node['value'] * scale
+        if width < 0.5:
+            return
+        y = height - (level + 1) * FLAME_ROW_HEIGHT
+        hue = 20 + zlib.crc32(node['name'].encode()) % 40
+        name = html.escape(node['name'])
+        share = 100 * node['value'] / max(root['value'], 1)
+        rects.append(
+            f'<g><title>{name} – {node["value"]} samples ({share:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{width:.1f}" height="{FLAME_ROW_HEIGHT - 1}" '
+            f'fill="hsl({hue},85%,60%)"/>'
+            + (f'<text x="{x + 3:.1f}" y="{y + 11}">{name[:int(width // 7)]}</text>' if width > 30 else '')
+            + '</g>'
+        )
+        for child in sorted(node['children'].values(), key=lambda c: c['name']):
+            layout(child, x, level + 1)
+            x += child['value'] * scale
+
+    layout(root, 0, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{FLAME_WIDTH}" height="{height + FLAME_ROW_HEIGHT}" '
+        f'font-family="monospace" font-size="11">'
+        f'<text x="4" y="12">{html.escape(title)}</text>{"".join(rects)}</svg>'
+    )
+
+def _write_text(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def write_profile(label, entry):
+    """Write a label's folded stacks, flame graph and function stats to PROFILE_DIR"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, label)
+    stacks = entry['stacks']
+
+    _write_text(f"{base}.folded", ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common()))
+
+    mean_ms = 1000 * entry['total_sec'] / entry['runs']
+    title = f"{label}: {entry['runs']} runs, mean {mean_ms:.1f} ms, max {1000 * entry['max_sec']:.1f} ms"
+    _write_text(f"{base}.svg", flame_graph_svg(stacks, title))
+
+    own, cumulative = function_stats(stacks)
+    total = max(sum(stacks.values()), 1)
+    lines = [title, f"{total} samples", '', f"{'cum %':>7} {'self %':>7}  function"]
+    for name, count in cumulative.most_common(STATS_TOP_N):
+        lines.append(f"{100 * count / total:>7.1f} {100 * own[name] / total:>7.1f}  {name}")
+    _write_text(f"{base}.txt", '\n'.join(lines) + '\n')
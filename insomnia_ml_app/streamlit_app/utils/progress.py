@@ -0,0 +1,33 @@
+import threading
+
+class AnalysisCancelled(Exception):
+    """Raised inside the pipeline once its cancellation token is set"""
+
+class CancellationToken:
+    """Thread-safe flag that pipeline steps check between chunks of work"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+def check_cancelled(cancel):
+    """Raise AnalysisCancelled if the (optional) token has been cancelled"""
+    if cancel is not None and cancel.cancelled:
+        raise AnalysisCancelled("Analysis cancelled")
+
+def report(progress, fraction, text):
+    """Send fraction (0-1) and a status text to an optional progress(fraction, text) callback"""
+    if progress is not None:
+        progress(min(max(fraction, 0.0), 1.0), text)
+
+def progress_range(progress, start, end):
+    """Callback mapping a step's own 0-1 progress onto [start, end] of its caller's"""
+    if progress is None:
+        return None
+    return lambda fraction, text: progress(start + (end - start) * fraction, text)
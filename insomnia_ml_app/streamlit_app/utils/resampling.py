@@ -0,0 +1,64 @@
+import numpy as np
+from scipy.signal import firwin, lfilter
+
+# Half-length of the anti-alias FIR in output samples (taps = 2 * q * FIR_HALF_OUTPUT + 1)
+FIR_HALF_OUTPUT = 10
+# Fraction of the output Nyquist frequency kept by the anti-alias filter
+FIR_CUTOFF = 0.9
+
+def decimation_factor(sfreq, target_sfreq):
+    """Integer decimation factor reaching at least target_sfreq (1 = no decimation)"""
+    if not target_sfreq or target_sfreq >= sfreq:
+        return 1
+    return max(1, int(sfreq // target_sfreq))
+
+class StreamingDecimator:
+    """Anti-aliased integer decimation of a signal fed chunk by chunk
+
+    A linear-phase FIR with a delay of an exact number of output samples is
+    run with lfilter state carried between chunks, so chunked output matches
+    filtering the whole signal at once with the delay removed.
+    """
+
+    def __init__(self, q):
+        self.q = q
+        self.half = q * FIR_HALF_OUTPUT
+        self.taps = firwin(2 * self.half + 1, FIR_CUTOFF / q) if q > 1 else None
+        self.zi = np.zeros(2 * self.half) if q > 1 else None
+        self.offset = 0
+        self.skip = FIR_HALF_OUTPUT
+
+    def _emit(self, filtered):
+        out = filtered[(-self.offset) % self.q::self.q]
+        self.offset += len(filtered)
+        if self.skip:
+            dropped = min(self.skip, len(out))
+            out = out[dropped:]
+            self.skip -= dropped
+        return out
+
+    def process(self, chunk):
+        """Filter and decimate one chunk, returning the output samples it completes"""
+        if self.q == 1:
+            return np.asarray(chunk)
+        filtered, self.zi = lfilter(self.taps, 1.0, chunk, zi=self.zi)
+        return self._emit(filtered)
+
+    def flush(self):
+        """Return the samples still held back by the filter delay"""
+        if self.q == 1:
+            return np.array([])
+        filtered, self.zi = lfilter(self.taps, 1.0, np.zeros(self.half), zi=self.zi)
+        return self._emit(filtered)
+
+def decimate_signal(data, sfreq, target_sfreq, chunk_samples=1_000_000):
+    """Decimate an in-memory signal chunk by chunk, returning (data, new_sfreq)"""
+    q = decimation_factor(sfreq, target_sfreq)
+    if q == 1:
+        return np.asarray(data), sfreq
+
+    decimator = StreamingDecimator(q)
+    blocks = [decimator.process(data[start:start + chunk_samples])
+              for start in range(0, len(data), chunk_samples)]
+    blocks.append(decimator.flush())
+    return np.concatenate(blocks), sfreq / q
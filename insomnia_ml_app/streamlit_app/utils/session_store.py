@@ -0,0 +1,112 @@
+import sys
+import time
+import uuid
+import threading
+import numpy as np
+from collections import deque, OrderedDict
+from config import CHAT_HISTORY_MAX, SHARED_PAYLOAD_BUDGET_BYTES, SESSION_IDLE_SEC
+
+# Process-wide store for large analysis payloads, LRU-evicted by size
+_payloads = OrderedDict()
+_payload_bytes = 0
+_payload_lock = threading.Lock()
+
+# Last measured state size per session: session_id -> dict
+_session_sizes = {}
+_session_lock = threading.Lock()
+
+def new_chat_history(messages=()):
+    """Chat history as a ring buffer keeping the last CHAT_HISTORY_MAX messages"""
+    return deque(messages, maxlen=CHAT_HISTORY_MAX)
+
+def estimate_size(obj, _seen=None):
+    """Approximate deep size of an object in bytes, counting NumPy buffers"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        # NumPy includes an owned buffer in getsizeof; views report only their header
+        return sys.getsizeof(obj)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(estimate_size(v, _seen) for v in obj)
+    return size
+
+def _is_scalar(value):
+    return value is None or isinstance(value, (str, bool, int, float, np.integer, np.floating))
+
+def put_payload(payload):
+    """Move a payload into the shared store, returning its key"""
+    global _payload_bytes
+    key = uuid.uuid4().hex
+    size = estimate_size(payload)
+    with _payload_lock:
+        _payloads[key] = (payload, size)
+        _payload_bytes += size
+        while _payload_bytes > SHARED_PAYLOAD_BUDGET_BYTES and len(_payloads) > 1:
+            _, (_, evicted) = _payloads.popitem(last=False)
+            _payload_bytes -= evicted
+    return key
+
+def get_payload(key):
+    """Fetch a payload from the shared store, {} if it was evicted"""
+    with _payload_lock:
+        if key not in _payloads:
+            return {}
+        _payloads.move_to_end(key)
+        return _payloads[key][0]
+
+def compact_analysis(severity, features, probabilities, **extras):
+    """Build the compact session record for an analysis
+
+    Scalar values stay in the record; arrays, dicts and other large values
+    move to the shared payload store and are reachable via analysis_payload.
+    """
+    record = {
+        'severity': severity,
+        'features': {k: (float(v) if isinstance(v, (np.integer, np.floating)) else v)
+                     for k, v in features.items() if _is_scalar(v)},
+        'probabilities': tuple(float(p) for p in probabilities),
+    }
+    payload = {k: v for k, v in features.items() if not _is_scalar(v)}
+    for key, value in extras.items():
+        if _is_scalar(value):
+            record[key] = value
+        else:
+            payload[key] = value
+    record['payload_key'] = put_payload(payload) if payload else None
+    return record
+
+def analysis_payload(record):
+    """Large values for a compact analysis record ({} if none or evicted)"""
+    key = record.get('payload_key') if record else None
+    return get_payload(key) if key else {}
+
+def record_session_size(session_id, username, state):
+    """Measure a session's state and remember it for the admin view"""
+    size = estimate_size({k: state[k] for k in state.keys()})
+    now = time.time()
+    with _session_lock:
+        _session_sizes[session_id] = {'username': username, 'bytes': size, 'last_seen': now}
+        for sid in [s for s, info in _session_sizes.items() if now - info['last_seen'] > SESSION_IDLE_SEC]:
+            del _session_sizes[sid]
+
+def session_memory_report():
+    """Per-session state sizes plus shared store totals for this process"""
+    with _session_lock:
+        sessions = sorted(
+            ({'session': sid[:8], **info} for sid, info in _session_sizes.items()),
+            key=lambda row: row['bytes'], reverse=True
+        )
+    with _payload_lock:
+        shared = {'payloads': len(_payloads), 'bytes': _payload_bytes, 'budget_bytes': SHARED_PAYLOAD_BUDGET_BYTES}
+    return {
+        'sessions': sessions,
+        'session_bytes': sum(row['bytes'] for row in sessions),
+        'shared': shared,
+    }
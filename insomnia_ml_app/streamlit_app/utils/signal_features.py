@@ -0,0 +1,66 @@
+import re
+import time
+import numpy as np
+from utils.signals import get_signal_pool, channel_data, epoch_view, epoch_band_powers, EEG_BANDS
+from utils.progress import check_cancelled, report
+
+EPOCH_SEC = 30
+
+def _channel_slug(name):
+    """Feature-key prefix for a channel label, e.g. 'EEG Fpz-Cz' -> 'eeg_fpz_cz'"""
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+
+def _clean_epochs(ch):
+    """Epochs of a channel without quality flags (all epochs if none are clean)"""
+    epochs = epoch_view(channel_data(ch), ch['sfreq'], EPOCH_SEC)
+    flags = ch.get('quality')
+    if flags is None:
+        return epochs
+    n = min(len(epochs), len(flags))
+    clean = epochs[:n][flags[:n] == 0]
+    return clean if len(clean) else epochs
+
+def _eeg_features(ch):
+    """Whole-night relative band powers over clean epochs"""
+    powers = epoch_band_powers(_clean_epochs(ch), ch['sfreq']).sum(axis=0)
+    total = powers[-1] if powers[-1] > 0 else 1
+    return {f'{band}_rel': powers[i] / total for i, band in enumerate(EEG_BANDS)}
+
+def _rms_features(ch):
+    """Amplitude summary for EOG/EMG channels over clean epochs"""
+    epochs = _clean_epochs(ch)
+    rms = np.sqrt((epochs ** 2).mean(axis=1)) if epochs.size else np.zeros(1)
+    return {'rms_uv': float(rms.mean()), 'rms_p10_uv': float(np.percentile(rms, 10))}
+
+CHANNEL_EXTRACTORS = {
+    'eeg': _eeg_features,
+    'eog': _rms_features,
+    'emg': _rms_features,
+}
+
+def _run_channel(ch, cancel=None):
+    """Compute one channel's features, returning (features, elapsed ms)"""
+    check_cancelled(cancel)
+    start = time.perf_counter()
+    values = CHANNEL_EXTRACTORS[ch['kind']](ch)
+    slug = _channel_slug(ch['name'])
+    features = {f'{slug}_{key}': value for key, value in values.items()}
+    return features, (time.perf_counter() - start) * 1000
+
+def extract_signal_features(channels, progress=None, cancel=None):
+    """Extract per-channel features on the shared pool, returning (features, timings_ms)"""
+    channels = [ch for ch in channels if ch['kind'] in CHANNEL_EXTRACTORS]
+    futures = {ch['name']: get_signal_pool().submit(_run_channel, ch, cancel) for ch in channels}
+
+    features, timings = {}, {}
+    try:
+        for done, (name, future) in enumerate(futures.items(), 1):
+            channel_features, elapsed = future.result()
+            features.update(channel_features)
+            timings[name] = elapsed
+            report(progress, done / len(futures), f"Signal features… {done} of {len(futures)} channels")
+    finally:
+        # Abandoned early: drop the channels no worker has started yet
+        for future in futures.values():
+            future.cancel()
+    return features, timings
@@ -0,0 +1,102 @@
+import os
+import numpy as np
+from config import VIEWER_MAX_POINTS, PYRAMID_FACTOR
+from utils.storage import atomic_write, touch_artifact
+from utils.signals import channel_data, channel_samples
+
+# float16 would halve the file but overflows to inf above 65504, which
+# uncalibrated or high-gain channels reach
+VIEWER_DTYPE = np.float32
+
+def _reduce_level(lo, hi, factor=PYRAMID_FACTOR):
+    """Min/max over consecutive blocks of factor buckets (tail padded with its edge)"""
+    pad = -len(lo) % factor
+    if pad:
+        lo = np.pad(lo, (0, pad), mode='edge')
+        hi = np.pad(hi, (0, pad), mode='edge')
+    return lo.reshape(-1, factor).min(axis=1), hi.reshape(-1, factor).max(axis=1)
+
+def _channel_levels(data, factor=PYRAMID_FACTOR, max_points=VIEWER_MAX_POINTS):
+    """Raw samples, then min/max levels until the coarsest fits in max_points buckets"""
+    raw = np.asarray(data, dtype=VIEWER_DTYPE)
+    levels = [raw]
+    lo = hi = raw
+    while len(lo) > max_points:
+        lo, hi = _reduce_level(lo, hi, factor)
+        levels.append(np.stack([lo, hi], axis=1).ravel())
+    return levels
+
+def build_pyramid(channels, stage_codes, path, epoch_sec=30):
+    """Build the min/max pyramid for every channel and store it as one flat .npy
+
+    Level 0 holds the samples themselves; level k holds interleaved (min, max)
+    pairs over buckets of PYRAMID_FACTOR**k samples. Returns the metadata
+    needed by query_pyramid, or None if the file could not be written.
+    """
+    arrays, meta, offset = [], [], 0
+    for ch in channels:
+        levels = []
+        for k, level in enumerate(_channel_levels(channel_data(ch))):
+            levels.append({'offset': offset, 'length': len(level), 'bucket': PYRAMID_FACTOR ** k})
+            arrays.append(level)
+            offset += len(level)
+        meta.append({
+            'name': ch['name'], 'kind': ch['kind'], 'sfreq': ch['sfreq'],
+            'samples': channel_samples(ch), 'levels': levels,
+        })
+
+    def writer(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.concatenate(arrays) if arrays else np.zeros(0, dtype=VIEWER_DTYPE))
+        return True
+
+    if not atomic_write(path, writer=writer):
+        return None
+
+    duration = max((ch['samples'] / ch['sfreq'] for ch in meta), default=len(stage_codes) * epoch_sec)
+    return {
+        'path': path,
+        'channels': meta,
+        'duration_sec': float(duration),
+        'stages': np.asarray(stage_codes, dtype=np.int8),
+        'epoch_sec': epoch_sec,
+    }
+
+def pyramid_available(pyramid):
+    """Whether the pyramid's file still exists (it may have been evicted)"""
+    return bool(pyramid) and os.path.exists(pyramid['path'])
+
+def query_pyramid(pyramid, channel, start_sec, end_sec, max_points=VIEWER_MAX_POINTS):
+    """Time, min and max arrays for one channel over a window, at most ~max_points long
+
+    Picks the finest level whose buckets over the window fit in max_points
+    and reads only that slice of the memory-mapped file.
+    """
+    ch = pyramid['channels'][channel]
+    sfreq = ch['sfreq']
+    first = max(int(start_sec * sfreq), 0)
+    last = min(int(np.ceil(end_sec * sfreq)), ch['samples'])
+    span = max(last - first, 1)
+
+    level = next((lv for lv in ch['levels'] if span / lv['bucket'] <= max_points), ch['levels'][-1])
+    bucket = level['bucket']
+    i0, i1 = first // bucket, -(-last // bucket)
+
+    values = np.load(pyramid['path'], mmap_mode='r')
+    if bucket == 1:
+        lo = hi = np.array(values[level['offset'] + i0:level['offset'] + i1], dtype=np.float32)
+    else:
+        pairs = np.array(values[level['offset'] + 2 * i0:level['offset'] + 2 * i1], dtype=np.float32).reshape(-1, 2)
+        lo, hi = pairs[:, 0], pairs[:, 1]
+    touch_artifact(pyramid['path'])
+
+    times = (np.arange(i0, i0 + len(lo)) * bucket) / sfreq
+    return {'time_sec': times, 'lo': lo, 'hi': hi, 'exact': bucket == 1}
+
+def query_stages(pyramid, start_sec, end_sec):
+    """Epoch start times and stage codes overlapping a window"""
+    epoch = pyramid['epoch_sec']
+    stages = pyramid['stages']
+    first = max(int(start_sec // epoch), 0)
+    last = min(int(np.ceil(end_sec / epoch)), len(stages))
+    return np.arange(first, last) * epoch, stages[first:last]
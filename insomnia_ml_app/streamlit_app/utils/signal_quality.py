@@ -0,0 +1,108 @@
+import numpy as np
+
+EPOCH_SEC = 30
+
+# Per-epoch quality flags (bitmask)
+FLAT           = 1
+SATURATED      = 2
+LINE_NOISE     = 4
+HIGH_AMPLITUDE = 8
+ELECTRODE_POP  = 16
+
+FLAG_NAMES = {
+    FLAT:           'flat',
+    SATURATED:      'saturated',
+    LINE_NOISE:     'line_noise',
+    HIGH_AMPLITUDE: 'high_amplitude',
+    ELECTRODE_POP:  'electrode_pop',
+}
+
+# Thresholds per channel kind, in µV; kinds without an entry skip that check
+FLAT_STD_UV  = {'eeg': 1.0, 'eog': 1.0, 'emg': 0.5, 'ecg': 2.0}
+MAX_PTP_UV   = {'eeg': 800, 'eog': 1500, 'emg': 500, 'ecg': 8000}
+MAX_STEP_UV  = {'eeg': 300, 'eog': 500, 'emg': 300}
+# Fraction of samples pinned at the epoch's extremes that indicates clipping
+SATURATION_RATIO = 0.02
+# Fraction of 0.5 Hz+ power within LINE_NOISE_BAND_HZ of the mains frequency
+LINE_NOISE_RATIO = 0.3
+LINE_FREQS_HZ = (50, 60)
+LINE_NOISE_BAND_HZ = 1.0
+
+def epoch_quality_flags(epochs, kind, sfreq):
+    """Quality bitmask for each row of an (n_epochs, samples) array"""
+    flags = np.zeros(len(epochs), dtype=np.uint8)
+    if not len(epochs) or kind not in FLAT_STD_UV:
+        return flags
+
+    std = epochs.std(axis=1)
+    hi, lo = epochs.max(axis=1), epochs.min(axis=1)
+    flags[std < FLAT_STD_UV[kind]] |= FLAT
+
+    # Clipped epochs sit on the rail for many samples, not just at one peak
+    pinned = ((epochs >= hi[:, None]) | (epochs <= lo[:, None])).mean(axis=1)
+    flags[(pinned > SATURATION_RATIO) & (hi > lo)] |= SATURATED
+
+    flags[hi - lo > MAX_PTP_UV[kind]] |= HIGH_AMPLITUDE
+    if kind in MAX_STEP_UV:
+        flags[np.abs(np.diff(epochs, axis=1)).max(axis=1) > MAX_STEP_UV[kind]] |= ELECTRODE_POP
+
+    if sfreq > 2 * (max(LINE_FREQS_HZ) + LINE_NOISE_BAND_HZ):
+        freqs = np.fft.rfftfreq(epochs.shape[1], 1 / sfreq)
+        power = np.abs(np.fft.rfft(epochs - epochs.mean(axis=1, keepdims=True), axis=1)) ** 2
+        line = np.zeros_like(freqs, dtype=bool)
+        for f in LINE_FREQS_HZ:
+            line |= np.abs(freqs - f) <= LINE_NOISE_BAND_HZ
+        total = power[:, freqs >= 0.5].sum(axis=1) + 1e-12
+        flags[power[:, line].sum(axis=1) / total > LINE_NOISE_RATIO] |= LINE_NOISE
+
+    return flags
+
+class EpochQualityChecker:
+    """Flags 30 s epochs of a channel as its full-rate data streams in"""
+
+    def __init__(self, kind, sfreq, epoch_sec=EPOCH_SEC):
+        self.kind = kind
+        self.sfreq = sfreq
+        self.samples = int(round(sfreq * epoch_sec))
+        self._carry = np.zeros(0)
+        self._flags = []
+
+    def process(self, chunk):
+        data = np.concatenate([self._carry, chunk]) if self._carry.size else np.asarray(chunk)
+        n = len(data) // self.samples
+        if n:
+            epochs = data[:n * self.samples].reshape(n, self.samples)
+            self._flags.append(epoch_quality_flags(epochs, self.kind, self.sfreq))
+        self._carry = data[n * self.samples:]
+
+    def result(self):
+        return np.concatenate(self._flags) if self._flags else np.zeros(0, dtype=np.uint8)
+
+def epoch_mask(channels, kinds=None, n_epochs=None):
+    """Boolean per-epoch mask, True where every checked channel is clean"""
+    flags = [ch['quality'] for ch in channels
+             if 'quality' in ch and (kinds is None or ch['kind'] in kinds)]
+    if n_epochs is None:
+        n_epochs = min((len(f) for f in flags), default=0)
+    good = np.ones(n_epochs, dtype=bool)
+    for f in flags:
+        good[:len(f)] &= f[:n_epochs] == 0
+    return good
+
+def quality_summary(channels):
+    """Per-channel percentages of flagged epochs plus the overall clean share"""
+    rows = []
+    for ch in channels:
+        flags = ch.get('quality')
+        if flags is None or not len(flags) or ch['kind'] not in FLAT_STD_UV:
+            continue
+        row = {'channel': ch['name'], 'bad_percent': 100 * float(np.mean(flags != 0))}
+        for bit, name in FLAG_NAMES.items():
+            row[f'{name}_percent'] = 100 * float(np.mean(flags & bit != 0))
+        rows.append(row)
+
+    good = epoch_mask(channels, kinds=FLAT_STD_UV)
+    return {
+        'channels': rows,
+        'good_epochs_percent': 100 * float(good.mean()) if good.size else 100.0,
+    }
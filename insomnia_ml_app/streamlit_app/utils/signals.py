@@ -0,0 +1,266 @@
+import os
+import threading
+import numpy as np
+from config import SIGNAL_WORKERS, FEATURE_TARGET_SFREQ, READ_CHUNK_SEC, SIGNAL_PIPELINE_MODE
+from utils.resampling import StreamingDecimator, decimation_factor
+from utils.signal_quality import EpochQualityChecker
+from utils.progress import check_cancelled, report
+from utils.profiling import AttributedThreadPoolExecutor
+
+# Channel name keywords used to tell signal types apart; checked in order, so
+# oximetry labels ('SpO2', 'SaO2') are matched before the O2 electrode
+CHANNEL_KEYWORDS = {
+    'spo2': ['spo2', 'sao2', 'oxygen', 'sat'],
+    'eeg':  ['eeg', 'fpz', 'pz-oz', 'c3', 'c4', 'o1', 'o2', 'f3', 'f4'],
+    'eog':  ['eog', 'loc', 'roc', 'e1', 'e2'],
+    'emg':  ['emg', 'chin', 'submental'],
+    'ecg':  ['ecg', 'ekg'],
+    'resp': ['resp', 'airflow', 'flow', 'thor', 'abdo', 'nasal'],
+}
+
+VOLT_UNITS = {'V', 'mV', 'uV', 'µV'}
+# Factor from each voltage unit to microvolts, for compact channels
+MICROVOLTS_PER_UNIT = {'V': 1e6, 'mV': 1e3, 'uV': 1.0, 'µV': 1.0}
+
+# Range of the int16 samples kept by compact channels
+DIGITAL_MIN, DIGITAL_MAX = -32768, 32767
+
+EEG_BANDS = {
+    'delta': (0.5, 4),
+    'theta': (4, 8),
+    'alpha': (8, 12),
+    'sigma': (12, 16),
+    'beta':  (16, 30),
+}
+
+EPOCH_CHUNK = 256
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_signal_pool():
+    """Shared thread pool for per-channel signal work"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = AttributedThreadPoolExecutor(max_workers=SIGNAL_WORKERS, thread_name_prefix='signal')
+        return _pool
+
+def channel_kind(name):
+    """Classify a channel by its label"""
+    label = name.lower()
+    for kind, keywords in CHANNEL_KEYWORDS.items():
+        if any(k in label for k in keywords):
+            return kind
+    return 'other'
+
+def channel_data(ch):
+    """A channel's samples in physical units
+
+    Compact channels hold int16 'digital' samples with a 'gain' and
+    'offset'; they are converted to float32 on every call, so callers should
+    keep the result only as long as their kernel needs it.
+    """
+    if 'data' in ch:
+        return ch['data']
+    return ch['digital'].astype(np.float32) * np.float32(ch['gain']) + np.float32(ch['offset'])
+
+def channel_samples(ch):
+    """Number of samples in a channel, without converting compact data"""
+    return len(ch['data'] if 'data' in ch else ch['digital'])
+
+def slice_channel(ch, start, stop):
+    """A channel cut to samples [start, stop), sharing memory with the original"""
+    key = 'data' if 'data' in ch else 'digital'
+    return dict(ch, **{key: ch[key][start:stop]})
+
+def _quantize(signal, gain, offset):
+    """Physical values back to int16 samples on a channel's digital grid"""
+    return np.clip(np.round((signal - offset) / gain), DIGITAL_MIN, DIGITAL_MAX).astype(np.int16)
+
+def read_psg_channels(psg_file, kinds=None, decimate=True, quality=False, progress=None, cancel=None):
+    """Read PSG channels as dicts of name, kind, sfreq and data (physical units)
+
+    With SIGNAL_PIPELINE_MODE 'compact', plain EDF files are read by
+    read_compact_channels instead and their channels hold int16 samples (see
+    channel_data). Channels are read in READ_CHUNK_SEC blocks and, when decimate is set,
+    reduced to the FEATURE_TARGET_SFREQ rate of their kind as they stream in,
+    so the full-rate signal is never held in memory. With quality set, every
+    30 s epoch is also checked at full rate and each channel gets a
+    per-epoch 'quality' flag array (see utils.signal_quality).
+
+    progress(fraction, text) is called after every block with the share of
+    the file read so far; cancel (a CancellationToken) is checked before each
+    block, raising AnalysisCancelled.
+    """
+    if SIGNAL_PIPELINE_MODE == 'compact':
+        from utils.ml_pipeline import read_edf_header
+        try:
+            header = read_edf_header(psg_file)
+        except ValueError:
+            header = None
+        if header is not None:
+            return read_compact_channels(psg_file, header, kinds, decimate, quality, progress, cancel)
+
+    import mne
+    raw = mne.io.read_raw_edf(psg_file, preload=False, verbose=False)
+    orig_units = getattr(raw, '_orig_units', {})
+    sfreq = raw.info['sfreq']
+
+    picks = []
+    for idx, name in enumerate(raw.ch_names):
+        kind = channel_kind(name)
+        if kinds is None or kind in kinds:
+            picks.append((idx, name, kind))
+    if not picks:
+        return []
+
+    # mne returns volts; keep voltage channels in microvolts like the EDF
+    scales = [1e6 if orig_units.get(name) in VOLT_UNITS else 1.0 for _, name, _ in picks]
+    decimators = [
+        StreamingDecimator(decimation_factor(sfreq, FEATURE_TARGET_SFREQ.get(kind)) if decimate else 1)
+        for _, _, kind in picks
+    ]
+    checkers = [EpochQualityChecker(kind, sfreq) if quality else None for _, _, kind in picks]
+    blocks = [[] for _ in picks]
+
+    def process(i, data):
+        signal = data[i] * scales[i]
+        if checkers[i] is not None:
+            checkers[i].process(signal)
+        return decimators[i].process(signal)
+
+    chunk = int(sfreq * READ_CHUNK_SEC)
+    pool = get_signal_pool()
+    file_mb = os.path.getsize(psg_file) / 1024 ** 2
+    for start in range(0, raw.n_times, chunk):
+        check_cancelled(cancel)
+        stop = min(start + chunk, raw.n_times)
+        data = raw.get_data(picks=[idx for idx, _, _ in picks], start=start, stop=stop)
+        decimated = pool.map(lambda i: process(i, data), range(len(picks)))
+        for i, block in enumerate(decimated):
+            blocks[i].append(block)
+        done = stop / raw.n_times
+        report(progress, done, f"Reading signals… {done * file_mb:.0f} of {file_mb:.0f} MB")
+
+    channels = []
+    for i, (_, name, kind) in enumerate(picks):
+        blocks[i].append(decimators[i].flush())
+        channel = {
+            'name': name,
+            'kind': kind,
+            'sfreq': sfreq / decimators[i].q,
+            'data': np.concatenate(blocks[i])
+        }
+        if checkers[i] is not None:
+            channel['quality'] = checkers[i].result()
+        channels.append(channel)
+    return channels
+
+def read_compact_channels(psg_file, header, kinds=None, decimate=True, quality=False, progress=None, cancel=None):
+    """Read PSG channels from a memory-mapped EDF as int16 samples plus gain and offset
+
+    Each channel keeps its own sampling rate from the header. Records are
+    mapped READ_CHUNK_SEC at a time; only the current block is converted to
+    float32 for the quality check and decimation, and decimated output is
+    quantized back onto the channel's digital grid, so the kept signal takes
+    2 bytes per sample instead of 8.
+    """
+    record_sec = header['record_duration']
+    samples_per_record = header['samples_per_record']
+    n_records = min(header['n_records'], (header['file_size'] - header['header_bytes']) // header['record_bytes'])
+    if n_records <= 0:
+        return []
+
+    picks = []
+    for idx, name in enumerate(header['labels']):
+        kind = channel_kind(name)
+        if name != 'EDF Annotations' and (kinds is None or kind in kinds):
+            picks.append((idx, name, kind))
+    if not picks:
+        return []
+
+    # physical = digital * gain + offset, with voltages in microvolts like the float path
+    gains, offsets = [], []
+    for idx, _, _ in picks:
+        unit = MICROVOLTS_PER_UNIT.get(header['dimensions'][idx], 1.0)
+        digital_span = header['digital_max'][idx] - header['digital_min'][idx]
+        gain = (header['physical_max'][idx] - header['physical_min'][idx]) / digital_span if digital_span else 1.0
+        gains.append(gain * unit)
+        offsets.append((header['physical_min'][idx] - header['digital_min'][idx] * gain) * unit)
+
+    rates = [samples_per_record[idx] / record_sec for idx, _, _ in picks]
+    decimators = [
+        StreamingDecimator(decimation_factor(rates[i], FEATURE_TARGET_SFREQ.get(kind)) if decimate else 1)
+        for i, (_, _, kind) in enumerate(picks)
+    ]
+    checkers = [EpochQualityChecker(kind, rates[i]) if quality else None for i, (_, _, kind) in enumerate(picks)]
+    blocks = [[] for _ in picks]
+
+    records = np.memmap(
+        psg_file, mode='r', offset=header['header_bytes'], shape=(n_records,),
+        dtype=np.dtype([(f's{idx}', '<i2', (n,)) for idx, n in enumerate(samples_per_record)])
+    )
+
+    def process(i, chunk):
+        # A copy, so kept blocks never point into the mapped file
+        digital = np.array(chunk[f's{picks[i][0]}']).reshape(-1)
+        if checkers[i] is None and decimators[i].q == 1:
+            return digital
+        signal = digital.astype(np.float32) * np.float32(gains[i]) + np.float32(offsets[i])
+        if checkers[i] is not None:
+            checkers[i].process(signal)
+        if decimators[i].q == 1:
+            return digital
+        return _quantize(decimators[i].process(signal), gains[i], offsets[i])
+
+    chunk_records = max(1, int(READ_CHUNK_SEC // record_sec))
+    pool = get_signal_pool()
+    file_mb = header['file_size'] / 1024 ** 2
+    for start in range(0, n_records, chunk_records):
+        check_cancelled(cancel)
+        stop = min(start + chunk_records, n_records)
+        chunk = records[start:stop]
+        for i, block in enumerate(pool.map(lambda i: process(i, chunk), range(len(picks)))):
+            blocks[i].append(block)
+        done = stop / n_records
+        report(progress, done, f"Reading signals… {done * file_mb:.0f} of {file_mb:.0f} MB")
+
+    channels = []
+    for i, (_, name, kind) in enumerate(picks):
+        blocks[i].append(_quantize(decimators[i].flush(), gains[i], offsets[i]))
+        channel = {
+            'name': name,
+            'kind': kind,
+            'sfreq': rates[i] / decimators[i].q,
+            'digital': np.concatenate(blocks[i]),
+            'gain': gains[i],
+            'offset': offsets[i],
+        }
+        if checkers[i] is not None:
+            channel['quality'] = checkers[i].result()
+        channels.append(channel)
+    return channels
+
+def epoch_view(data, sfreq, epoch_sec=30):
+    """Reshape a signal into (n_epochs, samples_per_epoch), dropping the tail"""
+    samples = int(round(sfreq * epoch_sec))
+    n_epochs = len(data) // samples
+    return np.asarray(data[:n_epochs * samples]).reshape(n_epochs, samples)
+
+def epoch_band_powers(epochs, sfreq):
+    """Absolute band powers for each epoch, shape (n_epochs, n_bands + 1)"""
+    n_samples = epochs.shape[1]
+    freqs = np.fft.rfftfreq(n_samples, 1 / sfreq)
+    window = np.hanning(n_samples)
+    bands = np.array([(freqs >= lo) & (freqs < hi) for lo, hi in EEG_BANDS.values()], dtype=float)
+    total = ((freqs >= 0.5) & (freqs < 30)).astype(float)
+    masks = np.vstack([bands, total]).T
+
+    out = np.empty((epochs.shape[0], masks.shape[1]))
+    for start in range(0, epochs.shape[0], EPOCH_CHUNK):
+        chunk = epochs[start:start + EPOCH_CHUNK]
+        chunk = (chunk - chunk.mean(axis=1, keepdims=True)) * window
+        power = np.abs(np.fft.rfft(chunk, axis=1)) ** 2
+        out[start:start + EPOCH_CHUNK] = power @ masks
+    return out
@@ -0,0 +1,182 @@
+import time
+import threading
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+from config import SIMILARITY_DELTA_MAX, SIMILARITY_REBUILD_SEC, SIMILARITY_REFRESH_SEC
+from utils.database import analysis_vectors
+from utils.ml_pipeline import FEATURE_COLS, SEVERITY_LEVELS, load_scaler
+
+# Process-wide index over the normalized FEATURE_COLS vectors of stored analyses:
+# a KD-tree built in the background plus a small buffer of analyses stored
+# since, searched by brute force until the next rebuild folds them in. Each
+# entry's id, day, severity and upload hash key are kept alongside its vector,
+# so a query never touches the database.
+_lock = threading.Lock()
+_index = None
+_delta = None
+_building = False
+_build_thread = None
+
+def _hash_keys(values):
+    """64-bit keys for upload hashes, for cheap exclusion and de-duplication"""
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+def _entries(rows, scaler):
+    """Columns of (id, day, severity, upload_hash, *FEATURE_COLS) rows, vectors normalized"""
+    table = pd.DataFrame(rows, columns=['id', 'day', 'severity', 'upload_hash'] + FEATURE_COLS)
+    # Analyses stored without a hash each count as their own recording
+    recordings = table['upload_hash'].fillna('#' + table['id'].astype(str))
+    return {
+        'ids': table['id'].to_numpy(dtype=np.int64),
+        'days': table['day'].to_numpy(dtype='datetime64[D]'),
+        'severities': pd.Categorical(table['severity'], categories=SEVERITY_LEVELS).codes,
+        'hashes': _hash_keys(recordings),
+        'vectors': scaler.transform(table[FEATURE_COLS].fillna(0)) if len(table) else np.zeros((0, len(FEATURE_COLS))),
+    }
+
+def _append(entries, more):
+    return {key: np.concatenate([entries[key], more[key]]) for key in entries}
+
+def _since(entries, last_id):
+    keep = entries['ids'] > last_id
+    return {key: values[keep] for key, values in entries.items()}
+
+def _build_index():
+    global _index, _delta, _building
+    try:
+        started = time.perf_counter()
+        scaler = load_scaler()
+        entries = _entries(analysis_vectors(), scaler)
+        index = dict(
+            entries,
+            tree=KDTree(entries['vectors']) if len(entries['ids']) else None,
+            last_id=int(entries['ids'].max()) if len(entries['ids']) else 0,
+            scaler=scaler,
+            built_at=time.time(),
+        )
+        with _lock:
+            _index = index
+            # The tree now covers everything up to its last id
+            if _delta is not None and _delta['scaler'] is scaler:
+                _delta = dict(_delta, entries=_since(_delta['entries'], index['last_id']),
+                              last_id=max(_delta['last_id'], index['last_id']))
+            else:
+                _delta = {'entries': _entries([], scaler), 'last_id': index['last_id'],
+                          'scaler': scaler, 'refreshed_at': time.time()}
+        print(f"Similarity index built over {len(entries['ids'])} analyses in {time.perf_counter() - started:.1f} s")
+    except Exception as e:
+        print(f"Error building similarity index: {str(e)}")
+    finally:
+        with _lock:
+            _building = False
+
+def rebuild_similarity_index(wait=False):
+    """Start a background rebuild unless one is running (wait=True blocks until it finishes)"""
+    global _building, _build_thread
+    with _lock:
+        if not _building:
+            _building = True
+            _build_thread = threading.Thread(target=_build_index, name='similarity-index', daemon=True)
+            _build_thread.start()
+        thread = _build_thread
+    if wait:
+        thread.join()
+
+def start_similarity_index():
+    """Build the index in the background once per process (retried if a build failed)"""
+    if _index is None:
+        rebuild_similarity_index()
+
+def _refresh_delta(scaler):
+    """Pull analyses stored since the last refresh into the delta buffer (throttled)"""
+    global _delta
+    with _lock:
+        delta = _delta
+        if delta is None or delta['scaler'] is not scaler or time.time() - delta['refreshed_at'] < SIMILARITY_REFRESH_SEC:
+            return
+        _delta = dict(delta, refreshed_at=time.time())
+    rows = analysis_vectors(after_id=delta['last_id'])
+    if not rows:
+        return
+    new = _entries(rows, scaler)
+    with _lock:
+        # Skip if a rebuild replaced the buffer meanwhile; the next refresh catches up
+        if _delta['scaler'] is scaler and _delta['last_id'] == delta['last_id']:
+            _delta = dict(_delta, entries=_append(_delta['entries'], new), last_id=int(new['ids'].max()))
+
+def _nearest_recordings(index, pending, query, k, exclude_key):
+    """(distance, entries, position) of the nearest analysis of each of up to k recordings
+
+    Candidates are fetched 2 * k at a time and the query widened until k
+    distinct recordings other than exclude_key are found or every stored
+    analysis has been seen, since one recording may have been analyzed
+    many times.
+    """
+    pending_dist = np.sqrt(((pending['vectors'] - query) ** 2).sum(axis=1))
+    pending_order = np.argsort(pending_dist, kind='stable')
+    wanted = 2 * k
+    while True:
+        candidates = []
+        if index['tree'] is not None:
+            tree_dist, tree_pos = index['tree'].query(query, k=min(wanted, len(index['ids'])))
+            candidates += [(d, index, p) for d, p in zip(tree_dist[0], tree_pos[0])]
+        candidates += [(pending_dist[p], pending, p) for p in pending_order[:wanted]]
+        candidates.sort(key=lambda c: c[0])
+
+        found, seen = [], {exclude_key}
+        for distance, entries, p in candidates:
+            key = entries['hashes'][p]
+            if key not in seen:
+                seen.add(key)
+                found.append((float(distance), entries, p))
+                if len(found) == k:
+                    return found
+        if wanted >= max(len(index['ids']), len(pending['ids'])):
+            return found
+        wanted *= 4
+
+def find_similar_analyses(normalized, k, exclude_hash=None):
+    """The k stored recordings nearest to a normalized feature vector, closest first
+
+    Returns a dict per recording for its nearest analysis, with the analysis
+    id, day, severity, FEATURE_COLS values and 'distance', skipping the
+    recording exclude_hash. Returns None while the first index build, or the
+    rebuild after a training scaler change, is still running, since
+    distances across scalers are meaningless. Starts a background rebuild
+    when the index is old, the delta buffer has grown past
+    SIMILARITY_DELTA_MAX or the training scaler has changed.
+    """
+    try:
+        scaler = load_scaler()
+        with _lock:
+            index, delta = _index, _delta
+        if index is None or index['scaler'] is not scaler or len(delta['entries']['ids']) > SIMILARITY_DELTA_MAX \
+                or time.time() - index['built_at'] > SIMILARITY_REBUILD_SEC:
+            rebuild_similarity_index()
+        if index is None or index['scaler'] is not scaler:
+            return None
+
+        _refresh_delta(scaler)
+        with _lock:
+            pending = _delta['entries']
+        query = np.atleast_2d(normalized)[:1]
+        exclude_key = _hash_keys([exclude_hash])[0] if exclude_hash else None
+
+        neighbours = _nearest_recordings(index, pending, query, k, exclude_key)
+        if not neighbours:
+            return []
+        values = scaler.inverse_transform(np.array([entries['vectors'][p] for _, entries, p in neighbours]))
+        return [
+            {
+                'id': int(entries['ids'][p]),
+                'day': str(entries['days'][p]),
+                'severity': SEVERITY_LEVELS[entries['severities'][p]] if entries['severities'][p] >= 0 else None,
+                **dict(zip(FEATURE_COLS, row.tolist())),
+                'distance': distance,
+            }
+            for (distance, entries, p), row in zip(neighbours, values)
+        ]
+    except Exception as e:
+        print(f"Error finding similar analyses: {str(e)}")
+        return []
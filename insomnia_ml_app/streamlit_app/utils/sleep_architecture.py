@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+# Integer codes used for the stage sequence, in this order
+STAGE_ORDER = ['W', 'N1', 'N2', 'N3', 'REM', 'UNKNOWN']
+W, N1, N2, N3, REM, UNKNOWN = range(len(STAGE_ORDER))
+
+EPOCH_MIN = 0.5
+
+# REM episodes closer than this are merged into one REM period (15 min)
+REM_MERGE_GAP_EPOCHS = 30
+# NREM sleep needed before a REM period for it to close a cycle (15 min)
+MIN_NREM_CYCLE_EPOCHS = 30
+
+# Recordings longer than this may hold several nights (20 h)
+MULTI_NIGHT_MIN_EPOCHS = 2400
+# Wake/unscored runs at least this long separate sleep periods (6 h)
+SLEEP_PERIOD_GAP_EPOCHS = 720
+# Sleep needed for a period to count as a night rather than a nap (90 min)
+MIN_SLEEP_PERIOD_EPOCHS = 180
+# Wake before sleep onset counted as time in bed when splitting nights (60 min)
+SLEEP_ONSET_WINDOW_EPOCHS = 120
+
+def stage_codes(sleep_stages):
+    """Convert a stage label sequence to integer codes"""
+    codes = pd.Index(STAGE_ORDER).get_indexer(np.asarray(sleep_stages, dtype=object)).astype(np.int8)
+    codes[codes < 0] = UNKNOWN
+    return codes
+
+def run_length_encode(codes):
+    """Run-length encode a code sequence into (values, starts, lengths)"""
+    codes = np.asarray(codes)
+    if codes.size == 0:
+        empty = np.array([], dtype=int)
+        return codes[:0], empty, empty
+
+    starts = np.r_[0, np.flatnonzero(codes[1:] != codes[:-1]) + 1]
+    lengths = np.diff(np.r_[starts, codes.size])
+    return codes[starts], starts, lengths
+
+def split_sleep_periods(codes):
+    """Split a stage code sequence into sleep periods, returning [(start, stop)] in epochs
+
+    Recordings shorter than MULTI_NIGHT_MIN_EPOCHS are one period covering
+    everything. Longer ones are cut at wake or unscored runs of at least
+    SLEEP_PERIOD_GAP_EPOCHS, and periods with less than
+    MIN_SLEEP_PERIOD_EPOCHS of sleep (naps) are dropped. Without lights-off
+    markers the time in bed is unknown, so each period starts with the wake
+    run just before its sleep onset, capped at SLEEP_ONSET_WINDOW_EPOCHS,
+    and ends at the final awakening. Onset latency and efficiency then stay
+    comparable to a single-night recording started at lights-off; a night
+    preceded by longer unbroken wake reports the capped latency.
+    """
+    codes = np.asarray(codes)
+    n = codes.size
+    if n < MULTI_NIGHT_MIN_EPOCHS:
+        return [(0, n)]
+
+    values, starts, lengths = run_length_encode((codes >= N1) & (codes <= REM))
+    sleep_runs = values.astype(bool)
+    # Sleep runs between the same two long gaps belong to one period
+    period_ids = np.cumsum(~sleep_runs & (lengths >= SLEEP_PERIOD_GAP_EPOCHS))
+
+    periods = []
+    previous_stop = 0
+    for period_id in np.unique(period_ids[sleep_runs]):
+        runs = sleep_runs & (period_ids == period_id)
+        if lengths[runs].sum() < MIN_SLEEP_PERIOD_EPOCHS:
+            continue
+        onset = int(starts[runs][0])
+        # Only scored wake counts as time in bed; unscored epochs end the window
+        start = onset
+        while start > max(onset - SLEEP_ONSET_WINDOW_EPOCHS, previous_stop) and codes[start - 1] == W:
+            start -= 1
+        previous_stop = int(starts[runs][-1] + lengths[runs][-1])
+        periods.append((start, previous_stop))
+    return periods or [(0, n)]
+
+def stage_transition_matrix(values):
+    """Count stage-to-stage transitions between consecutive runs"""
+    k = len(STAGE_ORDER)
+    values = np.asarray(values, dtype=int)
+    if values.size < 2:
+        return np.zeros((k, k), dtype=int)
+    return np.bincount(values[:-1] * k + values[1:], minlength=k * k).reshape(k, k)
+
+def _mean_bouts(lengths, mask):
+    """Mean and longest run length (in minutes) over runs selected by mask"""
+    if not mask.any():
+        return 0, 0
+    return lengths[mask].mean() * EPOCH_MIN, lengths[mask].max() * EPOCH_MIN
+
+def detect_sleep_cycles(codes):
+    """Detect NREM-REM cycles, returning (starts, ends) in epochs"""
+    codes = np.asarray(codes)
+    is_rem = codes == REM
+    values, starts, lengths = run_length_encode(is_rem)
+    rem_runs = values.astype(bool)
+    rem_starts = starts[rem_runs]
+    rem_ends = rem_starts + lengths[rem_runs]
+    if rem_starts.size == 0:
+        empty = np.array([], dtype=int)
+        return empty, empty
+
+    # Merge REM episodes separated by short NREM/wake gaps into REM periods
+    new_period = np.r_[True, rem_starts[1:] - rem_ends[:-1] >= REM_MERGE_GAP_EPOCHS]
+    period_starts = rem_starts[new_period]
+    period_ends = np.r_[rem_ends[np.flatnonzero(new_period)[1:] - 1], rem_ends[-1]]
+
+    # A cycle is the NREM sleep leading into a REM period, ending with that period
+    is_nrem = (codes == N1) | (codes == N2) | (codes == N3)
+    nrem_cumsum = np.r_[0, np.cumsum(is_nrem)]
+    sleep_idx = np.flatnonzero(is_nrem | is_rem)
+    cycle_starts = np.r_[sleep_idx[0], period_ends[:-1]]
+    nrem_before = nrem_cumsum[period_starts] - nrem_cumsum[cycle_starts]
+    valid = nrem_before >= MIN_NREM_CYCLE_EPOCHS
+    return cycle_starts[valid], period_ends[valid]
+
+def compute_architecture_metrics(sleep_stages):
+    """Compute fragmentation, bout length and cycle metrics from a stage sequence"""
+    codes = stage_codes(sleep_stages)
+
+    metrics = {
+        'stage_shifts': 0,
+        'num_awakenings': 0,
+        'sleep_fragmentation_index': 0,
+        'mean_sleep_bout_min': 0,
+        'longest_sleep_bout_min': 0,
+        'mean_wake_bout_min': 0,
+        'mean_n2_bout_min': 0,
+        'mean_n3_bout_min': 0,
+        'mean_rem_bout_min': 0,
+        'num_sleep_cycles': 0,
+        'mean_cycle_length_min': 0,
+    }
+
+    # Restrict to the sleep period (first to last sleep epoch)
+    sleep_idx = np.flatnonzero((codes >= N1) & (codes <= REM))
+    if sleep_idx.size == 0:
+        return metrics
+    period = codes[sleep_idx[0]:sleep_idx[-1] + 1]
+    total_sleep_hours = sleep_idx.size * EPOCH_MIN / 60
+
+    values, starts, lengths = run_length_encode(period)
+    transitions = stage_transition_matrix(values)
+
+    metrics['stage_shifts'] = int(transitions.sum())
+    metrics['num_awakenings'] = int(np.count_nonzero(values == W))
+    # Shifts from N2/N3/REM into wake or N1, per hour of sleep
+    lightening = transitions[N2:REM + 1][:, [W, N1]].sum()
+    metrics['sleep_fragmentation_index'] = lightening / total_sleep_hours
+
+    for stage, key in ((W, 'mean_wake_bout_min'), (N2, 'mean_n2_bout_min'),
+                       (N3, 'mean_n3_bout_min'), (REM, 'mean_rem_bout_min')):
+        metrics[key] = _mean_bouts(lengths, values == stage)[0]
+
+    # Sleep bouts are uninterrupted runs of any sleep stage
+    is_sleep = (period >= N1) & (period <= REM)
+    bout_values, _, bout_lengths = run_length_encode(is_sleep)
+    mean_bout, longest_bout = _mean_bouts(bout_lengths, bout_values.astype(bool))
+    metrics['mean_sleep_bout_min'] = mean_bout
+    metrics['longest_sleep_bout_min'] = longest_bout
+
+    cycle_starts, cycle_ends = detect_sleep_cycles(period)
+    metrics['num_sleep_cycles'] = int(cycle_starts.size)
+    if cycle_starts.size:
+        metrics['mean_cycle_length_min'] = (cycle_ends - cycle_starts).mean() * EPOCH_MIN
+
+    return metrics
@@ -0,0 +1,127 @@
+import os
+import numpy as np
+import joblib
+from functools import lru_cache
+from config import STAGING_MODEL_PATH
+from utils.signals import (
+    read_psg_channels, channel_data, channel_samples, epoch_view, epoch_band_powers, get_signal_pool, EEG_BANDS
+)
+from utils.sleep_architecture import STAGE_ORDER
+from utils.signal_quality import epoch_mask
+
+EPOCH_SEC = 30
+
+EPOCH_FEATURES = [f'eeg_{band}_rel' for band in EEG_BANDS] + ['eeg_log_power', 'eog_log_var', 'emg_log_var']
+
+def _log_var(channels, n_epochs):
+    """Mean log variance per epoch across channels, zero when absent"""
+    if not channels:
+        return np.zeros(n_epochs)
+    values = [np.log(epoch_view(channel_data(ch), ch['sfreq'], EPOCH_SEC)[:n_epochs].var(axis=1) + 1e-12)
+              for ch in channels]
+    return np.mean(values, axis=0)
+
+def compute_epoch_features(channels):
+    """Batched per-epoch staging features, shape (n_epochs, len(EPOCH_FEATURES))"""
+    eeg = [ch for ch in channels if ch['kind'] == 'eeg']
+    if not eeg:
+        raise ValueError("No EEG channel found for automatic staging")
+
+    n_epochs = min(channel_samples(ch) // int(round(ch['sfreq'] * EPOCH_SEC)) for ch in channels)
+
+    # Average EEG band powers over the channels that are clean in each epoch
+    powers = np.stack(list(get_signal_pool().map(
+        lambda ch: epoch_band_powers(epoch_view(channel_data(ch), ch['sfreq'], EPOCH_SEC)[:n_epochs], ch['sfreq']),
+        eeg
+    )))
+    clean = np.stack([epoch_mask([ch], n_epochs=n_epochs) for ch in eeg]).astype(float)
+    clean[:, clean.sum(axis=0) == 0] = 1
+    powers = np.einsum('cne,cn->ne', powers, clean) / clean.sum(axis=0)[:, None]
+    total = powers[:, -1:] + 1e-12
+    relative = powers[:, :-1] / total
+
+    eog = _log_var([ch for ch in channels if ch['kind'] == 'eog'], n_epochs)
+    emg = _log_var([ch for ch in channels if ch['kind'] == 'emg'], n_epochs)
+
+    return np.column_stack([relative, np.log(total[:, 0]), eog, emg])
+
+def _with_context(X):
+    """Append a centred 3-epoch moving average of every feature"""
+    padded = np.pad(X, ((1, 1), (0, 0)), mode='edge')
+    smoothed = (padded[:-2] + padded[1:-1] + padded[2:]) / 3
+    return np.hstack([X, smoothed])
+
+@lru_cache(maxsize=1)
+def _load_staging_model():
+    """Load the trained staging model once, None if not trained yet"""
+    if not os.path.exists(STAGING_MODEL_PATH):
+        return None
+    return joblib.load(STAGING_MODEL_PATH)
+
+def staging_model_available():
+    """Whether automatic staging uses a trained model rather than the rule-based fallback"""
+    return _load_staging_model() is not None
+
+def _heuristic_stages(X, good=None):
+    """Rule-based staging on per-recording robust z-scores"""
+    reference = X[good] if good is not None and good.any() else X
+    median = np.median(reference, axis=0)
+    iqr = np.subtract(*np.percentile(reference, [75, 25], axis=0)) + 1e-9
+    z = (X - median) / iqr
+    delta, theta, alpha, sigma, _, _, eog, emg = z.T
+
+    conditions = [
+        (emg > 0.5) | ((alpha > 1) & (delta < 0)),
+        delta > 1,
+        (emg < -0.5) & (eog > 0) & (theta > 0),
+        (sigma > 0) | (delta > 0),
+    ]
+    choices = [STAGE_ORDER.index(s) for s in ('W', 'N3', 'REM', 'N2')]
+    return np.select(conditions, choices, default=STAGE_ORDER.index('N1'))
+
+def _carry_over_artifacts(labels, good):
+    """Give artifact epochs the stage of the nearest preceding clean epoch"""
+    if good is None or good.all() or not good.any():
+        return list(labels)
+    source = np.maximum.accumulate(np.where(good, np.arange(len(good)), -1))
+    source[source < 0] = np.argmax(good)
+    return list(np.asarray(labels, dtype=object)[source])
+
+def classify_epochs(X, good=None):
+    """Classify every epoch in one vectorized call, returning stage labels
+
+    good is an optional per-epoch clean mask; flagged epochs are left out of
+    the heuristic's statistics and take the previous clean epoch's stage.
+    """
+    model = _load_staging_model()
+    if model is not None:
+        return _carry_over_artifacts(model.predict(_with_context(X)), good)
+
+    # Fallback when no staging model has been trained yet
+    codes = _heuristic_stages(X, good)
+    return _carry_over_artifacts(np.array(STAGE_ORDER, dtype=object)[codes], good)
+
+def stage_psg(psg_file, progress=None, cancel=None):
+    """Automatically score a PSG into a per-epoch stage sequence"""
+    channels = read_psg_channels(psg_file, kinds=('eeg', 'eog', 'emg'), quality=True,
+                                 progress=progress, cancel=cancel)
+    X = compute_epoch_features(channels)
+    return classify_epochs(X, epoch_mask(channels, kinds=('eeg',), n_epochs=len(X)))
+
+def train_staging_model(feature_matrices, stage_sequences):
+    """Train and save the staging model from scored recordings"""
+    from sklearn.ensemble import RandomForestClassifier
+
+    X, y = [], []
+    for features, stages in zip(feature_matrices, stage_sequences):
+        n = min(len(features), len(stages))
+        labels = np.asarray(stages[:n], dtype=object)
+        keep = labels != 'UNKNOWN'
+        X.append(_with_context(features[:n])[keep])
+        y.append(labels[keep])
+
+    model = RandomForestClassifier(n_estimators=100, min_samples_leaf=5, n_jobs=-1, random_state=42)
+    model.fit(np.vstack(X), np.concatenate(y))
+    joblib.dump(model, STAGING_MODEL_PATH)
+    _load_staging_model.cache_clear()
+    return model
@@ -0,0 +1,225 @@
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+from config import (
+    UPLOADS_DIR, SPOOL_DIR, STORAGE_INDEX_PATH, STORAGE_QUOTA_BYTES,
+    STORAGE_TTL_SEC, STORAGE_CLEANUP_INTERVAL_SEC
+)
+from utils.epoch_cache import prune_epoch_cache
+
+# Spool directories older than this are left over from interrupted analyses
+SPOOL_MAX_AGE_SEC = 6 * 3600
+
+_cleanup_started = False
+_cleanup_lock = threading.Lock()
+# Quota accounting: bytes written by live spools, charged as they are written
+_quota_lock = threading.RLock()
+_spool_bytes = 0
+
+class StorageFull(Exception):
+    """Raised when a spool would push storage past the quota"""
+
+def _connect():
+    """Open the artifact index, creating it on first use"""
+    conn = sqlite3.connect(STORAGE_INDEX_PATH, timeout=30)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS artifacts (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            expires_at REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_artifacts_accessed ON artifacts (accessed_at)')
+    return conn
+
+def register_artifact(path, ttl=STORAGE_TTL_SEC):
+    """Record a file in the index with its size and expiry"""
+    now = time.time()
+    size = os.path.getsize(path)
+    conn = _connect()
+    with conn:
+        conn.execute(
+            'INSERT INTO artifacts (path, size, created_at, accessed_at, expires_at) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(path) DO UPDATE SET size = excluded.size, accessed_at = excluded.accessed_at, '
+            'expires_at = excluded.expires_at',
+            (path, size, now, now, now + ttl if ttl else None)
+        )
+    conn.close()
+
+def touch_artifact(path):
+    """Mark an artifact as recently used"""
+    conn = _connect()
+    with conn:
+        conn.execute('UPDATE artifacts SET accessed_at = ? WHERE path = ?', (time.time(), path))
+    conn.close()
+
+def atomic_write(path, data=None, writer=None, ttl=STORAGE_TTL_SEC):
+    """Write an artifact via a temp file and rename, then register it
+
+    Either pass the bytes in data, or a writer(tmp_path) callable returning
+    True on success. Returns True if the artifact was stored.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        if writer is not None:
+            if not writer(tmp_path):
+                return False
+        else:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        register_artifact(path, ttl)
+        return True
+    except Exception as e:
+        print(f"Error writing artifact: {str(e)}")
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _remove(conn, path):
+    """Delete an artifact file and its index row"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    conn.execute('DELETE FROM artifacts WHERE path = ?', (path,))
+
+def _tracked_bytes(conn):
+    return conn.execute('SELECT COALESCE(SUM(size), 0) FROM artifacts').fetchone()[0]
+
+def _used_bytes():
+    """Tracked artifact bytes plus bytes charged by live spools"""
+    conn = _connect()
+    try:
+        return _tracked_bytes(conn) + _spool_bytes
+    finally:
+        conn.close()
+
+def enforce_quota(quota_bytes=STORAGE_QUOTA_BYTES, reserve_bytes=0):
+    """Evict expired artifacts, then least-recently-used ones until under quota
+
+    Bytes charged by live spools count towards the quota but are never
+    evicted, and reserve_bytes keeps room for spool data about to be
+    written. Returns the number of bytes freed.
+    """
+    freed = 0
+    with _quota_lock:
+        conn = _connect()
+        with conn:
+            expired = conn.execute(
+                'SELECT path, size FROM artifacts WHERE expires_at IS NOT NULL AND expires_at < ?', (time.time(),)
+            ).fetchall()
+            for path, size in expired:
+                _remove(conn, path)
+                freed += size
+
+            total = _tracked_bytes(conn) + _spool_bytes + reserve_bytes
+            if total > quota_bytes:
+                for path, size in conn.execute('SELECT path, size FROM artifacts ORDER BY accessed_at').fetchall():
+                    if total <= quota_bytes:
+                        break
+                    _remove(conn, path)
+                    total -= size
+                    freed += size
+        conn.close()
+    return freed
+
+class SpoolReservation:
+    """Quota charge for the spool files of one analysis
+
+    spool_upload calls charge() for every chunk it writes, so decompressed
+    uploads are counted at their real size; the charge is held until
+    release(), once the spool directory is gone.
+    """
+
+    def __init__(self, quota_bytes=STORAGE_QUOTA_BYTES):
+        self.quota_bytes = quota_bytes
+        self.charged = 0
+
+    def charge(self, n_bytes):
+        """Count n_bytes more spool data, evicting artifacts if needed; raises StorageFull"""
+        global _spool_bytes
+        with _quota_lock:
+            if _used_bytes() + n_bytes > self.quota_bytes:
+                enforce_quota(self.quota_bytes, reserve_bytes=n_bytes)
+                if _used_bytes() + n_bytes > self.quota_bytes:
+                    raise StorageFull("server storage is full, please try again in a few minutes")
+            _spool_bytes += n_bytes
+            self.charged += n_bytes
+
+    def release(self):
+        global _spool_bytes
+        with _quota_lock:
+            _spool_bytes -= self.charged
+            self.charged = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def storage_usage():
+    """Total tracked bytes, artifact count and bytes charged by live spools"""
+    conn = _connect()
+    total, count = conn.execute('SELECT COALESCE(SUM(size), 0), COUNT(*) FROM artifacts').fetchone()
+    conn.close()
+    return {'bytes': total, 'artifacts': count, 'spool_bytes': _spool_bytes, 'quota_bytes': STORAGE_QUOTA_BYTES}
+
+def _sync_index():
+    """Drop index rows for missing files and adopt untracked files in UPLOADS_DIR"""
+    conn = _connect()
+    with conn:
+        tracked = {path for (path,) in conn.execute('SELECT path FROM artifacts')}
+        for path in tracked:
+            if not os.path.exists(path):
+                conn.execute('DELETE FROM artifacts WHERE path = ?', (path,))
+    conn.close()
+
+    for entry in os.scandir(UPLOADS_DIR):
+        if entry.is_file() and entry.path not in tracked and not entry.path.startswith(STORAGE_INDEX_PATH) \
+                and not entry.name.endswith('.tmp'):
+            register_artifact(entry.path)
+
+def _purge_stale_spools(max_age=SPOOL_MAX_AGE_SEC):
+    """Remove spool directories left behind by interrupted analyses"""
+    cutoff = time.time() - max_age
+    for entry in os.scandir(SPOOL_DIR):
+        if entry.stat().st_mtime < cutoff:
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+
+def run_cleanup():
+    """One full cleanup pass"""
+    try:
+        _sync_index()
+        _purge_stale_spools()
+        prune_epoch_cache()
+        return enforce_quota()
+    except Exception as e:
+        print(f"Storage cleanup error: {str(e)}")
+        return 0
+
+def _cleanup_loop():
+    while True:
+        run_cleanup()
+        time.sleep(STORAGE_CLEANUP_INTERVAL_SEC)
+
+def start_cleanup_thread():
+    """Start the background cleanup thread once per process"""
+    global _cleanup_started
+    with _cleanup_lock:
+        if _cleanup_started:
+            return
+        threading.Thread(target=_cleanup_loop, name='storage-cleanup', daemon=True).start()
+        _cleanup_started = True
@@ -0,0 +1,94 @@
+import os
+import bz2
+import gzip
+import hashlib
+import zipfile
+from config import UPLOAD_CHUNK_BYTES, MAX_UPLOAD_BYTES
+from utils.progress import report
+
+# Leading bytes of the supported archive formats
+COMPRESSION_MAGIC = {
+    'gzip': b'\x1f\x8b',
+    'bz2':  b'BZh',
+    'zip':  b'PK\x03\x04',
+}
+
+UPLOAD_TYPES = ['edf', 'gz', 'bz2', 'zip']
+# Hypnograms may also be plain stage lists or XML scoring exports
+HYPNOGRAM_TYPES = UPLOAD_TYPES + ['csv', 'tsv', 'txt', 'xml']
+
+def detect_compression(uploaded_file):
+    """Sniff the compression format of an upload from its first bytes (None if raw)"""
+    uploaded_file.seek(0)
+    head = uploaded_file.read(4)
+    uploaded_file.seek(0)
+    for name, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+def _open_stream(uploaded_file, compression):
+    """Readable stream of the upload's decompressed bytes"""
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=uploaded_file, mode='rb')
+    if compression == 'bz2':
+        return bz2.BZ2File(uploaded_file, mode='rb')
+    if compression == 'zip':
+        archive = zipfile.ZipFile(uploaded_file)
+        members = [m for m in archive.infolist() if not m.is_dir()]
+        edf_members = [m for m in members if m.filename.lower().endswith('.edf')]
+        if len(edf_members) != 1 and len(members) != 1:
+            raise ValueError("Zip archive must contain exactly one EDF file")
+        return archive.open((edf_members or members)[0])
+    return uploaded_file
+
+def spool_upload(uploaded_file, dest_path, chunk_bytes=UPLOAD_CHUNK_BYTES, max_bytes=MAX_UPLOAD_BYTES, progress=None,
+                 reservation=None):
+    """Stream an uploaded file to disk in fixed-size chunks
+
+    gzip, bz2 and zip uploads are decompressed on the fly, one chunk at a
+    time. Returns (True, {'path', 'sha256', 'size', 'compression'}) or
+    (False, message). The hash and max_bytes apply to the decompressed data,
+    and the file is only renamed into place once complete. progress(fraction,
+    text) follows the share of the (possibly compressed) upload consumed.
+    With a reservation (utils.storage.SpoolReservation), every decompressed
+    chunk is charged to the storage quota before it is written, and the
+    upload fails once the quota is reached.
+
+    Streamlit has already received the whole upload into memory, so spooling
+    does not bound the upload itself (server.maxUploadSize does). It avoids a
+    second full copy while writing, and it hands the pipeline a file on disk
+    to read in chunks. That memory copy is freed only once the uploader
+    widget drops the file.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = dest_path + '.part'
+
+    try:
+        compression = detect_compression(uploaded_file)
+        stream = _open_stream(uploaded_file, compression)
+        total = getattr(uploaded_file, 'size', None)
+        with open(tmp_path, 'wb') as out:
+            while True:
+                chunk = stream.read(chunk_bytes)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"File exceeds the {max_bytes / 1024 ** 3:.1f} GB upload limit")
+                if reservation is not None:
+                    reservation.charge(len(chunk))
+                digest.update(chunk)
+                out.write(chunk)
+                if total:
+                    report(progress, uploaded_file.tell() / total, f"Saving files… {size / 1024 ** 2:.0f} MB")
+        if stream is not uploaded_file:
+            stream.close()
+        os.replace(tmp_path, dest_path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False, f"Failed to save {getattr(uploaded_file, 'name', 'upload')}: {str(e)}"
+
+    return True, {'path': dest_path, 'sha256': digest.hexdigest(), 'size': size, 'compression': compression}